@@ -0,0 +1,34 @@
+# gunicorn の本番設定（`gunicorn invoice_project.wsgi` で自動的に読み込まれる）
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+# アプリケーション（Django の設定・URL・ビュー）をマスターで1回だけ読み込み、
+# ワーカーは fork で共有する（ワーカーごとの読み込み時間とメモリを削減）
+preload_app = True
+
+
+def when_ready(server):
+    """重いモジュールはマスターで読み込んでおき、fork したワーカーで共有する"""
+    import openpyxl  # noqa: F401
+
+
+def post_fork(server, worker):
+    """マスターで開いたデータベース接続をワーカーで共有しない"""
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    """リクエストを受ける前にテンプレートを準備し、データベース・キャッシュへの疎通を確認"""
+    from invoices.warmup import warm_up
+
+    timings = warm_up()
+    worker.log.info(
+        'warm-up: %s', ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in timings.items())
+    )
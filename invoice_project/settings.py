@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import multiprocessing
 import os
+from decimal import Decimal
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -61,7 +63,7 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
+        'APP_DIRS': DEBUG,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
@@ -72,6 +74,15 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # 本番ではパース済みテンプレートをプロセス内にキャッシュする
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'invoice_project.wsgi.application'
 
 
@@ -82,9 +93,78 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # 書き込みトランザクションは開始時にロックを取得し、競合時は待機する
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # 同時書き込みのテストのため、テストもファイルのデータベースを使う
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# 集計・出力の読み取りに使うレプリカ（REPLICA_DATABASE_PATH を設定すると有効）
+# ローカルでは SQLite のファイルを `python manage.py refresh_replica` で同期して使う
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_DATABASE_PATH = os.environ.get('REPLICA_DATABASE_PATH')
+if REPLICA_DATABASE_PATH:
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DATABASE_PATH,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['invoices.routers.ReplicaRouter']
+
+# レプリカの遅延の許容秒数。同期からこの時間を超えたレプリカは使わず、
+# 請求書を作成したユーザーの読み取りはこの時間だけプライマリに固定する
+REPLICA_LAG_TOLERANCE = int(os.environ.get('REPLICA_LAG_TOLERANCE', '60'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# 複数ワーカー間で無効化を共有するため、既定はファイルキャッシュ（REDIS_URL があれば Redis）
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+        }
+    }
+
+
+# Sessions
+# SESSION_MODE: db（従来どおり）/ cached_db / cache / signed_cookies
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('SESSION_MODE', 'cached_db')]
+
+
+# Authentication
+# ログインユーザーを短時間キャッシュし、リクエストごとのユーザー取得クエリを省く
+
+AUTHENTICATION_BACKENDS = ['invoices.backends.CachedModelBackend']
+
+# ユーザーキャッシュの有効期間（秒）。0 でキャッシュ無効
+# （シグナルを送らない QuerySet.update() による変更はこの時間だけ遅れて反映される）
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -123,6 +203,73 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# 本番では collectstatic 時にファイル名へハッシュを付与し、gzip/brotli 版を事前生成する。
+# ハッシュ付きファイルは WhiteNoise が長期キャッシュ（immutable）で配信する。
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
+# ハッシュなしのファイル（favicon 等）のキャッシュ期間（秒）
+WHITENOISE_MAX_AGE = 0 if DEBUG else 60 * 60 * 24
+
+# 生成した請求書・取引履歴の保存先
+INVOICE_OUTPUT_DIR = BASE_DIR / 'generated_invoices'
+
+# 請求書に記載する消費税率（税額は請求書ごとに1円未満を切り捨て）
+INVOICE_TAX_RATE = Decimal(os.environ.get('INVOICE_TAX_RATE', '0.10'))
+
+# 出力済みファイルのキャッシュ（入力データのハッシュで再利用、上限を超えたら古い順に削除）
+RENDER_CACHE_DIR = BASE_DIR / '.render_cache'
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+
+# 同じ冪等キーの再送信を作成済みの請求書として扱う期間（秒）
+INVOICE_IDEMPOTENCY_WINDOW = int(os.environ.get('INVOICE_IDEMPOTENCY_WINDOW', str(60 * 60 * 24)))
+
+# 重い処理の流入制御（URL 名ごと）
+# concurrency: 全ワーカー合計の同時実行数、queue: 待機できるリクエスト数、wait: 最大待ち時間（秒）、
+# rate: ユーザーごとの (回数, 秒)、retry_after: 混雑時に返す Retry-After（秒）
+# 全エンドポイントの concurrency + queue の合計が ADMISSION_THREAD_SHARE を超える場合は比例して減らす
+ADMISSION_CONTROL = {
+    'export_monthly_history': {'concurrency': 2, 'queue': 4, 'wait': 10, 'rate': (10, 60), 'retry_after': 10},
+    'export_monthly_ledger': {'concurrency': 1, 'queue': 2, 'wait': 10, 'rate': (5, 60), 'retry_after': 30},
+    'generate_invoice': {'concurrency': 4, 'queue': 8, 'wait': 5, 'rate': (30, 60), 'retry_after': 5},
+    'import_companies': {'concurrency': 1, 'queue': 0, 'wait': 0, 'rate': (5, 60), 'retry_after': 30},
+}
+
+# gunicorn の全ワーカー合計のリクエスト処理スレッド数（gunicorn.conf.py と同じ環境変数から求める）
+WEB_THREADS = (
+    int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+    * int(os.environ.get('GUNICORN_THREADS', '2'))
+)
+
+# 重い処理が実行・待機で使ってよいスレッドの割合（残りは通常の画面のために空けておく）
+ADMISSION_THREAD_SHARE = float(os.environ.get('ADMISSION_THREAD_SHARE', '0.5'))
+
+# 同時実行数の制限に使うロックファイルの置き場所（ワーカー間で共有）
+ADMISSION_LOCK_DIR = BASE_DIR / '.admission'
+
+# 取引先会社の完全削除をバックグラウンドのスレッドで実行するか
+# （False の場合はリクエスト内で実行。中断した削除は purge_companies コマンドで再開できる）
+COMPANY_PURGE_IN_BACKGROUND = True
+
+# 作成から何日経過した請求書を保管テーブルへ移すか（archive_invoices コマンド）
+INVOICE_ARCHIVE_AFTER_DAYS = int(os.environ.get('INVOICE_ARCHIVE_AFTER_DAYS', '730'))
+
+# 生成ログ（請求書生成・取引履歴出力の実行記録）をバックグラウンドのスレッドでまとめて書き込むか
+# （False の場合はリクエスト内で1件ずつ書き込む）
+GENERATION_LOG_IN_BACKGROUND = True
+
+# 生成ログの保存日数（prune_generation_log コマンドで古い記録を削除）
+GENERATION_LOG_RETENTION_DAYS = int(os.environ.get('GENERATION_LOG_RETENTION_DAYS', '90'))
+
 # Custom User Model
 AUTH_USER_MODEL = 'invoices.CustomUser'
 
@@ -1,9 +1,43 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import CustomUser, Company, Invoice, InvoiceDetail, InvoiceItemTemplate
+from . import ledger_version
+from .models import CustomUser, Company, GenerationLog, Invoice, InvoiceDetail, InvoiceItemTemplate
+from .paginators import EstimatedCountPaginator
+from .routers import replica_reads
+from .search import match_subquery
 
 # Register your models here.
 
+
+class ReplicaChangeListMixin:
+    """一覧画面の表示（GET）の読み取りをレプリカから行う（一括操作・編集画面は default のまま）"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with replica_reads(request.user):
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class LedgerVersionAdminMixin:
+    """削除を取引履歴出力のキャッシュに反映（一括削除を遅くしないよう post_delete は使わない）"""
+    # 削除するオブジェクトから会社IDへの参照
+    ledger_company_field = 'company_id'
+
+    def delete_model(self, request, obj):
+        company_ids = list(type(obj).objects.filter(pk=obj.pk).values_list(self.ledger_company_field, flat=True))
+        super().delete_model(request, obj)
+        ledger_version.bump_after_commit(company_ids)
+
+    def delete_queryset(self, request, queryset):
+        company_ids = list(queryset.values_list(self.ledger_company_field, flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        ledger_version.bump_after_commit(company_ids)
+
+
 @admin.register(CustomUser)
 class CustomUserAdmin(BaseUserAdmin):
     list_display = ('username', 'email', 'role', 'is_staff', 'created_at')
@@ -21,32 +55,75 @@ class CustomUserAdmin(BaseUserAdmin):
 
 
 @admin.register(Company)
-class CompanyAdmin(admin.ModelAdmin):
-    list_display = ('company_code', 'company_name', 'contact_person', 'phone', 'email', 'created_at')
-    list_filter = ('created_at',)
+class CompanyAdmin(LedgerVersionAdminMixin, admin.ModelAdmin):
+    ledger_company_field = 'pk'
+
+    list_display = ('company_code', 'company_name', 'contact_person', 'phone', 'email', 'is_active', 'created_at')
+    list_filter = ('is_active', 'created_at')
     search_fields = ('company_code', 'company_name', 'contact_person', 'email')
     ordering = ('company_code',)
 
 
 @admin.register(InvoiceItemTemplate)
 class InvoiceItemTemplateAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'created_at')
+    list_display = ('name', 'description', 'default_unit_price', 'created_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(LedgerVersionAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ('invoice_number', 'company', 'customer_id', 'created_at', 'created_by')
-    list_filter = ('created_at', 'company')
-    search_fields = ('invoice_number', 'company__company_name', 'customer_id')
+    # 一覧の関連オブジェクトは JOIN で一括取得（N+1 クエリを防ぐ）
+    list_select_related = ('company', 'created_by')
+    # 取引先会社は件数が多いため絞り込みは日付階層（created_at のインデックス）で行う
+    date_hierarchy = 'created_at'
+    # 前方一致・完全一致のみ（'%...%' の全件走査を避ける）
+    search_fields = ('=invoice_number', '^company__company_code', '^company__company_name', '=customer_id')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+    raw_id_fields = ('company', 'created_by')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """全文検索索引が使える場合は請求内容も含めて索引で検索"""
+        subquery = match_subquery(search_term)
+        if subquery is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=subquery), False
 
 
 @admin.register(InvoiceDetail)
-class InvoiceDetailAdmin(admin.ModelAdmin):
+class InvoiceDetailAdmin(LedgerVersionAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    ledger_company_field = 'invoice__company_id'
+
     list_display = ('invoice', 'item_name', 'quantity', 'unit_price', 'amount', 'order')
-    list_filter = ('invoice__created_at',)
-    search_fields = ('invoice__invoice_number', 'item_name')
-    ordering = ('invoice', 'order')
+    # invoice の __str__ は作成時点の請求先（billed_company_name）を使うため、請求書だけ JOIN する
+    list_select_related = ('invoice',)
+    date_hierarchy = 'invoice__created_at'
+    search_fields = ('=invoice__invoice_number', '^item_name')
+    ordering = ('-invoice_id', 'order')
+    raw_id_fields = ('invoice',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+
+@admin.register(GenerationLog)
+class GenerationLogAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    """生成ログは追記のみのため閲覧専用"""
+    list_display = ('started_at', 'endpoint', 'outcome', 'duration_ms', 'rows', 'bytes', 'user_id')
+    list_filter = ('endpoint', 'outcome')
+    date_hierarchy = 'started_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,206 @@
+import logging
+import math
+import os
+import time
+from functools import cache as memoize, wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, JsonResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows では同時実行数の制限を行わない（警告をログに出す）
+    fcntl = None
+
+logger = logging.getLogger('invoices.admission')
+
+# 判定結果（ワーカー間で共有するため件数は Django のキャッシュに記録）
+DECISIONS = ('admitted', 'queued', 'rate_limited', 'queue_full', 'timeout')
+STATS_KEY = 'invoices:admission:{}:{}'
+RATE_KEY = 'invoices:admission:rate:{}:{}:{}'
+
+# 待機中に実行枠の空きを確認する間隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class Slot:
+    """ファイルロックによる実行枠（プロセスが落ちてもロックは OS が解放する）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def _acquire(endpoint, kind, count):
+    """count 個の枠のうち空いているものを1つ取得（なければ None）"""
+    directory = Path(settings.ADMISSION_LOCK_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        slot = Slot(directory / f'{endpoint}.{kind}.{index}.lock')
+        if slot.try_acquire():
+            return slot
+    return None
+
+
+@memoize
+def _warn_without_locks():
+    """ファイルロックが使えない環境で同時実行数の制限を行わないことを1回だけ警告"""
+    logger.warning('fcntl が使えないため、同時実行数・待ち行列の制限を行いません（回数制限のみ適用）')
+
+
+def thread_budget():
+    """重い処理が実行・待機で使ってよいスレッド数（全ワーカー合計）"""
+    return max(1, int(settings.WEB_THREADS * settings.ADMISSION_THREAD_SHARE))
+
+
+def effective_limits(config):
+    """設定の同時実行数・待ち行列をスレッド数に収まるよう比例して減らす
+
+    待機中のリクエストもスレッドを占有するため、全エンドポイントの
+    concurrency + queue の合計が thread_budget() を超えないようにする。
+    """
+    demand = sum(
+        other.get('concurrency', 0) + other.get('queue', 0)
+        for other in settings.ADMISSION_CONTROL.values() if other.get('concurrency')
+    )
+    scale = min(1.0, thread_budget() / demand)
+    return max(1, int(config['concurrency'] * scale)), int(config.get('queue', 0) * scale)
+
+
+def record(endpoint, decision, request, wait=0.0):
+    """判定結果を件数とログに記録"""
+    key = STATS_KEY.format(endpoint, decision)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+    logger.info(
+        'admission endpoint=%s decision=%s user=%s wait_ms=%.0f',
+        endpoint, decision, getattr(request.user, 'pk', None), wait * 1000,
+    )
+
+
+def stats():
+    """エンドポイントごとの判定件数"""
+    return {
+        endpoint: {decision: cache.get(STATS_KEY.format(endpoint, decision), 0) for decision in DECISIONS}
+        for endpoint in settings.ADMISSION_CONTROL
+    }
+
+
+def check_rate(endpoint, user_id, limit, period):
+    """ユーザーごとの回数制限（固定ウィンドウ）。超過時は再試行までの秒数を返す"""
+    now = time.time()
+    window = int(now // period)
+    key = RATE_KEY.format(endpoint, user_id, window)
+    cache.add(key, 0, timeout=period)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        return None
+    if count > limit:
+        return max(1, math.ceil((window + 1) * period - now))
+    return None
+
+
+def reject(request, status, message, retry_after):
+    """制限超過のレスポンス（画面からの送信はテキスト、AJAX は JSON）"""
+    if 'text/html' in request.headers.get('Accept', ''):
+        response = HttpResponse(message, status=status, content_type='text/plain; charset=utf-8')
+    else:
+        response = JsonResponse({'success': False, 'error': message}, status=status)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _release_after_stream(content, slot):
+    """ストリーミングが終わるまで実行枠を保持"""
+    try:
+        yield from content
+    finally:
+        slot.release()
+
+
+def admission_control(endpoint):
+    """重い処理のビューに同時実行数・回数制限・待ち行列を適用するデコレーター
+
+    設定（ADMISSION_CONTROL）はエンドポイント名ごとに
+    concurrency（全ワーカー合計の同時実行数）、queue（待機できるリクエスト数）、
+    wait（最大待ち時間・秒）、rate（(回数, 秒) のユーザーごとの上限）を指定する。
+    回数超過は 429、待ち行列が満杯・待ち時間切れは 503 を Retry-After 付きで返す。
+    待機中もスレッドを占有するため、実行枠と待ち行列は effective_limits() で
+    gunicorn のスレッド数に収める。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            config = settings.ADMISSION_CONTROL.get(endpoint)
+            if not config:
+                return view(request, *args, **kwargs)
+
+            rate = config.get('rate')
+            if rate and request.user.is_authenticated:
+                retry_after = check_rate(endpoint, request.user.pk, *rate)
+                if retry_after is not None:
+                    record(endpoint, 'rate_limited', request)
+                    return reject(request, 429, '短時間に実行できる回数を超えました。しばらくしてから再度お試しください。', retry_after)
+
+            if not config.get('concurrency'):
+                return view(request, *args, **kwargs)
+            if fcntl is None:
+                _warn_without_locks()
+                return view(request, *args, **kwargs)
+
+            concurrency, queue = effective_limits(config)
+            started = time.monotonic()
+            slot = _acquire(endpoint, 'run', concurrency)
+            decision = 'admitted'
+            if slot is None:
+                queue_slot = _acquire(endpoint, 'queue', queue)
+                if queue_slot is None:
+                    record(endpoint, 'queue_full', request)
+                    return reject(request, 503, '混み合っています。しばらくしてから再度お試しください。', config.get('retry_after', 5))
+                try:
+                    deadline = started + config.get('wait', 0)
+                    while slot is None and time.monotonic() < deadline:
+                        time.sleep(POLL_INTERVAL)
+                        slot = _acquire(endpoint, 'run', concurrency)
+                finally:
+                    queue_slot.release()
+                if slot is None:
+                    record(endpoint, 'timeout', request, time.monotonic() - started)
+                    return reject(request, 503, '混み合っています。しばらくしてから再度お試しください。', config.get('retry_after', 5))
+                decision = 'queued'
+
+            record(endpoint, decision, request, time.monotonic() - started)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                slot.release()
+                raise
+            if response.streaming and not isinstance(response, FileResponse):
+                response.streaming_content = _release_after_stream(response.streaming_content, slot)
+            else:
+                slot.release()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+import base64
+import heapq
+from datetime import datetime, time, timedelta
+from operator import itemgetter
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedInvoice, ArchivedInvoiceDetail, Company, Invoice, InvoiceDetail
+
+# 1ページの件数（limit パラメータの既定値と上限）
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# 請求書の出力項目 → 取得する列（請求先は請求書に保存した作成時点の会社情報）
+INVOICE_FIELDS = {
+    'id': 'id',
+    'invoice_number': 'invoice_number',
+    'company_code': 'billed_company_code',
+    'company_name': 'billed_company_name',
+    'contact_person': 'billed_contact_person',
+    'address': 'billed_address',
+    'postal_code': 'billed_postal_code',
+    'prefecture': 'billed_prefecture',
+    'phone': 'billed_phone',
+    'email': 'billed_email',
+    'customer_id': 'customer_id',
+    'created_at': 'created_at',
+}
+# 明細から求める請求書の出力項目
+INVOICE_DETAIL_FIELDS = ('details', 'total')
+DETAIL_FIELDS = ('item_name', 'quantity', 'unit_price', 'amount', 'order')
+
+COMPANY_FIELDS = (
+    'id', 'company_code', 'company_name', 'contact_person', 'address', 'postal_code',
+    'prefecture', 'phone', 'email', 'is_active', 'created_at', 'updated_at',
+)
+
+
+def encode_cursor(created_at, pk):
+    """(作成日時, ID) から次ページのカーソルを生成"""
+    value = f'{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """カーソルを (作成日時, ID) に戻す"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = value.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('カーソルが不正です')
+
+
+def parse_limit(value):
+    """1ページの件数（1〜MAX_PAGE_SIZE）"""
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit は整数で指定してください')
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def parse_fields(value, allowed):
+    """fields パラメータ（カンマ区切り）から出力項目を決定（未指定はすべて）"""
+    if not value:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f'不明な項目です: {", ".join(unknown)}')
+    return fields
+
+
+def parse_date(value, end=False):
+    """YYYY-MM-DD を現地時刻の日時に変換（end は翌日0時、期間の終わりは含まない）"""
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('日付は YYYY-MM-DD で指定してください')
+    moment = timezone.make_aware(datetime.combine(day, time.min))
+    if end:
+        moment += timedelta(days=1)
+    return moment
+
+
+def keyset_filter(params):
+    """絞り込み（会社・期間）とカーソル以降の条件
+
+    並び順は (作成日時, ID) の昇順で、カーソルより後ろだけをインデックスで
+    読み出すため、何ページ目でも1回の取得量はページ分で済む。
+    """
+    condition = Q()
+    if params.get('date_from'):
+        condition &= Q(created_at__gte=parse_date(params['date_from']))
+    if params.get('date_to'):
+        condition &= Q(created_at__lt=parse_date(params['date_to'], end=True))
+    if params.get('cursor'):
+        created_at, pk = decode_cursor(params['cursor'])
+        condition &= Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    return condition
+
+
+def _page(rows, limit, cursor):
+    """limit + 1 件の取得結果からページと次ページの情報を作成
+
+    最後まで読んだ場合も最後の行のカーソルを返すので、定期的な同期は
+    前回の next_cursor から続けて新しい分だけを取得できる。
+    """
+    rows = list(rows)
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, {'has_next': has_next, 'next_cursor': cursor or None}
+
+
+def invoice_page(params, company=None):
+    """請求書（保管済みも含む）を1ページ分取得し、(出力行のリスト, ページ情報) を返す
+
+    作業用・保管用の両方から同じ条件で limit + 1 件ずつ取得して
+    (作成日時, ID) の順にまとめる。明細は fields に details か total が
+    ある場合だけ、ページ内の請求書の分をまとめて取得する。
+    """
+    limit = parse_limit(params.get('limit'))
+    fields = parse_fields(params.get('fields'), [*INVOICE_FIELDS, *INVOICE_DETAIL_FIELDS])
+    condition = keyset_filter(params)
+    if company is not None:
+        condition &= Q(company=company)
+
+    columns = {'id', 'created_at'} | {INVOICE_FIELDS[field] for field in fields if field in INVOICE_FIELDS}
+    sources = []
+    for model in (Invoice, ArchivedInvoice):
+        rows = model.objects.filter(condition).order_by('created_at', 'id').values(*columns)[:limit + 1]
+        sources.append([{**row, 'archived': model is ArchivedInvoice} for row in rows])
+    rows, page = _page(
+        heapq.merge(*sources, key=itemgetter('created_at', 'id')), limit, params.get('cursor')
+    )
+
+    details = {}
+    if any(field in INVOICE_DETAIL_FIELDS for field in fields):
+        for detail_model, archived in ((InvoiceDetail, False), (ArchivedInvoiceDetail, True)):
+            ids = [row['id'] for row in rows if row['archived'] is archived]
+            if not ids:
+                continue
+            queryset = detail_model.objects.filter(invoice_id__in=ids).order_by('invoice_id', 'order', 'id')
+            for detail in queryset.values('invoice_id', *DETAIL_FIELDS):
+                details.setdefault(detail.pop('invoice_id'), []).append(detail)
+
+    results = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == 'details':
+                item['details'] = details.get(row['id'], [])
+            elif field == 'total':
+                item['total'] = sum(detail['amount'] for detail in details.get(row['id'], []))
+            else:
+                item[field] = row[INVOICE_FIELDS[field]]
+        results.append(item)
+    return results, page
+
+
+def company_page(params):
+    """取引先会社（無効化した会社も含む）を1ページ分取得し、(出力行のリスト, ページ情報) を返す"""
+    limit = parse_limit(params.get('limit'))
+    fields = parse_fields(params.get('fields'), COMPANY_FIELDS)
+    condition = keyset_filter(params)
+    if params.get('company'):
+        condition &= Q(company_code=params['company'].upper())
+
+    columns = {'id', 'created_at', *fields}
+    rows, page = _page(
+        Company.objects.filter(condition).order_by('created_at', 'id').values(*columns)[:limit + 1],
+        limit, params.get('cursor'),
+    )
+    return [{field: row[field] for field in fields} for row in rows], page
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class InvoicesConfig(AppConfig):
     name = 'invoices'
+
+    def ready(self):
+        from . import signals  # noqa: F401
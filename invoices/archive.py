@@ -0,0 +1,110 @@
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger_version
+from .exports import EXPORT_CHUNK_SIZE, ledger_details
+from .models import BILLING_FIELDS, ArchivedInvoice, ArchivedInvoiceDetail, Invoice, InvoiceDetail
+from .paginators import analyze_tables
+
+# 1トランザクションで移す請求書の件数
+ARCHIVE_BATCH_SIZE = 500
+
+# 保管テーブルへ写す列
+INVOICE_FIELDS = [
+    'id', 'invoice_number', 'company_id', 'customer_id', 'created_at', 'created_by_id', *BILLING_FIELDS,
+]
+DETAIL_FIELDS = ['id', 'invoice_id', 'item_name', 'quantity', 'unit_price', 'amount', 'order']
+
+
+@dataclass
+class ArchiveResult:
+    """保管結果"""
+    invoices: int = 0
+    details: int = 0
+    elapsed: float = 0.0
+
+
+def default_cutoff():
+    """設定（INVOICE_ARCHIVE_AFTER_DAYS）から保管対象の基準日時を求める"""
+    return timezone.now() - timedelta(days=settings.INVOICE_ARCHIVE_AFTER_DAYS)
+
+
+def archive_invoices(cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """基準日時より前に作成された請求書を明細ごと保管テーブルへ移す
+
+    バッチごとに「保管テーブルへ登録 → 作業用テーブルから削除」を1つの
+    トランザクションで行うため、途中で中断しても請求書が二重になったり
+    失われたりしない。
+    """
+    result = ArchiveResult()
+    started = time.perf_counter()
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Invoice.objects.filter(created_at__lt=cutoff)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            invoices = [
+                ArchivedInvoice(**values)
+                for values in Invoice.objects.filter(id__in=ids).values(*INVOICE_FIELDS)
+            ]
+            details = [
+                ArchivedInvoiceDetail(**values)
+                for values in InvoiceDetail.objects.filter(invoice_id__in=ids).values(*DETAIL_FIELDS)
+            ]
+            ArchivedInvoice.objects.bulk_create(invoices)
+            ArchivedInvoiceDetail.objects.bulk_create(details)
+            InvoiceDetail.objects.filter(invoice_id__in=ids).delete()
+            Invoice.objects.filter(id__in=ids).delete()
+            # 取引履歴出力のキャッシュはバッチの会社ごとに1回だけ無効にする
+            ledger_version.bump_after_commit(invoice.company_id for invoice in invoices)
+
+        result.invoices += len(invoices)
+        result.details += len(details)
+        if progress:
+            progress(result)
+    if result.invoices:
+        # 管理画面の一覧の推定件数を実際の件数に合わせる
+        analyze_tables(Invoice, InvoiceDetail)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def find_invoice(invoice_id):
+    """請求書IDから請求書を取得（作業用テーブルになければ保管テーブルから）"""
+    for model in (Invoice, ArchivedInvoice):
+        invoice = model.objects.filter(pk=invoice_id).first()
+        if invoice is not None:
+            return invoice
+    return None
+
+
+def table_stats():
+    """作業用テーブルの件数と代表的なクエリの所要時間（保管前後の比較用）"""
+    now = timezone.now()
+    timings = {}
+
+    started = time.perf_counter()
+    invoices = Invoice.objects.count()
+    details = InvoiceDetail.objects.count()
+    timings['count_ms'] = (time.perf_counter() - started) * 1000
+
+    # 直近1か月分の全社取引履歴（月次出力と同じクエリ）
+    started = time.perf_counter()
+    for _ in ledger_details(now - timedelta(days=31), now).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        pass
+    timings['recent_ledger_ms'] = (time.perf_counter() - started) * 1000
+
+    return {
+        'invoices': invoices,
+        'details': details,
+        'archived_invoices': ArchivedInvoice.objects.count(),
+        **{key: round(value, 1) for key, value in timings.items()},
+    }
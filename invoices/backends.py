@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# ユーザーキャッシュのキー
+USER_CACHE_KEY = 'invoices:user:{}'
+
+# キャッシュするユーザーの項目（パスワードのハッシュなどユーザー行そのものは保存しない）
+USER_CACHE_FIELDS = ('role', 'is_active')
+
+
+def user_cache_key(user_id):
+    """ユーザーIDからキャッシュキーを生成"""
+    return USER_CACHE_KEY.format(user_id)
+
+
+def invalidate_user_cache(user_id):
+    """ユーザーキャッシュを削除"""
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ログインユーザーの権限の判定に使う項目をキャッシュから取得する認証バックエンド
+
+    AuthenticationMiddleware はリクエストごとに get_user() を呼ぶため、
+    ユーザー種別・有効フラグとセッション検証用のハッシュをキャッシュしておけば
+    is_admin()/is_director() の判定でデータベースを読まずに済む。
+    それ以外の項目は参照した時点でデータベースから読み込む。
+    保存・削除時はシグナルで無効化し、シグナルを送らない更新（QuerySet.update()）は
+    短い有効期間（USER_CACHE_TIMEOUT）で反映する。
+    """
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 0)
+        if not timeout:
+            return super().get_user(user_id)
+
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, {
+                    **{field: getattr(user, field) for field in USER_CACHE_FIELDS},
+                    'session_auth_hash': user.get_session_auth_hash(),
+                }, timeout)
+            return user
+
+        model = get_user_model()
+        # from_db はモデルの項目順に値を受け取る（キャッシュにない項目は参照時に読み込む）
+        values = {model._meta.pk.attname: user_id, **{field: cached[field] for field in USER_CACHE_FIELDS}}
+        field_names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+        user = model.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+        user._cached_session_auth_hash = cached['session_auth_hash']
+        return user if self.user_can_authenticate(user) else None
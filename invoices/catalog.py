@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.core.cache import cache
+
+from .models import InvoiceItemTemplate
+
+# 請求書項目の変更回数（ワーカー間で共有するため Django のキャッシュに記録）
+VERSION_KEY = 'invoices:item_catalog:version'
+
+# バージョンごとの JSON 文書（内容が変わると別のキーになる）
+DOCUMENT_KEY = 'invoices:item_catalog:document:{}'
+DOCUMENT_TIMEOUT = 60 * 60 * 24
+
+# JSON 文書の各項目の並び（キーを繰り返さない配列形式）
+CATALOG_FIELDS = ['id', 'name', 'description', 'default_unit_price']
+
+
+def get_version():
+    """現在のカタログのバージョン
+
+    キャッシュが消えた場合は現在時刻（ミリ秒）から数え直すため、
+    以前に配布したバージョンと重なることはない。
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """請求書項目の変更時にバージョンを上げる（古い文書・ETag は使われなくなる）"""
+    get_version()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass
+
+
+def etag():
+    """カタログの ETag（バージョンから求めるためデータベースを読まない）"""
+    return f'items-{get_version()}'
+
+
+def build_document(version):
+    """全請求書項目を1つの JSON 文書にする"""
+    items = [
+        [pk, name, description or '', str(price)]
+        for pk, name, description, price in InvoiceItemTemplate.objects.order_by('name', 'id').values_list(*CATALOG_FIELDS)
+    ]
+    document = {'version': version, 'fields': CATALOG_FIELDS, 'items': items}
+    return json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def get_document():
+    """現在のバージョンの JSON 文書（キャッシュになければ作成して保存）"""
+    version = get_version()
+    key = DOCUMENT_KEY.format(version)
+    document = cache.get(key)
+    if document is None:
+        document = build_document(version)
+        cache.set(key, document, DOCUMENT_TIMEOUT)
+    return document
@@ -0,0 +1,210 @@
+import codecs
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .models import Company
+from .utils import format_company_code, next_company_code_number, normalize_phone, normalize_postal_code
+
+# 一括登録のバッチサイズ
+IMPORT_BATCH_SIZE = 500
+
+# CSV の文字コードの判定に読む先頭のバイト数
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# 取込対象の列（モデルのフィールド名）
+IMPORT_FIELDS = [
+    'company_code', 'company_name', 'contact_person', 'address',
+    'postal_code', 'prefecture', 'phone', 'email',
+]
+
+# 必須の列
+REQUIRED_FIELDS = ['company_name', 'contact_person', 'address', 'postal_code', 'prefecture', 'phone', 'email']
+
+# ヘッダー名（日本語の項目名も受け付ける）→ フィールド名
+HEADER_ALIASES = {name: name for name in IMPORT_FIELDS}
+HEADER_ALIASES.update({
+    str(Company._meta.get_field(name).verbose_name): name for name in IMPORT_FIELDS
+})
+
+# 既存会社の更新対象（会社コードで照合）
+UPSERT_FIELDS = [name for name in IMPORT_FIELDS if name != 'company_code'] + ['updated_at']
+
+CODE_VALIDATOR = Company._meta.get_field('company_code').validators[0]
+
+
+@dataclass
+class ImportResult:
+    """取込結果"""
+    total: int = 0
+    imported: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'errors': [{'row': row, 'error': error} for row, error in self.errors],
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+def detect_encoding(stream):
+    """CSVの文字コードを判定（先頭が UTF-8 として読めなければ Excel の既定の cp932）"""
+    position = stream.tell()
+    sample = stream.read(ENCODING_SAMPLE_SIZE)
+    stream.seek(position)
+    try:
+        # 末尾で途切れた文字は誤りとしない
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'cp932'
+    return 'utf-8-sig'
+
+
+def iter_csv_rows(stream, encoding=None):
+    """CSVを1行ずつ読み込む（ヘッダー行を含む。encoding を省略すると UTF-8/cp932 を判定）"""
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+    text = io.TextIOWrapper(stream, encoding=encoding or detect_encoding(stream), newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(stream):
+    """XLSXの先頭シートを1行ずつ読み込む（read_only モード）"""
+    import openpyxl
+
+    book = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for values in book.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in values]
+    finally:
+        book.close()
+
+
+def iter_rows(stream, filename, encoding=None):
+    """ファイル名の拡張子から形式を判定して行を返す（encoding は CSV の文字コード）"""
+    if str(filename).lower().endswith('.xlsx'):
+        return iter_xlsx_rows(stream)
+    return iter_csv_rows(stream, encoding)
+
+
+def parse_header(header):
+    """ヘッダー行を列番号→フィールド名の対応に変換"""
+    columns = {}
+    for index, name in enumerate(header):
+        key = HEADER_ALIASES.get(str(name).strip())
+        if key:
+            columns[index] = key
+    missing = [name for name in REQUIRED_FIELDS if name not in columns.values()]
+    if missing:
+        raise ValueError(f"必須の列がありません: {', '.join(missing)}")
+    return columns
+
+
+def clean_row(columns, values):
+    """1行分の値を検証・正規化して辞書で返す（不正な場合は ValueError）"""
+    data = {name: '' for name in IMPORT_FIELDS}
+    for index, name in columns.items():
+        if index < len(values):
+            data[name] = str(values[index]).strip()
+
+    data['company_code'] = data['company_code'].upper()
+    data['postal_code'] = normalize_postal_code(data['postal_code'])
+    data['phone'] = normalize_phone(data['phone'])
+
+    missing = [name for name in REQUIRED_FIELDS if not data[name]]
+    if missing:
+        raise ValueError(f"未入力の項目があります: {', '.join(missing)}")
+    if data['company_code']:
+        try:
+            CODE_VALIDATOR(data['company_code'])
+        except ValidationError:
+            raise ValueError(f"会社コードは英数字のみです: {data['company_code']}")
+    try:
+        validate_email(data['email'])
+    except ValidationError:
+        raise ValueError(f"メールアドレスが不正です: {data['email']}")
+
+    for name in IMPORT_FIELDS:
+        max_length = Company._meta.get_field(name).max_length
+        if len(data[name]) > max_length:
+            raise ValueError(f"{Company._meta.get_field(name).verbose_name}は{max_length}文字以内で入力してください")
+    return data
+
+
+def _flush(batch):
+    """バッチを一括登録（会社コードが既存なら更新）"""
+    Company.objects.bulk_create(
+        batch,
+        batch_size=IMPORT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['company_code'],
+        update_fields=UPSERT_FIELDS,
+    )
+
+
+def import_companies(rows, batch_size=IMPORT_BATCH_SIZE):
+    """取引先会社を一括登録・更新
+
+    rows はヘッダー行から始まる値のリストのイテラブル。会社コードが空の行には
+    既存の最大値から連番を割り当て、会社コードがある行は既存会社を更新する。
+    不正な行はスキップしてエラー一覧に行番号付きで記録する。
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    rows = iter(rows)
+    columns = parse_header(next(rows, []))
+
+    seen_codes = set()
+    batch = []
+    with transaction.atomic():
+        # 採番はトランザクション内で1回だけ行い、以降はメモリ上で連番を進める
+        next_number = next_company_code_number()
+        for row_number, values in enumerate(rows, start=2):
+            if not any(str(value).strip() for value in values):
+                continue
+            result.total += 1
+            try:
+                data = clean_row(columns, values)
+            except ValueError as e:
+                result.errors.append((row_number, str(e)))
+                continue
+
+            if not data['company_code']:
+                data['company_code'] = format_company_code(next_number)
+                next_number += 1
+            elif data['company_code'].isdigit() and len(data['company_code']) >= 4:
+                next_number = max(next_number, int(data['company_code']) + 1)
+
+            if data['company_code'] in seen_codes:
+                result.errors.append((row_number, f"会社コードが重複しています: {data['company_code']}"))
+                continue
+            seen_codes.add(data['company_code'])
+
+            batch.append(Company(**data))
+            if len(batch) >= batch_size:
+                _flush(batch)
+                result.imported += len(batch)
+                batch = []
+
+        if batch:
+            _flush(batch)
+            result.imported += len(batch)
+
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,109 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import ledger_version
+from .models import ArchivedInvoice, ArchivedInvoiceDetail, Company, Invoice, InvoiceDetail
+from .paginators import analyze_tables
+
+logger = logging.getLogger('invoices.company_purge')
+
+# 1トランザクションで削除する請求書の件数（SQLite のロック時間を短く保つ）
+PURGE_BATCH_SIZE = 500
+
+# 進捗の記録先（ワーカー間で共有するため Django のキャッシュに記録）
+PROGRESS_KEY = 'invoices:company_purge:{}'
+PROGRESS_TIMEOUT = 60 * 60 * 24
+
+
+def deactivate(company):
+    """取引先会社を無効化（関連データに触れないため件数によらず即時に終わる）"""
+    now = timezone.now()
+    Company.objects.filter(pk=company.pk).update(is_active=False, deactivated_at=now, updated_at=now)
+
+
+def restore(company):
+    """無効化した取引先会社を有効に戻す"""
+    Company.objects.filter(pk=company.pk).update(
+        is_active=True, deactivated_at=None, purge_requested_at=None, updated_at=timezone.now(),
+    )
+
+
+def get_progress(company_id):
+    """完全削除の進捗（status: queued / running / done / error）"""
+    return cache.get(PROGRESS_KEY.format(company_id))
+
+
+def _set_progress(company_id, **values):
+    cache.set(PROGRESS_KEY.format(company_id), values, PROGRESS_TIMEOUT)
+
+
+def request_purge(company):
+    """完全削除を依頼し、設定に応じてバックグラウンドで実行
+
+    依頼済み（実行待ち・実行中）の会社は何もせずに False を返す。同時に依頼されても
+    条件付きの UPDATE で1つのリクエストだけが削除を開始する。
+    """
+    requested = Company.objects.filter(pk=company.pk, purge_requested_at__isnull=True).update(
+        purge_requested_at=timezone.now(),
+    )
+    if not requested:
+        return False
+    _set_progress(company.pk, status='queued', deleted=0, total=None)
+    if settings.COMPANY_PURGE_IN_BACKGROUND:
+        threading.Thread(target=_purge_in_thread, args=(company.pk,), daemon=True).start()
+    else:
+        purge_company(company.pk)
+    return True
+
+
+def _purge_in_thread(company_id):
+    try:
+        purge_company(company_id)
+    except Exception:
+        logger.exception('取引先会社 %s の完全削除に失敗しました', company_id)
+        progress = get_progress(company_id) or {}
+        _set_progress(company_id, **{**progress, 'status': 'error'})
+    finally:
+        connection.close()
+
+
+def purge_company(company_id, batch_size=PURGE_BATCH_SIZE, on_progress=None):
+    """取引先会社を請求書・明細（保管済みも含む）ごとバッチで削除し、削除した請求書数を返す
+
+    Company.delete() は CASCADE の対象をすべて読み込んでから1トランザクションで
+    削除するため、請求書の多い会社では長時間データベースをロックする。
+    ここでは請求書を batch_size 件ずつ、明細 → 請求書の順に削除する。
+    途中で中断しても、再実行すれば残りから続けられる。
+    """
+    total = (
+        Invoice.objects.filter(company_id=company_id).count()
+        + ArchivedInvoice.objects.filter(company_id=company_id).count()
+    )
+    deleted = 0
+    _set_progress(company_id, status='running', deleted=deleted, total=total)
+
+    for model, detail_model in ((Invoice, InvoiceDetail), (ArchivedInvoice, ArchivedInvoiceDetail)):
+        while True:
+            with transaction.atomic():
+                ids = list(model.objects.filter(company_id=company_id).values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                detail_model.objects.filter(invoice_id__in=ids).delete()
+                model.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            _set_progress(company_id, status='running', deleted=deleted, total=total)
+            if on_progress:
+                on_progress(deleted, total)
+
+    Company.objects.filter(pk=company_id).delete()
+    ledger_version.bump_version(company_id)
+    if deleted:
+        # 管理画面の一覧の推定件数を実際の件数に合わせる
+        analyze_tables(Invoice, InvoiceDetail)
+    _set_progress(company_id, status='done', deleted=deleted, total=total)
+    return deleted
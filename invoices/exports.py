@@ -0,0 +1,270 @@
+import csv
+import heapq
+import io
+import json
+import re
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from itertools import chain, groupby
+from operator import itemgetter
+
+from django.utils import timezone
+
+from .models import ArchivedInvoiceDetail, InvoiceDetail
+
+# 取引履歴シートの列
+HISTORY_HEADERS = ['請求書番号', '作成日時', '請求内容', '個数', '単価', '金額']
+
+# JSON Lines 出力のキー（取引履歴シートの列と同じ順序）
+HISTORY_KEYS = ['invoice_number', 'created_at', 'item_name', 'quantity', 'unit_price', 'amount']
+
+# 出力形式（拡張子）ごとの Content-Type
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Accept ヘッダーから出力形式を判定するための対応表
+ACCEPT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+}
+
+# 取引履歴出力で指定できる期間（月数）の上限
+MAX_PERIOD_MONTHS = 60
+
+# テキスト形式で1回に書き出す行数
+TEXT_FLUSH_ROWS = 1000
+
+# 全社出力のサマリーシートの列
+SUMMARY_HEADERS = ['会社コード', '会社名', '請求書数', '明細数', '合計金額']
+
+# 1回のフェッチで読み込む明細の件数（メモリ使用量の上限を決める）
+EXPORT_CHUNK_SIZE = 2000
+
+# Excel のシート名に使えない文字
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+# 明細1行分の取得列（請求先は請求書に保存した作成時点の会社情報）
+LEDGER_FIELDS = (
+    'invoice__billed_company_code',
+    'invoice__billed_company_name',
+    'invoice_id',
+    'invoice__invoice_number',
+    'invoice__created_at',
+    'item_name',
+    'quantity',
+    'unit_price',
+    'amount',
+)
+
+
+def month_range(year, month):
+    """指定月の開始・終了日時（現在のタイムゾーン、終了は含まない）"""
+    tz = timezone.get_current_timezone()
+    start = datetime(year, month, 1, tzinfo=tz)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=tz)
+    return start, end
+
+
+def period_range(year, month, months=1):
+    """指定月から months か月分の開始・終了日時（現在のタイムゾーン、終了は含まない）"""
+    start, _ = month_range(year, month)
+    end_year, end_month = divmod(year * 12 + month - 1 + months, 12)
+    return start, datetime(end_year, end_month + 1, 1, tzinfo=start.tzinfo)
+
+
+def period_label(year, month, months=1):
+    """出力ファイル名・シート名に使う期間の表記（何年何月分、複数月は何年何月〜何年何月分）"""
+    if months == 1:
+        return f'{year}年{month}月分'
+    end_year, end_month = divmod(year * 12 + month - 2 + months, 12)
+    return f'{year}年{month}月〜{end_year}年{end_month + 1}月分'
+
+
+def format_created_at(value):
+    """作成日時を出力用の文字列に変換（現地時刻）"""
+    return _format_local(value, timezone.get_current_timezone())
+
+
+@lru_cache(maxsize=1024)
+def _format_local(value, tz):
+    """同じ請求書の明細は作成日時が同じなので変換結果を再利用する"""
+    return value.astimezone(tz).strftime('%Y-%m-%d %H:%M')
+
+
+def safe_filename(name):
+    """ファイル名に使えない文字を置換"""
+    return name.replace('/', '_').replace('\\', '_')
+
+
+def sheet_title(*parts):
+    """シート名を生成（使用不可の文字を除き31文字以内）"""
+    return INVALID_SHEET_CHARS.sub('_', ' '.join(parts))[:31]
+
+
+def ledger_details(start, end, company=None, model=InvoiceDetail):
+    """期間内の明細を会社・作成日時・請求書・順序の順に取得するクエリ
+
+    model に ArchivedInvoiceDetail を渡すと保管済みの明細を取得する。
+    """
+    details = model.objects.filter(
+        invoice__created_at__gte=start,
+        invoice__created_at__lt=end,
+    )
+    if company is not None:
+        details = details.filter(invoice__company=company)
+    return details.order_by(
+        'invoice__billed_company_code', 'invoice__created_at', 'invoice_id', 'order'
+    ).values_list(*LEDGER_FIELDS)
+
+
+def has_ledger(start, end, company=None):
+    """期間内に明細があるか（保管済みの明細も含む）"""
+    return (
+        ledger_details(start, end, company).exists()
+        or ledger_details(start, end, company, model=ArchivedInvoiceDetail).exists()
+    )
+
+
+def iter_ledger(start, end, company=None):
+    """期間内の明細を ledger_details と同じ順序で逐次返す（保管済みの明細も含む）
+
+    請求書は作業用・保管用のどちらか一方にしかないため、両方のクエリ結果を
+    （会社コード, 作成日時, 請求書ID）で突き合わせて1つの並びにまとめる。
+    保管済みの明細がない期間は作業用テーブルのクエリだけを実行する。
+    """
+    hot = ledger_details(start, end, company).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    archived = ledger_details(start, end, company, model=ArchivedInvoiceDetail)
+    if not archived.exists():
+        return hot
+    return heapq.merge(
+        archived.iterator(chunk_size=EXPORT_CHUNK_SIZE), hot, key=itemgetter(0, 4, 2)
+    )
+
+
+def history_row(record):
+    """明細1件を取引履歴シートの1行に変換"""
+    _, _, _, invoice_number, created_at, item_name, quantity, unit_price, amount = record
+    return [invoice_number, format_created_at(created_at), item_name, quantity, unit_price, amount]
+
+
+def negotiate_format(request):
+    """リクエストから出力形式を決定（format パラメータ優先、次に Accept ヘッダー）"""
+    requested = (request.POST.get('format') or request.GET.get('format') or '').lower()
+    if requested in EXPORT_FORMATS:
+        return requested
+    for media_type in request.headers.get('Accept', '').split(','):
+        export_format = ACCEPT_FORMATS.get(media_type.split(';')[0].strip())
+        if export_format:
+            return export_format
+    return 'xlsx'
+
+
+def iter_history_csv(records):
+    """取引履歴を CSV のテキスト片として逐次生成"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HISTORY_HEADERS)
+    for count, record in enumerate(records, start=1):
+        writer.writerow(history_row(record))
+        if count % TEXT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_history_jsonl(records):
+    """取引履歴を JSON Lines のテキスト片として逐次生成（金額は精度を保つため文字列）"""
+    lines = []
+    for record in records:
+        row = history_row(record)
+        row[4], row[5] = str(row[4]), str(row[5])
+        lines.append(json.dumps(dict(zip(HISTORY_KEYS, row)), ensure_ascii=False))
+        if len(lines) >= TEXT_FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+TEXT_WRITERS = {
+    'csv': iter_history_csv,
+    'jsonl': iter_history_jsonl,
+}
+
+
+def write_history_workbook(path, records, title):
+    """取引履歴を1シートのワークブックに出力（write_only で逐次書き出し）"""
+    import openpyxl
+
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet(sheet_title(title))
+    sheet.append(header_cells(sheet, HISTORY_HEADERS))
+    for record in records:
+        sheet.append(history_row(record))
+    book.save(str(path))
+
+
+def header_cells(sheet, headers):
+    """太字・中央揃えのヘッダー行（write_only 用）"""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        cells.append(cell)
+    return cells
+
+
+def write_monthly_ledger(path, year, month):
+    """全取引先の月次取引履歴を1つのワークブックに出力
+
+    対象月の明細を1回のクエリで会社順に読み込み、会社ごとのシートへ順に
+    書き出す。write_only モードのワークブックは行を一時ファイルへ逐次
+    書き出すため、メモリ使用量は取得チャンク分に収まる。先頭のサマリー
+    シートに会社ごとの件数・合計金額を記録する。出力した会社数を返す。
+    """
+    import openpyxl
+
+    start, end = month_range(year, month)
+    records = iter_ledger(start, end)
+
+    book = openpyxl.Workbook(write_only=True)
+    summary = book.create_sheet(sheet_title(f'{year}年{month}月分', 'サマリー'))
+    summary.append(header_cells(summary, SUMMARY_HEADERS))
+
+    company_count = 0
+    grand_total = Decimal('0')
+    for company_code, rows in groupby(records, key=itemgetter(0)):
+        # 月の途中で会社名が変わっても1社1シートにまとめる（シート名は最初の請求書の会社名）
+        first = next(rows)
+        company_name = first[1]
+        rows = chain([first], rows)
+        sheet = book.create_sheet(sheet_title(company_code, company_name))
+        sheet.append(header_cells(sheet, HISTORY_HEADERS))
+
+        invoice_ids = set()
+        line_count = 0
+        total = Decimal('0')
+        for record in rows:
+            sheet.append(history_row(record))
+            invoice_ids.add(record[2])
+            line_count += 1
+            total += record[8]
+
+        summary.append([company_code, company_name, len(invoice_ids), line_count, total])
+        company_count += 1
+        grand_total += total
+
+    summary.append(['合計', '', None, None, grand_total])
+    book.save(str(path))
+    return company_count
@@ -0,0 +1,236 @@
+import atexit
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.functions import TruncDate
+from django.http import FileResponse
+from django.utils import timezone
+
+from .models import GenerationLog
+from .paginators import analyze_tables
+
+logger = logging.getLogger('invoices.generation_log')
+
+# まとめて書き込む件数と、溜まっていなくても書き込む間隔（秒）
+FLUSH_SIZE = 50
+FLUSH_INTERVAL = 5.0
+
+# 古い記録を1回に削除する件数
+PRUNE_BATCH_SIZE = 5000
+
+# 管理者向けの集計で求める百分位数
+PERCENTILES = (50, 95, 99)
+
+# 失敗として数える結果（'cached'・'duplicate' は成功した応答）
+FAILURE_OUTCOMES = frozenset({'error', 'failed'})
+
+# 書き込み待ちの記録（プロセスごと。バックグラウンドのスレッドが一括登録する）
+_buffer = []
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+def record(entry):
+    """実行記録を書き込み待ちに追加（リクエストの処理中にはデータベースへ書き込まない）
+
+    GENERATION_LOG_IN_BACKGROUND が False の場合はその場で登録する。
+    """
+    if not settings.GENERATION_LOG_IN_BACKGROUND:
+        GenerationLog.objects.bulk_create([entry])
+        return
+    with _lock:
+        _buffer.append(entry)
+        full = len(_buffer) >= FLUSH_SIZE
+    _ensure_flusher()
+    if full:
+        _wakeup.set()
+
+
+def flush():
+    """書き込み待ちの記録を一括登録し、登録した件数を返す"""
+    with _lock:
+        entries = _buffer[:]
+        _buffer.clear()
+    if not entries:
+        return 0
+    try:
+        GenerationLog.objects.bulk_create(entries, batch_size=FLUSH_SIZE)
+    except Exception:
+        logger.exception('生成ログ %s 件の登録に失敗しました', len(entries))
+        return 0
+    return len(entries)
+
+
+def _run_flusher():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush()
+        connection.close()
+
+
+def _ensure_flusher():
+    """書き込み用のスレッドを起動（fork 後のワーカーでは最初の記録時に起動し直す）"""
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None:
+            atexit.register(flush)
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run_flusher, name='generation-log', daemon=True)
+            _flusher.start()
+
+
+class GenerationTimer:
+    """1回の生成処理の段階別の所要時間・行数・出力サイズを計測"""
+
+    def __init__(self, endpoint, user=None):
+        self.endpoint = endpoint
+        self.user_id = getattr(user, 'pk', None)
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = None
+        self.outcome = None
+
+    @contextmanager
+    def phase(self, name):
+        """ブロックの所要時間を段階 name に加算"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.phases[name] = round(self.phases.get(name, 0) + elapsed, 1)
+
+    def count(self, rows):
+        """行を数えながらそのまま返す（出力した行数の記録用）"""
+        self.rows = self.rows or 0
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def finish(self, outcome, size=None):
+        """計測を終えて記録する（outcome が設定済みならそちらを優先）"""
+        record(GenerationLog(
+            endpoint=self.endpoint,
+            started_at=self.started_at,
+            user_id=self.user_id,
+            outcome=self.outcome or outcome,
+            duration_ms=round((time.perf_counter() - self.started) * 1000),
+            phases=self.phases,
+            rows=self.rows,
+            bytes=size,
+        ))
+
+
+def _outcome(response):
+    return 'success' if 200 <= response.status_code < 300 else 'failed'
+
+
+def _finish_after_stream(content, timer, outcome):
+    """ストリーミングの送信が終わった時点で出力サイズと所要時間を記録"""
+    size = 0
+    try:
+        with timer.phase('stream'):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+    except BaseException:
+        timer.finish('error', size)
+        raise
+    timer.finish(outcome, size)
+
+
+def logged(endpoint):
+    """ビューの実行を生成ログに記録するデコレーター
+
+    ビューは request.generation_timer で段階別の計測（phase）・行数（count）・
+    結果（outcome）を追加できる。ストリーミングのレスポンスは送信が終わった
+    時点で記録する。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timer = GenerationTimer(endpoint, request.user)
+            request.generation_timer = timer
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                timer.finish('error')
+                raise
+            if response.streaming and not isinstance(response, FileResponse):
+                response.streaming_content = _finish_after_stream(response.streaming_content, timer, _outcome(response))
+            elif response.streaming:
+                timer.finish(_outcome(response), int(response.get('Content-Length') or 0) or None)
+            else:
+                timer.finish(_outcome(response), len(response.content))
+            return response
+        return wrapper
+    return decorator
+
+
+def _percentile(values, percent):
+    """昇順に並んだ値の百分位数（最近傍順位法）"""
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def daily_stats(days=14):
+    """直近 days 日の処理ごと・日ごとの件数・失敗件数・所要時間の百分位数
+
+    所要時間はデータベースで処理・日・所要時間の順に並べて読み込むため、
+    Python 側で並べ替えずに百分位数を求められる。
+    """
+    since = timezone.now() - timedelta(days=days)
+    logs = (
+        GenerationLog.objects.filter(started_at__gte=since)
+        .annotate(day=TruncDate('started_at', tzinfo=timezone.get_current_timezone()))
+        .order_by('endpoint', 'day', 'duration_ms')
+        .values_list('endpoint', 'day', 'duration_ms', 'outcome', 'rows', 'bytes')
+    )
+    stats = []
+    for (endpoint, day), entries in groupby(logs.iterator(), key=lambda entry: entry[:2]):
+        durations, failures, rows, size = [], 0, 0, 0
+        for _, _, duration, outcome, entry_rows, entry_bytes in entries:
+            durations.append(duration)
+            failures += outcome in FAILURE_OUTCOMES
+            rows += entry_rows or 0
+            size += entry_bytes or 0
+        stats.append({
+            'endpoint': endpoint,
+            'day': day.isoformat(),
+            'count': len(durations),
+            'failures': failures,
+            **{f'p{percent}_ms': _percentile(durations, percent) for percent in PERCENTILES},
+            'rows': rows,
+            'bytes': size,
+        })
+    return stats
+
+
+def prune(days=None, batch_size=PRUNE_BATCH_SIZE):
+    """保存期間（GENERATION_LOG_RETENTION_DAYS）を過ぎた記録をバッチで削除し、削除件数を返す"""
+    if days is None:
+        days = settings.GENERATION_LOG_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(
+            GenerationLog.objects.filter(started_at__lt=cutoff)
+            .order_by('started_at').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            if deleted:
+                analyze_tables(GenerationLog)
+            return deleted
+        deleted += GenerationLog.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,53 @@
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Invoice
+
+# クライアントが冪等キーを送るヘッダーとフォーム項目
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+
+# 送信内容の比較から除外するフォーム項目
+IGNORED_FIELDS = {'csrfmiddlewaretoken', IDEMPOTENCY_FIELD}
+
+
+def new_key():
+    """フォームに埋め込む冪等キーを生成"""
+    return uuid.uuid4().hex
+
+
+def request_key(request):
+    """リクエストの冪等キーを計算（キーが送られていなければ None）
+
+    同じ画面から内容を変えて再送信した場合は別の請求書として扱うため、
+    クライアントのキーにユーザーと送信内容を加えてハッシュ化する。
+    """
+    client_key = (request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD, '')).strip()
+    if not client_key:
+        return None
+
+    digest = hashlib.sha256()
+    digest.update(f'{request.user.pk}\0{client_key}'.encode())
+    for name in sorted(request.POST):
+        if name in IGNORED_FIELDS:
+            continue
+        for value in request.POST.getlist(name):
+            digest.update(f'\0{name}={value}'.encode())
+    return digest.hexdigest()
+
+
+def find_invoice(key):
+    """冪等キーで作成済みの請求書を取得（有効期間を過ぎたキーは解放して None）"""
+    invoice = Invoice.objects.filter(idempotency_key=key).first()
+    if invoice is None:
+        return None
+
+    window = timedelta(seconds=settings.INVOICE_IDEMPOTENCY_WINDOW)
+    if invoice.created_at < timezone.now() - window:
+        Invoice.objects.filter(pk=invoice.pk).update(idempotency_key=None)
+        return None
+    return invoice
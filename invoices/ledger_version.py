@@ -0,0 +1,68 @@
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# 取引履歴（請求書・明細）の変更回数（ワーカー間で共有するため Django のキャッシュに記録）。
+# 会社ごとと全社（ALL）の2つを数え、取引履歴出力のキャッシュキーに使う
+VERSION_KEY = 'invoices:ledger:version:{}'
+ALL = 'all'
+
+
+def get_version(company_id=ALL):
+    """会社（省略時は全社）の取引履歴のバージョン
+
+    キャッシュが消えた場合は現在時刻（ミリ秒）から数え直すため、
+    以前に使ったバージョンと重なることはない。
+    """
+    key = VERSION_KEY.format(company_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(company_id):
+    """請求書・明細の変更時に会社と全社のバージョンを上げる（出力済みのキャッシュは使われなくなる）"""
+    for scope in (company_id, ALL):
+        get_version(scope)
+        try:
+            cache.incr(VERSION_KEY.format(scope))
+        except ValueError:
+            pass
+
+
+class _PendingBump:
+    """コミット後に会社のバージョンを上げる予約（実行済みかを記録する）"""
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        bump_version(self.company_id)
+
+
+def _bump_pending(company_id, using):
+    """同じトランザクションで未実行の更新を予約済みか
+
+    予約はロールバックすると取り消されるため、取り消された予約を当てにすることはない。
+    """
+    return any(
+        isinstance(func, _PendingBump) and func.company_id == company_id and not func.done
+        for _, func, _ in connections[using].run_on_commit
+    )
+
+
+def bump_after_commit(company_ids, using=DEFAULT_DB_ALIAS):
+    """会社ごとに1回だけバージョンを上げる（コミット後に反映）
+
+    請求書と明細をまとめて登録・削除しても1トランザクションで1回にまとめる。
+    削除は post_delete を受け取ると1行ずつの読み込みになるため、保管・完全削除・
+    管理サイトの削除からまとめて呼び出す。
+    """
+    for company_id in set(company_ids):
+        if not _bump_pending(company_id, using):
+            transaction.on_commit(_PendingBump(company_id), using=using)
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from invoices.archive import ARCHIVE_BATCH_SIZE, archive_invoices, default_cutoff, table_stats
+from invoices.models import Invoice
+
+
+class Command(BaseCommand):
+    help = '古い請求書を明細ごと保管テーブルへ移し、作業用テーブルを小さく保ちます'
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--days', type=int, help='作成から指定日数より前の請求書を保管（既定: INVOICE_ARCHIVE_AFTER_DAYS）')
+        cutoff.add_argument('--before', help='指定日（YYYY-MM-DD）より前に作成された請求書を保管')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='1トランザクションで移す請求書の件数')
+        parser.add_argument('--dry-run', action='store_true', help='対象件数の表示のみ行う')
+        parser.add_argument('--vacuum', action='store_true', help='保管後に VACUUM を実行する（SQLite）')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                day = datetime.strptime(options['before'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('日付は YYYY-MM-DD 形式で指定してください')
+            cutoff = timezone.make_aware(day)
+        elif options['days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+        else:
+            cutoff = default_cutoff()
+
+        target = Invoice.objects.filter(created_at__lt=cutoff).count()
+        self.stdout.write(f'{timezone.localtime(cutoff):%Y-%m-%d %H:%M} より前の請求書: {target}件')
+        if options['dry_run'] or not target:
+            return
+
+        before = table_stats()
+        result = archive_invoices(
+            cutoff,
+            batch_size=options['batch_size'],
+            progress=lambda result: self.stdout.write(f'{result.invoices}/{target}件保管'),
+        )
+        if options['vacuum'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+        after = table_stats()
+
+        for key in ('invoices', 'details', 'archived_invoices', 'count_ms', 'recent_ledger_ms'):
+            self.stdout.write(f'{key:>18}: {before[key]} -> {after[key]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'請求書{result.invoices}件・明細{result.details}件を保管しました ({result.elapsed:.2f}秒)'
+        ))
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+# 新しいプロセスで起動から初回リクエストまでを計測するスクリプト
+MEASURE_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoice_project.settings')
+import django
+django.setup()
+import invoice_project.urls
+result = {'import_ms': (time.perf_counter() - started) * 1000,
+          'openpyxl_loaded': 'openpyxl' in sys.modules}
+if sys.argv[1] == 'warm':
+    from invoices.warmup import warm_up
+    started = time.perf_counter()
+    warm_up()
+    result['warmup_ms'] = (time.perf_counter() - started) * 1000
+from django.test import Client
+client = Client(SERVER_NAME='localhost')
+for name in ('first_request_ms', 'second_request_ms'):
+    started = time.perf_counter()
+    client.get('/login/')
+    result[name] = (time.perf_counter() - started) * 1000
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = 'ワーカー起動時の読み込み時間と初回リクエストの所要時間を計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='計測回数（中央値を表示）')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"openpyxl の読み込み: {self.openpyxl_import_ms():.0f}ms")
+        for mode in ('cold', 'warm'):
+            runs = [self.measure(mode) for _ in range(options['runs'])]
+            summary = ', '.join(
+                f'{key}={self.median([run[key] for run in runs]):.1f}'
+                for key in runs[0] if key.endswith('_ms')
+            )
+            loaded = 'あり' if runs[0]['openpyxl_loaded'] else 'なし'
+            self.stdout.write(f'{mode}: {summary}（起動時の openpyxl 読み込み: {loaded}）')
+
+    def measure(self, mode):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE_SCRIPT, mode],
+            capture_output=True, text=True, check=True, env=os.environ.copy(),
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def openpyxl_import_ms(self):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import openpyxl'], check=True)
+        baseline = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        return ((baseline - started) - (time.perf_counter() - baseline)) * 1000
+
+    @staticmethod
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
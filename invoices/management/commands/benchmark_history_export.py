@@ -0,0 +1,84 @@
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from invoices import exports
+from invoices.models import Company
+
+
+def synthetic_records(count):
+    """ベンチマーク用の明細レコード（ledger_details と同じ列構成）を生成"""
+    created_at = timezone.now()
+    unit_price = Decimal('1200.00')
+    for i in range(count):
+        invoice_id = i // 10
+        yield (
+            '0001', 'ベンチマーク株式会社', invoice_id, f'0001_2026_01_{invoice_id:07d}',
+            created_at + timedelta(seconds=invoice_id), f'作業費 {i % 10}', 3, unit_price, unit_price * 3,
+        )
+
+
+class Command(BaseCommand):
+    help = '取引履歴出力の形式ごとの処理速度（行/秒）を計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='生成する明細の件数（合成データ）')
+        parser.add_argument('--company', help='実データで計測する会社コード（--year/--month と併用）')
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--formats', default='csv,jsonl,xlsx', help='計測する形式（カンマ区切り）')
+
+    def handle(self, *args, **options):
+        formats = [name for name in options['formats'].split(',') if name]
+        unknown = set(formats) - set(exports.EXPORT_FORMATS)
+        if unknown:
+            raise CommandError(f"未対応の形式です: {', '.join(sorted(unknown))}")
+
+        if options['company']:
+            try:
+                company = Company.objects.get(company_code=options['company'].upper())
+            except Company.DoesNotExist:
+                raise CommandError('会社コードが見つかりません')
+            start, end = exports.month_range(options['year'], options['month'])
+            make_records = partial(exports.iter_ledger, start, end, company)
+        else:
+            make_records = partial(synthetic_records, options['rows'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            for export_format in formats:
+                rows, size, elapsed = self.run(export_format, make_records(), Path(directory))
+                rate = rows / elapsed if elapsed else 0
+                self.stdout.write(
+                    f'{export_format:>5}: {rows}行 {elapsed:.2f}秒 {rate:,.0f}行/秒 {size / 1024 / 1024:.1f}MB'
+                )
+
+    def run(self, export_format, records, directory):
+        """1形式分を出力して（行数, バイト数, 秒）を返す"""
+        counted = _Counter(records)
+        started = time.perf_counter()
+        if export_format in exports.TEXT_WRITERS:
+            size = sum(len(chunk.encode()) for chunk in exports.TEXT_WRITERS[export_format](counted))
+        else:
+            path = directory / 'history.xlsx'
+            exports.write_history_workbook(path, counted, 'benchmark')
+            size = path.stat().st_size
+        return counted.count, size, time.perf_counter() - started
+
+
+class _Counter:
+    """イテレーターを通過した件数を数える"""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.company_import import IMPORT_BATCH_SIZE, import_companies, iter_rows
+
+
+class Command(BaseCommand):
+    help = '取引先会社をCSV/XLSXから一括登録・更新します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSVまたはXLSXファイルのパス')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='一括登録のバッチサイズ')
+        parser.add_argument('--encoding', help='CSVの文字コード（既定: UTF-8/cp932 を自動判定）')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as stream:
+                rows = iter_rows(stream, path, options['encoding'])
+                result = import_companies(rows, batch_size=options['batch_size'])
+        except (OSError, LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for row, error in result.errors:
+            self.stderr.write(f'{row}行目: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.imported}/{result.total}件を取り込みました '
+            f'({result.elapsed:.2f}秒, {result.rows_per_sec:.0f}行/秒, エラー{len(result.errors)}件)'
+        ))
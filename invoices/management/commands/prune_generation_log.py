@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoices.generation_log import PRUNE_BATCH_SIZE, flush, prune
+from invoices.paginators import optimize_statistics
+
+
+class Command(BaseCommand):
+    help = '保存期間を過ぎた生成ログ（請求書生成・取引履歴出力の実行記録）を削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='指定日数より前の記録を削除（既定: GENERATION_LOG_RETENTION_DAYS）')
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help='1回に削除する件数')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.GENERATION_LOG_RETENTION_DAYS
+        flush()
+        deleted = prune(days, batch_size=options['batch_size'])
+        # 日次の実行に合わせて、行数の増えたテーブルの統計情報（管理画面の推定件数）を更新
+        optimize_statistics()
+        self.stdout.write(self.style.SUCCESS(f'{days}日より前の生成ログを{deleted}件削除しました'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from invoices.company_purge import PURGE_BATCH_SIZE, purge_company
+from invoices.models import Company
+
+
+class Command(BaseCommand):
+    help = '完全削除を依頼された取引先会社を請求書・明細ごとバッチで削除します（中断した削除の再開にも使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='1トランザクションで削除する請求書の件数')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.filter(is_active=False, purge_requested_at__isnull=False)
+        for company in companies:
+            self.stdout.write(f'{company.company_code} {company.company_name}')
+            deleted = purge_company(
+                company.pk,
+                batch_size=options['batch_size'],
+                on_progress=lambda deleted, total: self.stdout.write(f'  {deleted}/{total}件削除'),
+            )
+            self.stdout.write(self.style.SUCCESS(f'  請求書{deleted}件とともに削除しました'))
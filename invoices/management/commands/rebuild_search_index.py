@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from invoices import search
+
+
+class Command(BaseCommand):
+    help = '請求書の全文検索索引（SQLite FTS5）を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.REBUILD_BATCH_SIZE, help='1回に登録する請求書IDの範囲')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('全文検索索引は SQLite のみ対応しています（他のデータベースは部分一致で検索します）')
+        try:
+            total = search.rebuild(
+                batch_size=options['batch_size'],
+                progress=lambda count: self.stdout.write(f'{count}件登録'),
+            )
+        except OperationalError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{total}件の請求書を索引に登録しました'))
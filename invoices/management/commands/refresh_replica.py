@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.paginators import optimize_statistics
+from invoices.routers import refresh_replica
+
+
+class Command(BaseCommand):
+    help = 'default の SQLite データベースを backup API でレプリカのファイルへ同期します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help='指定秒ごとに同期を繰り返す（0 は1回のみ）')
+
+    def handle(self, *args, **options):
+        while True:
+            # 一覧の推定件数に使う統計情報を更新してからレプリカへ写す
+            optimize_statistics()
+            try:
+                elapsed = refresh_replica()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'レプリカを同期しました ({elapsed:.2f}秒)'))
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+# 請求書一覧・月別出力用のインデックス
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0002'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at'], name='invoice_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'created_at'], name='invoice_company_created_idx'),
+        ),
+    ]
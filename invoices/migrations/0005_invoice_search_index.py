@@ -0,0 +1,36 @@
+# 請求書の全文検索索引（SQLite の FTS5。他のデータベースでは何もしない）
+
+from django.db import OperationalError, migrations
+
+
+def install_search_index(apps, schema_editor):
+    from invoices import search
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        # トリガーは後続のマイグレーションの後に post_migrate で作成する
+        search.rebuild(triggers=False, using=schema_editor.connection.alias)
+    except OperationalError:
+        # FTS5 を使えない SQLite では部分一致の検索になる
+        pass
+
+
+def uninstall_search_index(apps, schema_editor):
+    from invoices import search
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        search.uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_invoice_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
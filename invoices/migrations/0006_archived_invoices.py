@@ -0,0 +1,53 @@
+# 古い請求書の保管用テーブル
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_invoice_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoice_number', models.CharField(max_length=50, unique=True, verbose_name='請求書番号')),
+                ('customer_id', models.CharField(max_length=50, verbose_name='顧客ID')),
+                ('created_at', models.DateTimeField(verbose_name='作成日時')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='保管日時')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to='invoices.company', verbose_name='取引先会社')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_invoices', to=settings.AUTH_USER_MODEL, verbose_name='作成者')),
+            ],
+            options={
+                'verbose_name': '保管済み請求書',
+                'verbose_name_plural': '保管済み請求書',
+                'ordering': ['-created_at'],
+                'indexes': [
+                    models.Index(fields=['created_at'], name='archived_created_at_idx'),
+                    models.Index(fields=['company', 'created_at'], name='archived_company_created_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceDetail',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_name', models.CharField(max_length=100, verbose_name='請求内容')),
+                ('quantity', models.IntegerField(default=1, verbose_name='個数')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='単価')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='金額')),
+                ('order', models.IntegerField(default=0, verbose_name='順序')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='details', to='invoices.archivedinvoice', verbose_name='請求書')),
+            ],
+            options={
+                'verbose_name': '保管済み請求書明細',
+                'verbose_name_plural': '保管済み請求書明細',
+                'ordering': ['order'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# 取引先会社の無効化（論理削除）と完全削除の依頼
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_archived_invoices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, verbose_name='有効'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='deactivated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='無効化日時'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='purge_requested_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='完全削除依頼日時'),
+        ),
+    ]
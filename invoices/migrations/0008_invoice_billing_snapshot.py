@@ -0,0 +1,130 @@
+# 請求書に請求先（作成時点の会社情報）を保存し、既存の請求書は現在の会社情報で埋める
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# 既存の請求書を埋めるときに1回で更新する件数
+BACKFILL_BATCH_SIZE = 5000
+
+BILLING_FIELDS = {
+    'billed_company_code': 'company_code',
+    'billed_company_name': 'company_name',
+    'billed_contact_person': 'contact_person',
+    'billed_address': 'address',
+    'billed_postal_code': 'postal_code',
+    'billed_prefecture': 'prefecture',
+    'billed_phone': 'phone',
+    'billed_email': 'email',
+}
+
+
+def backfill_billing_details(apps, schema_editor):
+    Company = apps.get_model('invoices', 'Company')
+    for model_name in ('Invoice', 'ArchivedInvoice'):
+        model = apps.get_model('invoices', model_name)
+        company = Company.objects.filter(pk=OuterRef('company_id'))
+        values = {
+            field: Subquery(company.values(company_field)[:1])
+            for field, company_field in BILLING_FIELDS.items()
+        }
+        last_id = 0
+        while True:
+            ids = list(
+                model.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:BACKFILL_BATCH_SIZE]
+            )
+            if not ids:
+                break
+            model.objects.filter(pk__in=ids).update(**values)
+            last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_company_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_company_code',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='請求先会社コード'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_company_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='請求先会社名'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_contact_person',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='請求先担当者名'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_address',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='請求先番地'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_postal_code',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='請求先郵便番号'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_prefecture',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='請求先都道府県'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_phone',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='請求先電話番号'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billed_email',
+            field=models.EmailField(blank=True, default='', max_length=254, verbose_name='請求先メールアドレス'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_company_code',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='請求先会社コード'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_company_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='請求先会社名'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_contact_person',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='請求先担当者名'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_address',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='請求先番地'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_postal_code',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='請求先郵便番号'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_prefecture',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='請求先都道府県'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_phone',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='請求先電話番号'),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='billed_email',
+            field=models.EmailField(blank=True, default='', max_length=254, verbose_name='請求先メールアドレス'),
+        ),
+        migrations.RunPython(backfill_billing_details, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# API の (作成日時, ID) 順のカーソルページング用の索引
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_invoice_billing_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['created_at'], name='company_created_at_idx'),
+        ),
+    ]
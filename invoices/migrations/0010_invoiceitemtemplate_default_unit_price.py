@@ -0,0 +1,18 @@
+# 請求書項目の既定単価（請求書作成画面の自動入力用）
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0009_company_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitemtemplate',
+            name='default_unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='既定単価'),
+        ),
+    ]
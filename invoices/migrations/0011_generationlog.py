@@ -0,0 +1,38 @@
+# 請求書生成・取引履歴出力の実行記録
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0010_invoiceitemtemplate_default_unit_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50, verbose_name='処理')),
+                ('started_at', models.DateTimeField(verbose_name='開始日時')),
+                ('outcome', models.CharField(max_length=20, verbose_name='結果')),
+                ('duration_ms', models.PositiveIntegerField(verbose_name='所要時間（ミリ秒）')),
+                ('phases', models.JSONField(default=dict, verbose_name='段階別の所要時間')),
+                ('rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='行数')),
+                ('bytes', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='出力サイズ')),
+                ('user', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='実行者')),
+            ],
+            options={
+                'verbose_name': '生成ログ',
+                'verbose_name_plural': '生成ログ',
+                'ordering': ['-started_at'],
+                'indexes': [
+                    models.Index(fields=['started_at'], name='genlog_started_at_idx'),
+                    models.Index(fields=['endpoint', 'started_at'], name='genlog_endpoint_started_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# 保管済みの請求書を全文検索索引に登録（以前は保管時に索引から外れていた）
+
+from django.db import migrations
+
+
+def index_archived_invoices(apps, schema_editor):
+    from invoices import search
+
+    if not search.is_available(schema_editor.connection.alias):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {search.SEARCH_TABLE} WHERE rowid IN (SELECT id FROM invoices_archivedinvoice)'
+        )
+    search.index_tables(search.SOURCE_TABLES[1], using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0011_generationlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_archived_invoices, migrations.RunPython.noop),
+    ]
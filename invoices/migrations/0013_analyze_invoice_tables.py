@@ -0,0 +1,25 @@
+# 管理画面の一覧の推定件数に使う統計情報（SQLite の sqlite_stat1）を作成
+
+from django.db import migrations
+
+ANALYZED_TABLES = ['invoices_invoice', 'invoices_invoicedetail', 'invoices_generationlog']
+
+
+def analyze_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for table in ANALYZED_TABLES:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0012_index_archived_invoices'),
+    ]
+
+    operations = [
+        migrations.RunPython(analyze_tables, migrations.RunPython.noop),
+    ]
@@ -28,6 +28,11 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
+    def get_session_auth_hash(self):
+        """セッションの検証に使うハッシュ（キャッシュから復元したユーザーはパスワードを読まずに記録した値を使う）"""
+        cached = self.__dict__.get('_cached_session_auth_hash')
+        return cached if cached is not None else super().get_session_auth_hash()
+
     def is_director(self):
         """責任者かどうか"""
         return self.role == 'director'
@@ -41,6 +46,13 @@ class CustomUser(AbstractUser):
         return self.role in ['manager', 'director']
 
 
+class ActiveCompanyManager(models.Manager):
+    """有効な（無効化されていない）取引先会社のみを返すマネージャー"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_active=True)
+
+
 class Company(models.Model):
     """取引先会社モデル"""
     company_code = models.CharField(
@@ -56,13 +68,25 @@ class Company(models.Model):
     prefecture = models.CharField('都道府県', max_length=50)
     phone = models.CharField('電話番号', max_length=20)
     email = models.EmailField('メールアドレス')
+    # 無効化した会社は検索・選択肢に表示しない（請求書の履歴は残る）
+    is_active = models.BooleanField('有効', default=True, db_index=True)
+    deactivated_at = models.DateTimeField('無効化日時', null=True, blank=True)
+    # 完全削除の依頼日時（バックグラウンドでバッチ削除する）
+    purge_requested_at = models.DateTimeField('完全削除依頼日時', null=True, blank=True)
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
     updated_at = models.DateTimeField('更新日時', auto_now=True)
 
+    objects = models.Manager()
+    active = ActiveCompanyManager()
+
     class Meta:
         verbose_name = '取引先会社'
         verbose_name_plural = '取引先会社'
         ordering = ['company_code']
+        indexes = [
+            # API の (作成日時, ID) 順のカーソルページング用
+            models.Index(fields=['created_at'], name='company_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.company_code} - {self.company_name}"
@@ -72,6 +96,8 @@ class InvoiceItemTemplate(models.Model):
     """請求書項目テンプレートモデル"""
     name = models.CharField('項目名', max_length=100)
     description = models.TextField('説明', blank=True, null=True)
+    # 請求書作成画面で項目を選んだときに入れる単価
+    default_unit_price = models.DecimalField('既定単価', max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
 
     class Meta:
@@ -83,6 +109,19 @@ class InvoiceItemTemplate(models.Model):
         return self.name
 
 
+# 請求書の請求先フィールド → 取引先会社のフィールド
+BILLING_FIELDS = {
+    'billed_company_code': 'company_code',
+    'billed_company_name': 'company_name',
+    'billed_contact_person': 'contact_person',
+    'billed_address': 'address',
+    'billed_postal_code': 'postal_code',
+    'billed_prefecture': 'prefecture',
+    'billed_phone': 'phone',
+    'billed_email': 'email',
+}
+
+
 class Invoice(models.Model):
     """請求書モデル"""
     invoice_number = models.CharField('請求書番号', max_length=50, unique=True)
@@ -95,14 +134,47 @@ class Invoice(models.Model):
         null=True,
         verbose_name='作成者'
     )
+    # 請求先（作成時点の会社情報。後から会社情報を変更しても請求書の内容は変わらない）
+    billed_company_code = models.CharField('請求先会社コード', max_length=20, blank=True, default='')
+    billed_company_name = models.CharField('請求先会社名', max_length=100, blank=True, default='')
+    billed_contact_person = models.CharField('請求先担当者名', max_length=100, blank=True, default='')
+    billed_address = models.CharField('請求先番地', max_length=200, blank=True, default='')
+    billed_postal_code = models.CharField('請求先郵便番号', max_length=10, blank=True, default='')
+    billed_prefecture = models.CharField('請求先都道府県', max_length=50, blank=True, default='')
+    billed_phone = models.CharField('請求先電話番号', max_length=20, blank=True, default='')
+    billed_email = models.EmailField('請求先メールアドレス', blank=True, default='')
+    # 二重送信の検出用（ユーザー・フォームのキー・送信内容のハッシュ）
+    idempotency_key = models.CharField(
+        '冪等キー',
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         verbose_name = '請求書'
         verbose_name_plural = '請求書'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='invoice_created_at_idx'),
+            models.Index(fields=['company', 'created_at'], name='invoice_company_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.invoice_number} - {self.company.company_name}"
+        return f"{self.invoice_number} - {self.billed_company_name}"
+
+    def save(self, *args, **kwargs):
+        """作成時に請求先の会社情報を写す"""
+        if self._state.adding and not self.billed_company_code:
+            self.copy_billing_details(self.company)
+        super().save(*args, **kwargs)
+
+    def copy_billing_details(self, company):
+        """会社情報を請求先として写す"""
+        for field, company_field in BILLING_FIELDS.items():
+            setattr(self, field, getattr(company, company_field))
 
 
 class InvoiceDetail(models.Model):
@@ -131,3 +203,105 @@ class InvoiceDetail(models.Model):
         """金額を自動計算"""
         self.amount = self.quantity * self.unit_price
         super().save(*args, **kwargs)
+
+
+class ArchivedInvoice(models.Model):
+    """保管済み請求書モデル（古い請求書を作業用テーブルから移したもの）"""
+    # 再ダウンロードの URL が変わらないよう元の請求書IDをそのまま使う
+    id = models.IntegerField('ID', primary_key=True)
+    invoice_number = models.CharField('請求書番号', max_length=50, unique=True)
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        related_name='archived_invoices',
+        verbose_name='取引先会社'
+    )
+    customer_id = models.CharField('顧客ID', max_length=50)
+    created_at = models.DateTimeField('作成日時')
+    # 請求先（保管前の請求書から写す）
+    billed_company_code = models.CharField('請求先会社コード', max_length=20, blank=True, default='')
+    billed_company_name = models.CharField('請求先会社名', max_length=100, blank=True, default='')
+    billed_contact_person = models.CharField('請求先担当者名', max_length=100, blank=True, default='')
+    billed_address = models.CharField('請求先番地', max_length=200, blank=True, default='')
+    billed_postal_code = models.CharField('請求先郵便番号', max_length=10, blank=True, default='')
+    billed_prefecture = models.CharField('請求先都道府県', max_length=50, blank=True, default='')
+    billed_phone = models.CharField('請求先電話番号', max_length=20, blank=True, default='')
+    billed_email = models.EmailField('請求先メールアドレス', blank=True, default='')
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='archived_invoices',
+        verbose_name='作成者'
+    )
+    archived_at = models.DateTimeField('保管日時', auto_now_add=True)
+
+    class Meta:
+        verbose_name = '保管済み請求書'
+        verbose_name_plural = '保管済み請求書'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='archived_created_at_idx'),
+            models.Index(fields=['company', 'created_at'], name='archived_company_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice_number} - {self.billed_company_name}"
+
+
+class ArchivedInvoiceDetail(models.Model):
+    """保管済み請求書明細モデル"""
+    id = models.IntegerField('ID', primary_key=True)
+    invoice = models.ForeignKey(
+        ArchivedInvoice,
+        on_delete=models.CASCADE,
+        related_name='details',
+        verbose_name='請求書'
+    )
+    item_name = models.CharField('請求内容', max_length=100)
+    quantity = models.IntegerField('個数', default=1)
+    unit_price = models.DecimalField('単価', max_digits=10, decimal_places=2)
+    amount = models.DecimalField('金額', max_digits=10, decimal_places=2)
+    order = models.IntegerField('順序', default=0)
+
+    class Meta:
+        verbose_name = '保管済み請求書明細'
+        verbose_name_plural = '保管済み請求書明細'
+        ordering = ['order']
+
+    def __str__(self):
+        return f"{self.invoice.invoice_number} - {self.item_name}"
+
+
+class GenerationLog(models.Model):
+    """請求書生成・取引履歴出力の実行記録（追記のみ。傾向分析・容量計画用）"""
+    endpoint = models.CharField('処理', max_length=50)
+    started_at = models.DateTimeField('開始日時')
+    # 実行者（ユーザーを削除しても記録は残すため外部キー制約は付けない）
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        related_name='+',
+        verbose_name='実行者'
+    )
+    outcome = models.CharField('結果', max_length=20)
+    duration_ms = models.PositiveIntegerField('所要時間（ミリ秒）')
+    # 処理段階ごとの所要時間（ミリ秒）
+    phases = models.JSONField('段階別の所要時間', default=dict)
+    rows = models.PositiveIntegerField('行数', null=True, blank=True)
+    bytes = models.PositiveBigIntegerField('出力サイズ', null=True, blank=True)
+
+    class Meta:
+        verbose_name = '生成ログ'
+        verbose_name_plural = '生成ログ'
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['started_at'], name='genlog_started_at_idx'),
+            models.Index(fields=['endpoint', 'started_at'], name='genlog_endpoint_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.started_at:%Y-%m-%d %H:%M:%S} {self.outcome}"
@@ -0,0 +1,101 @@
+from django.core.paginator import EmptyPage, Paginator
+from django.db import OperationalError, connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+# この件数を超える場合のみ推定件数を使用（小さいテーブルは正確な件数の方が安い）
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimate_table_rows(model, using='default'):
+    """テーブルの行数を統計情報から推定（推定できない場合は None）"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # ANALYZE で記録した行数（MAX(rowid) と違い、保管・完全削除で行を消しても過大にならない）
+            try:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            except OperationalError:
+                # ANALYZE を一度も実行していない（sqlite_stat1 がない）
+                return None
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+def analyze_tables(*models, using='default'):
+    """大量の削除の後に統計情報（推定件数）を更新"""
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def optimize_statistics(using='default'):
+    """統計情報が古くなったテーブルだけ ANALYZE し直す（定期実行のコマンドから呼び出す）
+
+    PostgreSQL は autovacuum が更新するため何もしない。
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+
+
+class EstimatedCountPaginator(Paginator):
+    """絞り込みのない大きなテーブルでは COUNT(*) の代わりに推定件数を使うページネーター
+
+    推定件数が実際より多く、表示したページが途中で終わった場合は、
+    そのページから分かる実際の件数に直す（存在しないページへのリンクを出さない）。
+    推定件数が実際より少なく、最後のページが埋まっている場合は次の1行を確かめ、
+    続きがあれば主キーの最大値（行数の上限）まで広げる。
+    """
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def _set_count(self, count, estimated=False):
+        self.estimated = estimated
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+
+    def _extend_count(self):
+        """統計情報の後に増えた行を含むよう、件数を主キーの最大値まで広げる"""
+        upper = self.object_list.order_by().aggregate(upper=Max('pk'))['upper']
+        if isinstance(upper, int) and upper > self.count:
+            self._set_count(upper, estimated=True)
+        else:
+            self._set_count(super().count)
+
+    def page(self, number):
+        page = super().page(number)
+        if not self.estimated:
+            return page
+        if len(page.object_list) >= self.per_page:
+            end = page.end_index()
+            if page.number == self.num_pages and self.object_list[end:end + 1].exists():
+                self._extend_count()
+            return page
+        if page.object_list or page.number == 1:
+            self._set_count((page.number - 1) * self.per_page + len(page.object_list))
+            return page
+        # 推定件数では存在するはずのページが空だった（実際の件数を数え直す）
+        self._set_count(super().count)
+        raise EmptyPage('そのページには結果がありません')
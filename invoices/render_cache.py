@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 出力処理（セル配置・書式）を変更したら上げる。古いキャッシュは使われなくなり LRU で消える
+RENDER_VERSION = 2
+
+# ヒット・ミス件数のキー（ワーカー間で共有するため Django のキャッシュに記録）
+STATS_KEYS = {
+    'hits': 'invoices:render_cache:hits',
+    'misses': 'invoices:render_cache:misses',
+}
+
+CENTS = Decimal('0.01')
+
+
+def _normalize(value):
+    """ハッシュ用に値を正規化（Decimal は小数2桁の文字列）"""
+    if isinstance(value, Decimal):
+        return str(value.quantize(CENTS))
+    if isinstance(value, float):
+        return str(Decimal(str(value)).quantize(CENTS))
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+@lru_cache(maxsize=8)
+def _file_digest(path, mtime_ns, size):
+    """ファイル内容のハッシュ（更新日時・サイズが同じ間は再計算しない）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_version(path):
+    """テンプレートファイルのバージョン（内容のハッシュ）"""
+    stat = os.stat(path)
+    return _file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def make_key(kind, version, payload):
+    """出力の種類・バージョン・入力データからキャッシュキーを生成"""
+    digest = hashlib.sha256()
+    digest.update(f'{kind}\0{RENDER_VERSION}\0{version}\0'.encode())
+    digest.update(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=_normalize).encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """出力済みファイルを入力データのハッシュで再利用するディスクキャッシュ
+
+    キーは入力データ（会社・請求書・明細の内容とテンプレートのバージョン、
+    取引履歴では変更回数のバージョン）のハッシュなので、いずれかが変更されると
+    自動的に別のキーになり古いファイルは使われない。合計サイズが上限を超えたら最終利用日時の古い順に削除する。
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return self.directory / f'{key}.xlsx'
+
+    def get(self, key):
+        """キャッシュ済みファイルのパス（なければ None）"""
+        path = self.path(key)
+        try:
+            # 最終利用日時を更新（LRU の基準）
+            os.utime(path)
+        except FileNotFoundError:
+            _record('misses')
+            return None
+        _record('hits')
+        return path
+
+    def put(self, key, source):
+        """出力したファイルをキャッシュに登録"""
+        if self.max_bytes <= 0:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp_name)
+            os.replace(temp_name, self.path(key))
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+        self.evict()
+
+    def entries(self):
+        """キャッシュ済みファイルの (パス, stat) 一覧"""
+        if not self.directory.exists():
+            return []
+        result = []
+        for path in self.directory.glob('*.xlsx'):
+            try:
+                result.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        return result
+
+    def evict(self):
+        """合計サイズが上限以下になるまで最終利用日時の古い順に削除"""
+        entries = sorted(self.entries(), key=lambda entry: entry[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def clear(self):
+        for path, _ in self.entries():
+            path.unlink(missing_ok=True)
+
+    def stats(self):
+        """ヒット率と使用量"""
+        hits = cache.get(STATS_KEYS['hits'], 0)
+        misses = cache.get(STATS_KEYS['misses'], 0)
+        entries = self.entries()
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+def _record(name):
+    """ヒット・ミス件数を加算"""
+    key = STATS_KEYS[name]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_render_cache():
+    """設定に基づくキャッシュを取得"""
+    return RenderCache(settings.RENDER_CACHE_DIR, settings.RENDER_CACHE_MAX_BYTES)
@@ -0,0 +1,263 @@
+import io
+import os
+import tempfile
+from dataclasses import dataclass
+from decimal import ROUND_DOWN, Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exports import safe_filename
+from .render_cache import get_render_cache, make_key, template_version
+
+# 請求書テンプレートのセル配置（テンプレートを変更したらここを合わせる）
+INVOICE_LAYOUT = {
+    # 全ページに書き込むセル → 請求書の値（header_values のキー）
+    'header': {
+        'A8': 'contact_person',  # 請求先会社の担当者
+        'A9': 'company_name',  # 会社名
+        'A10': 'address',  # 会社の番地
+        'A11': 'postal_prefecture',  # 郵便番号/都道府県
+        'A12': 'phone',  # 電話番号
+        'A13': 'email',  # メールアドレス
+        'A16': 'invoice_number',  # 請求書番号
+        'F5': 'invoice_number',  # 請求書番号
+        'F8': 'customer_id',  # 顧客ID
+        'H5': 'created_date',  # 請求書作成日時
+    },
+    # 請求内訳の領域（開始行・1ページの行数・明細の項目ごとの列）
+    'lines': {
+        'start_row': 17,
+        'capacity': 10,
+        'columns': {'item_name': 'A', 'quantity': 'F', 'unit_price': 'G', 'amount': 'H'},
+    },
+    # 2ページ目以降の前ページからの繰越（請求書番号の行を使う。clear は見本の値を消すセル）
+    'carry_in': {'label': 'A16', 'amount': 'H16', 'clear': ['F16', 'G16']},
+    # ページ末尾の小計（そのページまでの累計）
+    'subtotal': {'label': 'F31', 'amount': 'H31'},
+    # 最終ページの税率・税額・合計（続きのページでは見出しごと消す）
+    'totals': {
+        'tax_rate': {'label': 'F32', 'amount': 'H32'},
+        'tax': {'label': 'F33', 'amount': 'H33'},
+        'total': {'label': 'F34', 'amount': 'H34'},
+    },
+}
+
+CARRY_IN_LABEL = '前頁より繰越'
+CARRY_OUT_LABEL = '小計（次頁へ繰越）'
+
+
+@dataclass(frozen=True)
+class CompiledLayout:
+    """セル番地を (行, 列) の数値に変換済みのレイアウトと、見本の値を消したテンプレート"""
+    template: bytes
+    sheet_title: str
+    header: tuple
+    line_start_row: int
+    line_capacity: int
+    line_columns: tuple
+    carry_in_label: tuple
+    carry_in_amount: tuple
+    subtotal_label: tuple
+    subtotal_amount: tuple
+    totals: tuple
+
+
+def template_path():
+    """請求書テンプレートのパス"""
+    return Path(settings.BASE_DIR) / 'invoice_template.xlsx'
+
+
+@lru_cache(maxsize=4)
+def _compile_layout(path, version):
+    """レイアウトを数値のセル位置に変換し、請求内訳の領域の見本の値を消したテンプレートを作成
+
+    テンプレートのバージョン（内容のハッシュ）ごとに1回だけ実行する。
+    """
+    import openpyxl
+    from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple
+
+    lines = INVOICE_LAYOUT['lines']
+    start_row, capacity = lines['start_row'], lines['capacity']
+    columns = tuple(
+        (field, column_index_from_string(column)) for field, column in lines['columns'].items()
+    )
+
+    carry_in, subtotal = INVOICE_LAYOUT['carry_in'], INVOICE_LAYOUT['subtotal']
+
+    # 請求内訳の領域と繰越の行に入っている見本の値を消す
+    book = openpyxl.load_workbook(path)
+    sheet = book.active
+    for row in range(start_row, start_row + capacity):
+        for _, column in columns:
+            sheet.cell(row=row, column=column).value = None
+    for cell in [carry_in['amount'], *carry_in['clear']]:
+        sheet.cell(*coordinate_to_tuple(cell)).value = None
+    buffer = io.BytesIO()
+    book.save(buffer)
+
+    return CompiledLayout(
+        template=buffer.getvalue(),
+        sheet_title=sheet.title,
+        header=tuple(
+            (*coordinate_to_tuple(cell), field) for cell, field in INVOICE_LAYOUT['header'].items()
+        ),
+        line_start_row=start_row,
+        line_capacity=capacity,
+        line_columns=columns,
+        carry_in_label=coordinate_to_tuple(carry_in['label']),
+        carry_in_amount=coordinate_to_tuple(carry_in['amount']),
+        subtotal_label=coordinate_to_tuple(subtotal['label']),
+        subtotal_amount=coordinate_to_tuple(subtotal['amount']),
+        totals=tuple(
+            (field, coordinate_to_tuple(cells['label']), coordinate_to_tuple(cells['amount']))
+            for field, cells in INVOICE_LAYOUT['totals'].items()
+        ),
+    )
+
+
+def compiled_layout():
+    """現在のテンプレートに対応するコンパイル済みのレイアウト"""
+    path = template_path()
+    return _compile_layout(str(path), template_version(path))
+
+
+def header_values(invoice):
+    """全ページに書き込む請求書の値（請求先は作成時点の会社情報）"""
+    return {
+        'contact_person': invoice.billed_contact_person,
+        'company_name': invoice.billed_company_name,
+        'address': invoice.billed_address,
+        'postal_prefecture': f"{invoice.billed_postal_code} {invoice.billed_prefecture}",
+        'phone': invoice.billed_phone,
+        'email': invoice.billed_email,
+        'invoice_number': invoice.invoice_number,
+        'customer_id': invoice.customer_id,
+        'created_date': timezone.localtime(invoice.created_at).strftime('%Y年%m月%d日'),
+    }
+
+
+def total_values(subtotal):
+    """最終ページに書き込む税率・税額（1円未満切り捨て）・合計"""
+    rate = settings.INVOICE_TAX_RATE
+    tax = (subtotal * rate).quantize(Decimal('1'), rounding=ROUND_DOWN)
+    return {'tax_rate': rate, 'tax': tax, 'total': subtotal + tax}
+
+
+def invoice_filename(invoice):
+    """請求書ファイル名（invoice_会社名_会社コード_請求書番号.xlsx）"""
+    return (
+        f'invoice_{safe_filename(invoice.billed_company_name)}_'
+        f'{invoice.billed_company_code}_{invoice.invoice_number}.xlsx'
+    )
+
+
+def invoice_path(invoice):
+    """請求書ファイルの保存先"""
+    return Path(settings.INVOICE_OUTPUT_DIR) / invoice_filename(invoice)
+
+
+def invoice_cache_key(invoice, details):
+    """請求書に書き込む内容とテンプレートのバージョンからキャッシュキーを生成"""
+    payload = {
+        'company': [
+            invoice.billed_contact_person, invoice.billed_company_name, invoice.billed_address,
+            invoice.billed_postal_code, invoice.billed_prefecture, invoice.billed_phone, invoice.billed_email,
+        ],
+        'invoice': [
+            invoice.invoice_number, invoice.customer_id,
+            timezone.localtime(invoice.created_at).date(),
+        ],
+        'details': [
+            [detail.item_name, detail.quantity, detail.unit_price, detail.amount]
+            for detail in details
+        ],
+        'tax_rate': settings.INVOICE_TAX_RATE,
+    }
+    return make_key('invoice', template_version(template_path()), payload)
+
+
+def render_invoice(invoice, details):
+    """請求書を出力し、ダウンロードするファイルのパスを返す
+
+    入力データが同じ請求書が出力済みならキャッシュのファイルをそのまま返す。
+    """
+    render_cache = get_render_cache()
+    key = invoice_cache_key(invoice, details)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached
+
+    save_path = write_invoice_workbook(invoice, details)
+    render_cache.put(key, save_path)
+    return save_path
+
+
+def write_invoice_workbook(invoice, details):
+    """請求書をテンプレートに書き込んで保存し、保存先のパスを返す
+
+    1ページに収まらない請求内訳は続きのシートへ書き込み、各ページの末尾に
+    そこまでの小計、2ページ目以降の先頭に前ページからの繰越を記入する。
+    税率・税額・合計は最終ページにのみ記入する。
+    同じ請求書を同時に出力しても壊れたファイルを返さないよう、一時ファイルに
+    保存してから置き換える。
+    """
+    import openpyxl
+
+    layout = compiled_layout()
+    book = openpyxl.load_workbook(io.BytesIO(layout.template))
+    first = book.active
+
+    # 続きのシートは値を書き込む前のテンプレートから複製する
+    capacity = layout.line_capacity
+    page_count = max(1, -(-len(details) // capacity))
+    sheets = [first]
+    for page in range(2, page_count + 1):
+        sheet = book.copy_worksheet(first)
+        sheet.title = f'{layout.sheet_title} ({page})'
+        sheets.append(sheet)
+
+    values = header_values(invoice)
+    subtotal = Decimal('0')
+    for page, sheet in enumerate(sheets):
+        for row, column, field in layout.header:
+            sheet.cell(row=row, column=column, value=values[field])
+
+        if page > 0:
+            sheet.cell(*layout.carry_in_label, value=CARRY_IN_LABEL)
+            sheet.cell(*layout.carry_in_amount, value=subtotal)
+
+        row = layout.line_start_row
+        for detail in details[page * capacity:(page + 1) * capacity]:
+            for field, column in layout.line_columns:
+                sheet.cell(row=row, column=column, value=getattr(detail, field))
+            subtotal += detail.amount
+            row += 1
+
+        if page < page_count - 1:
+            sheet.cell(*layout.subtotal_label, value=CARRY_OUT_LABEL)
+            # 合計欄はテンプレートの見本の値が残らないよう見出しごと消す
+            for _, label, amount in layout.totals:
+                sheet.cell(*label).value = None
+                sheet.cell(*amount).value = None
+        else:
+            totals = total_values(subtotal)
+            for field, _, amount in layout.totals:
+                sheet.cell(*amount, value=totals[field])
+        sheet.cell(*layout.subtotal_amount, value=subtotal)
+
+    # 保存ディレクトリが存在しない場合は作成
+    save_path = invoice_path(invoice)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_name = tempfile.mkstemp(dir=save_path.parent, suffix='.xlsx.tmp')
+    os.close(fd)
+    try:
+        book.save(temp_name)
+        os.replace(temp_name, save_path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+    return save_path
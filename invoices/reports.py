@@ -0,0 +1,149 @@
+import csv
+import heapq
+import io
+import json
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .exports import TEXT_FLUSH_ROWS, format_created_at, header_cells, sheet_title
+from .models import ArchivedInvoiceDetail, InvoiceDetail
+
+# 集計の種類（取引履歴出力の mode パラメータ）
+REPORT_MODES = {
+    'item': '請求内容別',
+    'invoice': '請求書別',
+    'month': '月別',
+}
+
+# 集計ごとの列（見出し・JSON Lines のキー）
+REPORT_HEADERS = {
+    'item': ['請求内容', '請求書数', '明細数', '個数', '金額'],
+    'invoice': ['請求書番号', '作成日時', '明細数', '個数', '金額'],
+    'month': ['年月', '請求書数', '明細数', '個数', '金額'],
+}
+REPORT_KEYS = {
+    'item': ['item_name', 'invoices', 'lines', 'quantity', 'amount'],
+    'invoice': ['invoice_number', 'created_at', 'lines', 'quantity', 'amount'],
+    'month': ['month', 'invoices', 'lines', 'quantity', 'amount'],
+}
+
+# 金額の表記（明細の出力と同じ小数2桁）
+CENTS = Decimal('0.01')
+
+# 1回の取得件数（請求書別は期間内の請求書数だけ行がある）
+REPORT_CHUNK_SIZE = 2000
+
+
+def _group_fields(mode):
+    """集計の単位（GROUP BY と並び順に使う列）"""
+    if mode == 'item':
+        return ['item_name']
+    if mode == 'invoice':
+        return ['invoice__created_at', 'invoice_id', 'invoice__invoice_number']
+    return ['month']
+
+
+def grouped_details(mode, start, end, company=None, model=InvoiceDetail):
+    """期間内の明細をデータベースで集計するクエリ（集計の単位の列＋請求書数・明細数・個数・金額）"""
+    details = model.objects.filter(invoice__created_at__gte=start, invoice__created_at__lt=end)
+    if company is not None:
+        details = details.filter(invoice__company=company)
+    if mode == 'month':
+        details = details.annotate(
+            month=TruncMonth('invoice__created_at', tzinfo=timezone.get_current_timezone())
+        )
+    fields = _group_fields(mode)
+    return details.values(*fields).annotate(
+        invoices=Count('invoice_id', distinct=True),
+        lines=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_amount=Sum('amount'),
+    ).order_by(*fields).values_list(*fields, 'invoices', 'lines', 'total_quantity', 'total_amount')
+
+
+def iter_report(mode, start, end, company=None):
+    """集計結果を出力の1行ずつ返す（保管済みの明細も含む）
+
+    作業用・保管用のテーブルをそれぞれ GROUP BY で集計し、同じ並び順の
+    結果を突き合わせて同じ単位の件数・金額を合算する。Python 側で明細を
+    読み込まないため、期間が長くてもクエリ数とメモリ使用量は変わらない。
+    """
+    width = len(_group_fields(mode))
+    key = itemgetter(slice(width))
+    queries = [
+        grouped_details(mode, start, end, company, model).iterator(chunk_size=REPORT_CHUNK_SIZE)
+        for model in (ArchivedInvoiceDetail, InvoiceDetail)
+    ]
+    for group, rows in groupby(heapq.merge(*queries, key=key), key=key):
+        invoices = lines = quantity = 0
+        amount = Decimal('0')
+        for row in rows:
+            invoices += row[width]
+            lines += row[width + 1]
+            quantity += row[width + 2]
+            amount += row[width + 3]
+        amount = amount.quantize(CENTS)
+        if mode == 'item':
+            yield [group[0], invoices, lines, quantity, amount]
+        elif mode == 'invoice':
+            yield [group[2], format_created_at(group[0]), lines, quantity, amount]
+        else:
+            yield [timezone.localtime(group[0]).strftime('%Y-%m'), invoices, lines, quantity, amount]
+
+
+def write_report_workbook(path, mode, rows, title):
+    """集計結果を合計行付きのサマリーシートに出力（write_only で逐次書き出し）"""
+    import openpyxl
+
+    headers = REPORT_HEADERS[mode]
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet(sheet_title(title, REPORT_MODES[mode]))
+    sheet.append(header_cells(sheet, headers))
+    lines = quantity = 0
+    amount = Decimal('0')
+    for row in rows:
+        sheet.append(row)
+        lines += row[2]
+        quantity += row[3]
+        amount += row[4]
+    sheet.append(['合計', *[None] * (len(headers) - 4), lines, quantity, amount])
+    book.save(str(path))
+
+
+def iter_report_csv(mode, rows):
+    """集計結果を CSV のテキスト片として逐次生成"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_HEADERS[mode])
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % TEXT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_report_jsonl(mode, rows):
+    """集計結果を JSON Lines のテキスト片として逐次生成（金額は精度を保つため文字列）"""
+    keys = REPORT_KEYS[mode]
+    lines = []
+    for row in rows:
+        row[-1] = str(row[-1])
+        lines.append(json.dumps(dict(zip(keys, row)), ensure_ascii=False))
+        if len(lines) >= TEXT_FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+TEXT_WRITERS = {
+    'csv': iter_report_csv,
+    'jsonl': iter_report_jsonl,
+}
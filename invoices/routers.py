@@ -0,0 +1,149 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import FileResponse
+
+# 読み取り専用の集計・出力中に読み取りに使うデータベース（None は通常どおり default）
+_read_alias = ContextVar('invoices_read_alias', default=None)
+
+# 請求書作成直後のユーザーをプライマリに固定するキー
+PIN_CACHE_KEY = 'invoices:replica_pin:{}'
+
+# レプリカを最後に同期した時刻（refresh_replica コマンドが記録）
+SYNCED_AT_CACHE_KEY = 'invoices:replica:synced_at'
+
+
+class ReplicaRouter:
+    """集計・出力の読み取りをレプリカへ振り分けるルーター
+
+    replica_reads() の中で実行されるクエリの読み取りだけをレプリカへ送り、
+    それ以外（書き込み・通常の画面）は常に default を使う。
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカは default の複製なので同じデータとして扱う
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカのスキーマは同期で default から写す
+        return db != settings.REPLICA_DATABASE_ALIAS
+
+
+def replica_alias():
+    """設定済みのレプリカのエイリアス（未設定なら None）"""
+    alias = settings.REPLICA_DATABASE_ALIAS
+    return alias if alias in connections.settings else None
+
+
+def pin_primary(user):
+    """データを書き込んだユーザーの読み取りを遅延許容時間だけプライマリに固定（自分の書き込みを必ず読めるように）"""
+    if settings.REPLICA_LAG_TOLERANCE > 0 and user.is_authenticated:
+        cache.set(PIN_CACHE_KEY.format(user.pk), True, settings.REPLICA_LAG_TOLERANCE)
+
+
+def replica_lag():
+    """最後の同期からの経過秒数（同期時刻が記録されていなければ None）"""
+    synced_at = cache.get(SYNCED_AT_CACHE_KEY)
+    return None if synced_at is None else time.time() - synced_at
+
+
+def choose_read_alias(user=None):
+    """読み取りに使うデータベースを決定
+
+    レプリカが未設定・ユーザーがプライマリに固定中・レプリカの遅延が
+    許容時間を超えている（同期時刻が分からない場合を含む）場合は None（default）を返す。
+    """
+    alias = replica_alias()
+    if alias is None:
+        return None
+    if user is not None and user.is_authenticated and cache.get(PIN_CACHE_KEY.format(user.pk)):
+        return None
+    # 一度も同期していない・キャッシュから同期時刻が消えたレプリカは古いものとして扱う
+    lag = replica_lag()
+    if lag is None or lag > settings.REPLICA_LAG_TOLERANCE:
+        return None
+    return alias
+
+
+@contextmanager
+def replica_reads(user=None):
+    """ブロック内の読み取りをレプリカへ送る（使えない場合は default のまま）"""
+    token = _read_alias.set(choose_read_alias(user))
+    try:
+        yield _read_alias.get()
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """ブロック内の読み取りを default から行う（replica_reads の中でキャッシュへ保存する出力を作る場合）"""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _stream_with_alias(content, alias):
+    """ストリーミング中のクエリも同じデータベースから読む"""
+    token = _read_alias.set(alias)
+    try:
+        yield from content
+    finally:
+        _read_alias.reset(token)
+
+
+def use_replica(view):
+    """読み取り専用のビューのクエリをレプリカへ送るデコレーター
+
+    ストリーミングのレスポンスはビューを抜けた後にクエリを実行するため、
+    読み出し中も同じデータベースを使うようにする。
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request.user) as alias:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        if alias and response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _stream_with_alias(response.streaming_content, alias)
+        return response
+    return wrapper
+
+
+def refresh_replica(source='default', target=None, pages=-1):
+    """SQLite の backup API で default をレプリカのファイルへ複製し、同期時刻を記録"""
+    target = target or replica_alias()
+    if target is None:
+        raise ValueError('レプリカのデータベースが設定されていません')
+    source_connection = connections[source]
+    if source_connection.vendor != 'sqlite':
+        raise ValueError('backup API による同期は SQLite のみ対応しています')
+
+    target_name = str(connections[target].settings_dict['NAME'])
+    if target_name == str(source_connection.settings_dict['NAME']):
+        raise ValueError('レプリカが default と同じファイルを指しています')
+
+    source_connection.ensure_connection()
+    started = time.time()
+    destination = sqlite3.connect(target_name)
+    try:
+        source_connection.connection.backup(destination, pages=pages)
+    finally:
+        destination.close()
+    # 複製の開始時点までの書き込みが反映されている
+    cache.set(SYNCED_AT_CACHE_KEY, started, None)
+    return time.time() - started
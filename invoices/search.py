@@ -0,0 +1,324 @@
+import heapq
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from operator import attrgetter
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import ArchivedInvoice, Invoice
+
+# 全文検索用の FTS5 仮想テーブル（rowid は請求書ID。保管済みの請求書も元の ID のまま登録）
+SEARCH_TABLE = 'invoices_search'
+
+# 索引の元になる (請求書, 明細) のテーブル（作業用・保管用）
+SOURCE_TABLES = (
+    ('invoices_invoice', 'invoices_invoicedetail'),
+    ('invoices_archivedinvoice', 'invoices_archivedinvoicedetail'),
+)
+
+# trigram トークナイザーは3文字以上の語のみ索引で検索できる
+MIN_TERM_LENGTH = 3
+
+# 再構築時に1回で登録する請求書IDの範囲
+REBUILD_BATCH_SIZE = 5000
+
+# 検索結果の1ページの件数
+PAGE_SIZE = 20
+
+# bm25 の列ごとの重み（請求書番号, 会社コード, 会社名, 請求内容）
+RANK_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    invoice_number, company_code, company_name, item_names,
+    tokenize = 'trigram'
+)
+"""
+
+
+def _insert_sql(where, tables=SOURCE_TABLES[0]):
+    """条件に一致する請求書の索引を登録する SQL（明細の請求内容はまとめて1列にする）"""
+    invoice_table, detail_table = tables
+    return f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, invoice_number, company_code, company_name, item_names)
+    SELECT i.id, i.invoice_number, c.company_code, c.company_name,
+           COALESCE((SELECT group_concat(d.item_name, ' ') FROM {detail_table} d
+                     WHERE d.invoice_id = i.id), '')
+    FROM {invoice_table} i
+    JOIN invoices_company c ON c.id = i.company_id
+    WHERE {where};
+    """
+
+
+def _refresh_sql(invoice_id):
+    """請求書1件の索引を作り直す SQL（トリガー本体用）"""
+    return f'DELETE FROM {SEARCH_TABLE} WHERE rowid = {invoice_id};' + _insert_sql(f'i.id = {invoice_id}')
+
+
+# 書き込みと同じトランザクションで索引を更新するトリガー
+# （bulk_create・一括取込の upsert・管理画面の編集もすべて反映される）。
+# Django の save() は全列を UPDATE するため、索引の内容が変わる場合だけ作り直す。
+# 明細の追加は1行ごとに作り直すと明細数の2乗の処理になるため、トリガーではなく
+# post_save（signals.py）から請求書ごとにまとめて反映する（batched_refresh を参照）。
+# 保管（archive.py）で作業用テーブルから削除する請求書は、保管テーブルに同じ ID・
+# 同じ内容で登録済みのため索引をそのまま残す。
+_NOT_ARCHIVED = 'NOT EXISTS (SELECT 1 FROM invoices_archivedinvoice WHERE id = OLD.{})'
+
+TRIGGERS = {
+    'invoices_search_invoice_ai': f"""
+        AFTER INSERT ON invoices_invoice BEGIN {_insert_sql('i.id = NEW.id')} END
+    """,
+    'invoices_search_invoice_au': f"""
+        AFTER UPDATE OF invoice_number, company_id ON invoices_invoice
+        WHEN OLD.invoice_number IS NOT NEW.invoice_number OR OLD.company_id IS NOT NEW.company_id
+        BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+            {_insert_sql('i.id = NEW.id')}
+        END
+    """,
+    'invoices_search_invoice_ad': f"""
+        AFTER DELETE ON invoices_invoice WHEN {_NOT_ARCHIVED.format('id')} BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+        END
+    """,
+    'invoices_search_detail_au': f"""
+        AFTER UPDATE OF item_name, invoice_id ON invoices_invoicedetail
+        WHEN OLD.item_name IS NOT NEW.item_name OR OLD.invoice_id IS NOT NEW.invoice_id
+        BEGIN
+            {_refresh_sql('OLD.invoice_id')}
+            {_refresh_sql('NEW.invoice_id')}
+        END
+    """,
+    'invoices_search_detail_ad': f"""
+        AFTER DELETE ON invoices_invoicedetail WHEN {_NOT_ARCHIVED.format('invoice_id')} BEGIN
+            {_refresh_sql('OLD.invoice_id')}
+        END
+    """,
+    'invoices_search_company_au': f"""
+        AFTER UPDATE OF company_code, company_name ON invoices_company
+        WHEN OLD.company_code IS NOT NEW.company_code OR OLD.company_name IS NOT NEW.company_name
+        BEGIN
+            DELETE FROM {SEARCH_TABLE}
+                WHERE rowid IN (SELECT id FROM invoices_invoice WHERE company_id = NEW.id);
+            {_insert_sql('i.company_id = NEW.id')}
+            DELETE FROM {SEARCH_TABLE}
+                WHERE rowid IN (SELECT id FROM invoices_archivedinvoice WHERE company_id = NEW.id);
+            {_insert_sql('i.company_id = NEW.id', SOURCE_TABLES[1])}
+        END
+    """,
+    'invoices_search_archived_ad': f"""
+        AFTER DELETE ON invoices_archivedinvoice BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id;
+        END
+    """,
+}
+
+# 以前のバージョンで作成していたトリガー（マイグレーション時に削除する）
+RETIRED_TRIGGERS = ('invoices_search_detail_ai',)
+
+# batched_refresh の中で明細を追加した請求書ID（ブロックの終わりにまとめて反映）
+_pending_refresh = ContextVar('invoices_search_pending_refresh', default=None)
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """FTS5 の索引が使えるか（SQLite で索引テーブルが作成済み）"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    return SEARCH_TABLE in connection.introspection.table_names()
+
+
+def create_table(cursor):
+    """索引テーブルを作成（FTS5 が使えない SQLite では False を返す）"""
+    try:
+        cursor.execute(CREATE_TABLE_SQL)
+    except OperationalError:
+        return False
+    return True
+
+
+def install_triggers(cursor):
+    """索引を更新するトリガーを作成
+
+    SQLite の列追加などのマイグレーションはテーブルを作り直すため、
+    マイグレーション中はトリガーを外しておく（signals.py を参照）。
+    """
+    for name, body in TRIGGERS.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+
+
+def drop_triggers(cursor):
+    for name in (*TRIGGERS, *RETIRED_TRIGGERS):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def uninstall(cursor):
+    """索引テーブルとトリガーを削除"""
+    drop_triggers(cursor)
+    cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def refresh_invoices(invoice_ids, using=DEFAULT_DB_ALIAS):
+    """請求書の索引を作り直す（明細をまとめて追加した後に請求書ごとに1回）"""
+    invoice_ids = sorted(set(invoice_ids))
+    if not invoice_ids or not is_available(using):
+        return
+    placeholders = ', '.join(['%s'] * len(invoice_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', invoice_ids)
+        for tables in SOURCE_TABLES:
+            cursor.execute(_insert_sql(f'i.id IN ({placeholders})', tables), invoice_ids)
+
+
+def detail_added(invoice_id, using=DEFAULT_DB_ALIAS):
+    """明細の追加を索引に反映（batched_refresh の中ではブロックの終わりまで待つ）"""
+    pending = _pending_refresh.get()
+    if pending is not None:
+        pending.add((using, invoice_id))
+    else:
+        refresh_invoices([invoice_id], using)
+
+
+@contextmanager
+def batched_refresh():
+    """ブロック内で明細を追加した請求書の索引を、ブロックの終わりに1回だけ作り直す"""
+    if _pending_refresh.get() is not None:
+        yield
+        return
+    pending = set()
+    token = _pending_refresh.set(pending)
+    try:
+        yield
+    finally:
+        _pending_refresh.reset(token)
+    for alias in {alias for alias, _ in pending}:
+        refresh_invoices([invoice_id for using, invoice_id in pending if using == alias], alias)
+
+
+def index_tables(tables, batch_size=REBUILD_BATCH_SIZE, progress=None, using=DEFAULT_DB_ALIAS, total=0):
+    """(請求書, 明細) のテーブルの全請求書を請求書IDの範囲ごとにバッチで登録し、累計件数を返す"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {tables[0]}')
+        max_id = cursor.fetchone()[0]
+        for start in range(0, max_id, batch_size):
+            with transaction.atomic(using=using):
+                cursor.execute(_insert_sql('i.id > %s AND i.id <= %s', tables), [start, start + batch_size])
+                total += cursor.rowcount
+            if progress:
+                progress(total)
+    return total
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE, progress=None, triggers=True, using=DEFAULT_DB_ALIAS):
+    """索引を全件作り直す（作業用・保管用の請求書を ID の範囲ごとにバッチで登録）。登録件数を返す"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if not create_table(cursor):
+            raise OperationalError('この SQLite では FTS5 を使用できません')
+        if triggers:
+            install_triggers(cursor)
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+        total = 0
+        existing = connection.introspection.table_names(cursor)
+        for tables in SOURCE_TABLES:
+            # 保管テーブルは後のマイグレーションで作成される
+            if tables[0] in existing:
+                total = index_tables(tables, batch_size, progress, using, total)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def _match_expression(terms):
+    """検索語を FTS5 の検索式に変換（各語をフレーズとして AND 検索）"""
+    return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _use_index(terms, using=DEFAULT_DB_ALIAS):
+    return bool(terms) and is_available(using) and all(len(term) >= MIN_TERM_LENGTH for term in terms)
+
+
+def matching_ids(query, offset=0, limit=None, user=None, using=DEFAULT_DB_ALIAS):
+    """検索語に一致する請求書IDを関連度順に返す（索引が使えない場合は None）
+
+    user を指定するとそのユーザーが作成した請求書だけを返す。
+    """
+    terms = query.split()
+    if not _use_index(terms, using):
+        return None
+    sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    params = [_match_expression(terms)]
+    if user is not None:
+        sql += (
+            ' AND rowid IN (SELECT id FROM invoices_invoice WHERE created_by_id = %s'
+            ' UNION ALL SELECT id FROM invoices_archivedinvoice WHERE created_by_id = %s)'
+        )
+        params += [user.pk, user.pk]
+    sql += f' ORDER BY bm25({SEARCH_TABLE}, %s, %s, %s, %s)'
+    params += RANK_WEIGHTS
+    if limit is not None:
+        sql += ' LIMIT %s OFFSET %s'
+        params += [limit, offset]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def match_subquery(query):
+    """検索語に一致する請求書IDのサブクエリ（pk__in 用、索引が使えない場合は None）"""
+    terms = query.split()
+    if not _use_index(terms):
+        return None
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [_match_expression(terms)],
+    )
+
+
+def fallback_condition(terms):
+    """索引を使わない部分一致の検索条件（すべての語を含む請求書）"""
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(invoice_number__icontains=term)
+            | Q(company__company_code__icontains=term)
+            | Q(company__company_name__icontains=term)
+            | Q(details__item_name__icontains=term)
+        )
+    return condition
+
+
+def search_invoices(query, offset=0, limit=PAGE_SIZE, user=None):
+    """請求書を検索し、(請求書のリスト, 次ページの有無) を返す
+
+    FTS5 の索引が使える場合は関連度順、使えない場合（他のデータベース・
+    3文字未満の語を含む検索）は部分一致で作成日時の新しい順に返す。
+    user を指定するとそのユーザーが作成した請求書だけを検索する。
+    索引は請求書の読み取りと同じデータベース（レプリカを含む）で検索する。
+    保管済みの請求書（ArchivedInvoice）も検索対象に含む。
+    """
+    terms = query.split()
+    if not terms:
+        return [], False
+
+    using = router.db_for_read(Invoice)
+    ids = matching_ids(query, offset, limit + 1, user=user, using=using)
+    if ids is not None:
+        invoices = {}
+        for model in (ArchivedInvoice, Invoice):
+            invoices.update(model.objects.using(using).in_bulk(ids[:limit]))
+        return [invoices[pk] for pk in ids[:limit] if pk in invoices], len(ids) > limit
+
+    # 作業用・保管用のそれぞれから先頭の offset + limit + 1 件を取り、新しい順に突き合わせる
+    querysets = []
+    for model in (Invoice, ArchivedInvoice):
+        queryset = model.objects.using(using).filter(fallback_condition(terms))
+        if user is not None:
+            queryset = queryset.filter(created_by=user)
+        querysets.append(queryset.distinct().order_by('-created_at', '-id')[:offset + limit + 1])
+    invoices = heapq.merge(*querysets, key=attrgetter('created_at', 'id'), reverse=True)
+    invoices = list(islice(invoices, offset, offset + limit + 1))
+    return invoices[:limit], len(invoices) > limit
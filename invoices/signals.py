@@ -0,0 +1,68 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
+from django.dispatch import receiver
+
+from . import catalog, ledger_version, search
+from .backends import invalidate_user_cache
+from .models import CustomUser, Invoice, InvoiceDetail, InvoiceItemTemplate
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def clear_user_cache(sender, instance, **kwargs):
+    """ユーザーの保存・削除時にキャッシュを無効化（権限変更・削除を即時反映）"""
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_save, sender=InvoiceItemTemplate)
+@receiver(post_delete, sender=InvoiceItemTemplate)
+def bump_item_catalog(sender, instance, **kwargs):
+    """請求書項目の保存・削除時にカタログのバージョンを上げる（コミット後に反映）"""
+    transaction.on_commit(catalog.bump_version)
+
+
+@receiver(post_save, sender=Invoice)
+def bump_ledger_version(sender, instance, using, **kwargs):
+    """請求書の保存時に取引履歴のバージョンを上げる（コミット後に反映）
+
+    削除は post_delete を受け取ると一括削除が1行ずつの読み込みになるため、
+    保管・完全削除・管理サイトから ledger_version.bump_after_commit で上げる。
+    """
+    ledger_version.bump_after_commit([instance.company_id], using=using)
+
+
+@receiver(post_save, sender=InvoiceDetail)
+def bump_ledger_version_for_detail(sender, instance, using, **kwargs):
+    """明細の保存時に取引履歴のバージョンを上げる（同じトランザクションの請求書の更新にまとめる）"""
+    ledger_version.bump_after_commit([instance.invoice.company_id], using=using)
+
+
+@receiver(post_save, sender=InvoiceDetail)
+def index_added_detail(sender, instance, created, using, **kwargs):
+    """追加した明細の請求内容を全文検索の索引に反映（変更・削除はトリガーで反映）"""
+    if created:
+        search.detail_added(instance.invoice_id, using)
+
+
+@receiver(pre_migrate)
+def drop_search_triggers(sender, using, **kwargs):
+    """マイグレーション前に全文検索のトリガーを外す
+
+    SQLite の列追加などはテーブルを作り直すため、作り直し中のテーブルを
+    参照するトリガーがあるとマイグレーションが失敗する。
+    """
+    if sender.name != 'invoices' or connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        search.drop_triggers(cursor)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """マイグレーション後に全文検索のトリガーを戻す（索引テーブルがある場合）"""
+    connection = connections[using]
+    if sender.name != 'invoices' or connection.vendor != 'sqlite':
+        return
+    if search.SEARCH_TABLE in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            search.install_triggers(cursor)
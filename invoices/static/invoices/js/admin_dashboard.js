@@ -0,0 +1,383 @@
+// URLはテンプレートの <body> の data 属性から取得
+const urls = {
+    addCompany: document.body.dataset.addCompanyUrl,
+    addInvoiceItem: document.body.dataset.addInvoiceItemUrl,
+    addUser: document.body.dataset.addUserUrl,
+    deleteUser: document.body.dataset.deleteUserUrl,
+    deleteCompany: document.body.dataset.deleteCompanyUrl,
+    companyInfo: document.body.dataset.companyInfoUrl,
+};
+
+// 全角→半角変換関数
+function toHalfWidth(str) {
+    return str.replace(/[Ａ-Ｚａ-ｚ０-９]/g, function(s) {
+        return String.fromCharCode(s.charCodeAt(0) - 0xFEE0);
+    });
+}
+
+// 会社コードは自動生成されるため、入力不可（readonly）
+
+// 郵便番号入力：都道府県・市区町村を自動入力（重複入力を防ぐ）
+const dashboardPostalCodeInput = document.getElementById('dashboard_postal_code');
+let dashboardPostalCodeTimeout;
+let dashboardPostalCodeHandler = null;
+
+dashboardPostalCodeHandler = function(e) {
+    let value = e.target.value;
+    // 全角数字を半角に変換
+    value = toHalfWidth(value);
+    // 数字以外を削除
+    let postalCode = value.replace(/[^0-9]/g, '');
+
+    if (e.target.value !== postalCode) {
+        // イベントリスナーを一時的に削除
+        dashboardPostalCodeInput.removeEventListener('input', dashboardPostalCodeHandler);
+
+        const cursorPos = e.target.selectionStart;
+        e.target.value = postalCode;
+        // カーソル位置を調整
+        const newCursorPos = Math.min(cursorPos, postalCode.length);
+        e.target.setSelectionRange(newCursorPos, newCursorPos);
+
+        // イベントリスナーを再度追加（次のフレームで）
+        setTimeout(() => {
+            dashboardPostalCodeInput.addEventListener('input', dashboardPostalCodeHandler);
+        }, 0);
+    }
+
+    clearTimeout(dashboardPostalCodeTimeout);
+
+    if (postalCode.length === 7) {
+        dashboardPostalCodeTimeout = setTimeout(() => {
+            fetchDashboardPostalCode(postalCode);
+        }, 500);
+    } else if (postalCode.length < 7) {
+        // 郵便番号が不完全な場合はクリア
+        document.getElementById('dashboard_prefecture').value = '';
+        document.getElementById('dashboard_city').value = '';
+    }
+};
+
+dashboardPostalCodeInput.addEventListener('input', dashboardPostalCodeHandler);
+
+async function fetchDashboardPostalCode(postalCode) {
+    try {
+        const response = await fetch(`https://zipcloud.ibsnet.co.jp/api/search?zipcode=${postalCode}`);
+        const data = await response.json();
+
+        if (data.status === 200 && data.results && data.results.length > 0) {
+            const result = data.results[0];
+            // 都道府県をセレクトボックスに設定
+            const prefectureSelect = document.getElementById('dashboard_prefecture');
+            const prefectureName = result.address1; // 都道府県名
+            for (let i = 0; i < prefectureSelect.options.length; i++) {
+                if (prefectureSelect.options[i].value === prefectureName) {
+                    prefectureSelect.selectedIndex = i;
+                    break;
+                }
+            }
+            // 市区町村を入力
+            document.getElementById('dashboard_city').value = result.address2 + (result.address3 ? result.address3 : '');
+        } else {
+            // 郵便番号が見つからない場合
+            console.log('郵便番号が見つかりませんでした');
+        }
+    } catch (error) {
+        console.error('郵便番号検索エラー:', error);
+    }
+}
+
+// 市区町村入力欄：全角数字を半角に変換（重複入力を防ぐ）
+const dashboardCityInput = document.getElementById('dashboard_city');
+let dashboardCityHandler = null;
+
+dashboardCityHandler = function(e) {
+    const value = e.target.value;
+    // 全角数字のみを半角に変換（他の文字はそのまま）
+    const converted = value.replace(/[０-９]/g, function(s) {
+        return String.fromCharCode(s.charCodeAt(0) - 0xFEE0);
+    });
+
+    if (value !== converted) {
+        // イベントリスナーを一時的に削除
+        dashboardCityInput.removeEventListener('input', dashboardCityHandler);
+
+        const cursorPos = e.target.selectionStart;
+        e.target.value = converted;
+
+        // カーソル位置を調整
+        const newCursorPos = Math.min(cursorPos, converted.length);
+        e.target.setSelectionRange(newCursorPos, newCursorPos);
+
+        // イベントリスナーを再度追加（次のフレームで）
+        setTimeout(() => {
+            dashboardCityInput.addEventListener('input', dashboardCityHandler);
+        }, 0);
+    }
+};
+
+dashboardCityInput.addEventListener('input', dashboardCityHandler);
+
+// 電話番号入力：数字のみ、半角変換、警告（重複入力を防ぐ）
+const dashboardPhoneInput = document.getElementById('dashboard_phone');
+let dashboardPhoneHandler = null;
+
+dashboardPhoneHandler = function(e) {
+    let value = e.target.value;
+    const originalValue = value;
+    // 全角数字を半角に変換
+    value = toHalfWidth(value);
+    // 数字以外を削除
+    const numbersOnly = value.replace(/[^0-9]/g, '');
+
+    if (originalValue !== numbersOnly) {
+        // イベントリスナーを一時的に削除
+        dashboardPhoneInput.removeEventListener('input', dashboardPhoneHandler);
+
+        const cursorPos = e.target.selectionStart;
+
+        if (value !== numbersOnly) {
+            // 数字以外が入力された場合、警告を表示
+            alert('電話番号は数字のみ入力してください（ハイフン不要）');
+        }
+
+        e.target.value = numbersOnly;
+        // カーソル位置を調整
+        const newCursorPos = Math.min(cursorPos, numbersOnly.length);
+        e.target.setSelectionRange(newCursorPos, newCursorPos);
+
+        // イベントリスナーを再度追加（次のフレームで）
+        setTimeout(() => {
+            dashboardPhoneInput.addEventListener('input', dashboardPhoneHandler);
+        }, 0);
+    }
+};
+
+dashboardPhoneInput.addEventListener('input', dashboardPhoneHandler);
+
+// 取引先会社追加
+document.getElementById('addCompanyForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    // 市区町村フィールドをaddressに追加（既存のaddressフィールドと結合）
+    const city = document.getElementById('dashboard_city').value;
+    const prefecture = document.getElementById('dashboard_prefecture').value;
+    const address = document.getElementById('dashboard_address').value;
+
+    // フォームデータを作成
+    const formData = new FormData(this);
+    // addressに都道府県と市区町村を追加（既存のaddressは番地として扱う）
+    if (city && prefecture && address) {
+        formData.set('address', prefecture + city + address);
+    } else if (city && prefecture) {
+        formData.set('address', prefecture + city);
+    }
+
+    // 会社コードは自動生成されるため、hidden inputの値を使用（disabled inputは送信されないため）
+    const companyCode = document.querySelector('input[name="company_code"][type="hidden"]').value;
+    formData.set('company_code', companyCode);
+
+    try {
+        const response = await fetch(urls.addCompany, {
+            method: 'POST',
+            body: formData,
+            headers: {
+                'X-CSRFToken': formData.get('csrfmiddlewaretoken')
+            }
+        });
+
+        const data = await response.json();
+        if (data.success) {
+            alert(data.message);
+            location.reload();
+        } else {
+            alert('エラー: ' + data.error);
+        }
+    } catch (error) {
+        alert('エラーが発生しました: ' + error);
+    }
+});
+
+// 請求書項目追加
+document.getElementById('addInvoiceItemForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    const formData = new FormData(this);
+
+    try {
+        const response = await fetch(urls.addInvoiceItem, {
+            method: 'POST',
+            body: formData,
+            headers: {
+                'X-CSRFToken': formData.get('csrfmiddlewaretoken')
+            }
+        });
+
+        const data = await response.json();
+        if (data.success) {
+            alert(data.message);
+            this.reset();
+        } else {
+            alert('エラー: ' + data.error);
+        }
+    } catch (error) {
+        alert('エラーが発生しました: ' + error);
+    }
+});
+
+// ユーザー追加（管理者以上のみフォームが表示される）
+document.getElementById('addUserForm')?.addEventListener('submit', async function(e) {
+    e.preventDefault();
+    const formData = new FormData(this);
+
+    try {
+        const response = await fetch(urls.addUser, {
+            method: 'POST',
+            body: formData,
+            headers: {
+                'X-CSRFToken': formData.get('csrfmiddlewaretoken')
+            }
+        });
+
+        const data = await response.json();
+        if (data.success) {
+            alert(data.message);
+            location.reload();
+        } else {
+            alert('エラー: ' + data.error);
+        }
+    } catch (error) {
+        alert('エラーが発生しました: ' + error);
+    }
+});
+
+// ユーザー削除
+async function deleteUser(userId) {
+    if (!confirm('このユーザーを削除しますか？')) {
+        return;
+    }
+
+    const csrftoken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    try {
+        const response = await fetch(urls.deleteUser.replace('0', userId), {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrftoken
+            }
+        });
+
+        const data = await response.json();
+        if (data.success) {
+            alert(data.message);
+            location.reload();
+        } else {
+            alert('エラー: ' + data.error);
+        }
+    } catch (error) {
+        alert('エラーが発生しました: ' + error);
+    }
+}
+
+// 管理画面の請求書作成機能
+// 会社コード入力時の自動入力
+let adminCompanyCodeTimeout;
+document.getElementById('admin_company_code').addEventListener('input', function() {
+    const companyCode = this.value.toUpperCase();
+    clearTimeout(adminCompanyCodeTimeout);
+
+    if (companyCode.length >= 2) {
+        adminCompanyCodeTimeout = setTimeout(() => {
+            loadAdminCompanyInfo(companyCode);
+        }, 500);
+    } else {
+        document.getElementById('admin_companyInfo').style.display = 'none';
+    }
+});
+
+async function loadAdminCompanyInfo(companyCode) {
+    const loadingEl = document.getElementById('admin_loading');
+    const companyInfoEl = document.getElementById('admin_companyInfo');
+
+    loadingEl.style.display = 'block';
+    companyInfoEl.style.display = 'none';
+
+    try {
+        const response = await fetch(`${urls.companyInfo}?company_code=${companyCode}`);
+        const data = await response.json();
+
+        if (data.success) {
+            const company = data.company;
+            document.getElementById('admin_company_name').textContent = company.company_name;
+            document.getElementById('admin_contact_person').textContent = company.contact_person;
+            document.getElementById('admin_address').textContent = company.address;
+            document.getElementById('admin_postal_prefecture').textContent = `${company.postal_code} ${company.prefecture}`;
+            document.getElementById('admin_phone').textContent = company.phone;
+            document.getElementById('admin_email').textContent = company.email;
+            companyInfoEl.style.display = 'block';
+        } else {
+            companyInfoEl.style.display = 'none';
+            if (companyCode.length >= 3) {
+                alert('会社コードが見つかりません: ' + data.error);
+            }
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        companyInfoEl.style.display = 'none';
+    } finally {
+        loadingEl.style.display = 'none';
+    }
+}
+
+// 金額計算（管理画面用）
+function calculateAdminAmount(input) {
+    const row = input.closest('.admin-item-row');
+    const quantity = parseFloat(row.querySelector('.admin-item-quantity').value) || 0;
+    const price = parseFloat(row.querySelector('.admin-item-price').value) || 0;
+    const amount = quantity * price;
+    row.querySelector('.admin-item-amount').value = amount.toFixed(2);
+}
+
+// フォームクリア（管理画面用）
+function clearAdminForm() {
+    if (confirm('入力内容をクリアしますか？')) {
+        document.getElementById('invoiceForm').reset();
+        document.getElementById('admin_companyInfo').style.display = 'none';
+        // 金額を再計算
+        document.querySelectorAll('.admin-item-row').forEach(row => {
+            calculateAdminAmount(row.querySelector('.admin-item-quantity'));
+        });
+    }
+}
+
+// 現在の年月を設定
+const now = new Date();
+document.getElementById('year').value = now.getFullYear();
+document.getElementById('month').value = now.getMonth() + 1;
+
+// 会社の無効化（請求書の履歴は残る。完全削除は取引先会社の管理画面から行う）
+async function deleteCompany(companyId) {
+    if (!confirm('この取引先会社を無効化しますか？\n請求書作成の検索・選択肢に表示されなくなります（請求書の履歴は残ります）。')) {
+        return;
+    }
+
+    const csrftoken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    try {
+        const response = await fetch(urls.deleteCompany.replace('0', companyId), {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrftoken
+            }
+        });
+
+        const data = await response.json();
+        if (data.success) {
+            alert(data.message);
+            location.reload();
+        } else {
+            alert('エラー: ' + data.error);
+        }
+    } catch (error) {
+        alert('エラーが発生しました: ' + error);
+    }
+}
@@ -0,0 +1,229 @@
+// 検索可能なセレクトボックス
+const companySearch = document.getElementById('company_search');
+const companyCodeSelect = document.getElementById('company_code');
+const companyDropdown = document.getElementById('company_dropdown');
+const companies = Array.from(companyCodeSelect.options).slice(1).map(option => ({
+    code: option.value,
+    name: option.dataset.name,
+    text: option.textContent
+}));
+
+let selectedCompanyCode = '';
+
+// 検索入力時の処理
+companySearch.addEventListener('input', function() {
+    const searchTerm = this.value.toLowerCase().trim();
+
+    if (searchTerm === '') {
+        companyDropdown.style.display = 'none';
+        companyCodeSelect.value = '';
+        selectedCompanyCode = '';
+        document.getElementById('companyInfo').style.display = 'none';
+        return;
+    }
+
+    // 部分一致で検索（会社コードまたは会社名）
+    const filtered = companies.filter(company => 
+        company.code.toLowerCase().includes(searchTerm) || 
+        company.name.toLowerCase().includes(searchTerm) ||
+        company.text.toLowerCase().includes(searchTerm)
+    );
+
+    if (filtered.length === 0) {
+        companyDropdown.innerHTML = '<div style="padding: 15px; color: #999; text-align: center;">該当する取引先会社が見つかりません</div>';
+        companyDropdown.style.display = 'block';
+        return;
+    }
+
+    // ドロップダウンに結果を表示
+    companyDropdown.innerHTML = filtered.map(company => 
+        `<div class="company-option" data-code="${company.code}" style="padding: 12px 15px; cursor: pointer; border-bottom: 1px solid #f0f0f0; transition: background 0.2s;">
+            <div style="font-weight: 600; color: #333;">${company.code}</div>
+            <div style="font-size: 12px; color: #666; margin-top: 2px;">${company.name}</div>
+        </div>`
+    ).join('');
+
+    companyDropdown.style.display = 'block';
+
+    // クリックイベントを追加
+    companyDropdown.querySelectorAll('.company-option').forEach(option => {
+    option.addEventListener('click', function() {
+        const code = this.dataset.code;
+        selectedCompanyCode = code;
+        companyCodeSelect.value = code;
+        companySearch.value = companies.find(c => c.code === code).text;
+        companyDropdown.style.display = 'none';
+        loadCompanyInfo(code);
+        generateInvoiceNumber(code);
+    });
+
+        option.addEventListener('mouseenter', function() {
+            this.style.backgroundColor = '#f5f5f5';
+        });
+
+        option.addEventListener('mouseleave', function() {
+            this.style.backgroundColor = 'white';
+        });
+    });
+});
+
+// フォーカス時の処理
+companySearch.addEventListener('focus', function() {
+    if (this.value.trim() !== '') {
+        this.dispatchEvent(new Event('input'));
+    }
+});
+
+// 外部クリックでドロップダウンを閉じる
+document.addEventListener('click', function(e) {
+    if (!companySearch.contains(e.target) && !companyDropdown.contains(e.target)) {
+        companyDropdown.style.display = 'none';
+    }
+});
+
+// キーボード操作
+companySearch.addEventListener('keydown', function(e) {
+    const options = companyDropdown.querySelectorAll('.company-option');
+    let currentIndex = -1;
+
+    options.forEach((opt, idx) => {
+        if (opt.style.backgroundColor === 'rgb(245, 245, 245)') {
+            currentIndex = idx;
+        }
+    });
+
+    if (e.key === 'ArrowDown') {
+        e.preventDefault();
+        currentIndex = (currentIndex + 1) % options.length;
+        options.forEach(opt => opt.style.backgroundColor = 'white');
+        if (options[currentIndex]) {
+            options[currentIndex].style.backgroundColor = '#f5f5f5';
+            options[currentIndex].scrollIntoView({ block: 'nearest' });
+        }
+    } else if (e.key === 'ArrowUp') {
+        e.preventDefault();
+        currentIndex = currentIndex <= 0 ? options.length - 1 : currentIndex - 1;
+        options.forEach(opt => opt.style.backgroundColor = 'white');
+        if (options[currentIndex]) {
+            options[currentIndex].style.backgroundColor = '#f5f5f5';
+            options[currentIndex].scrollIntoView({ block: 'nearest' });
+        }
+    } else if (e.key === 'Enter') {
+        e.preventDefault();
+        if (options[currentIndex]) {
+            options[currentIndex].click();
+        } else if (options.length > 0) {
+            options[0].click();
+        }
+    } else if (e.key === 'Escape') {
+        companyDropdown.style.display = 'none';
+    }
+});
+
+// 請求書番号を自動生成（会社コード_YYYY_MM_DD形式）
+function generateInvoiceNumber(companyCode) {
+    if (!companyCode) {
+        document.getElementById('invoice_number').value = '';
+        document.getElementById('invoice_number_hidden').value = '';
+        return;
+    }
+
+    const now = new Date();
+    const year = now.getFullYear();
+    const month = String(now.getMonth() + 1).padStart(2, '0');
+    const day = String(now.getDate()).padStart(2, '0');
+    const invoiceNumber = `${companyCode}_${year}_${month}_${day}`;
+
+    document.getElementById('invoice_number').value = invoiceNumber;
+    document.getElementById('invoice_number_hidden').value = invoiceNumber;
+}
+
+async function loadCompanyInfo(companyCode) {
+    const companyInfoEl = document.getElementById('companyInfo');
+
+    try {
+        const response = await fetch(`${document.body.dataset.companyInfoUrl}?company_code=${companyCode}`);
+        const data = await response.json();
+
+        if (data.success) {
+            const company = data.company;
+            document.getElementById('company_name').textContent = company.company_name;
+            document.getElementById('contact_person').textContent = company.contact_person;
+            document.getElementById('address').textContent = company.address;
+            document.getElementById('postal_prefecture').textContent = `${company.postal_code} ${company.prefecture}`;
+            document.getElementById('phone').textContent = company.phone;
+            document.getElementById('email').textContent = company.email;
+            companyInfoEl.style.display = 'block';
+            generateInvoiceNumber(companyCode);
+        } else {
+            companyInfoEl.style.display = 'none';
+            generateInvoiceNumber('');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        companyInfoEl.style.display = 'none';
+        generateInvoiceNumber('');
+    }
+}
+
+// 金額計算
+function calculateAmount(input) {
+    const row = input.closest('.item-row');
+    const quantity = parseFloat(row.querySelector('.item-quantity').value) || 0;
+    const price = parseFloat(row.querySelector('.item-price').value) || 0;
+    const amount = quantity * price;
+    row.querySelector('.item-amount').value = amount.toFixed(2);
+}
+
+// 請求内訳の行を追加（10行を超える分は請求書の続きのシートに出力される）
+function addItemRow() {
+    const container = document.getElementById('itemsContainer');
+    const row = container.querySelector('.item-row').cloneNode(true);
+    row.querySelector('.item-name').value = '';
+    row.querySelector('.item-quantity').value = 1;
+    row.querySelector('.item-price').value = 0;
+    row.querySelector('.item-amount').value = 0;
+    container.appendChild(row);
+    row.querySelector('.item-name').focus();
+}
+
+// フォーム送信時のバリデーション
+document.getElementById('invoiceForm').addEventListener('submit', function(e) {
+    if (!companyCodeSelect.value) {
+        e.preventDefault();
+        alert('取引先会社を選択してください');
+        companySearch.focus();
+        return false;
+    }
+
+    // 請求書番号をhidden inputから取得（disabled inputは送信されないため）
+    const invoiceNumber = document.getElementById('invoice_number_hidden').value;
+    if (!invoiceNumber) {
+        e.preventDefault();
+        alert('請求書番号が生成されていません。取引先会社を選択してください。');
+        return false;
+    }
+});
+
+// フォームクリア
+function clearForm() {
+    if (confirm('入力内容をクリアしますか？')) {
+        document.getElementById('invoiceForm').reset();
+        companySearch.value = '';
+        companyCodeSelect.value = '';
+        selectedCompanyCode = '';
+        companyDropdown.style.display = 'none';
+        document.getElementById('companyInfo').style.display = 'none';
+        document.getElementById('invoice_number').value = '';
+        document.getElementById('invoice_number_hidden').value = '';
+        // 金額を再計算
+        document.querySelectorAll('.item-row').forEach(row => {
+            calculateAmount(row.querySelector('.item-quantity'));
+        });
+    }
+}
+
+// 現在の年月を設定
+const now = new Date();
+document.getElementById('year').value = now.getFullYear();
+document.getElementById('month').value = now.getMonth() + 1;
@@ -0,0 +1,46 @@
+// 請求書項目カタログによる請求内容の候補表示と単価の自動入力
+// カタログはページ表示時に1回だけ取得し（バージョン付き URL なのでブラウザのキャッシュを使う）、
+// 入力中の絞り込みはブラウザ内で行うためサーバーへの問い合わせは発生しない
+(function() {
+    const datalist = document.getElementById('itemCatalog');
+    if (!datalist) {
+        return;
+    }
+
+    const prices = new Map();
+
+    fetch(datalist.dataset.url, { credentials: 'same-origin' })
+        .then(response => response.ok ? response.json() : null)
+        .then(catalog => {
+            if (!catalog) {
+                return;
+            }
+            const nameIndex = catalog.fields.indexOf('name');
+            const descriptionIndex = catalog.fields.indexOf('description');
+            const priceIndex = catalog.fields.indexOf('default_unit_price');
+            const fragment = document.createDocumentFragment();
+            catalog.items.forEach(item => {
+                const option = document.createElement('option');
+                option.value = item[nameIndex];
+                if (item[descriptionIndex]) {
+                    option.label = item[descriptionIndex];
+                }
+                fragment.appendChild(option);
+                prices.set(item[nameIndex], item[priceIndex]);
+            });
+            datalist.appendChild(fragment);
+        })
+        .catch(error => console.error('Error:', error));
+
+    // 項目を選んだら、単価が未入力（0）の場合だけ既定単価を入れる
+    document.addEventListener('change', function(e) {
+        if (!e.target.classList.contains('item-name') || !prices.has(e.target.value)) {
+            return;
+        }
+        const priceInput = e.target.closest('.item-row').querySelector('.item-price');
+        if (!parseFloat(priceInput.value)) {
+            priceInput.value = prices.get(e.target.value);
+            priceInput.dispatchEvent(new Event('change'));
+        }
+    });
+})();
@@ -1,3 +1,1228 @@
-from django.test import TestCase
+import importlib
+import io
+import os
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from urllib.parse import unquote
+
+import openpyxl
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admission, archive, company_purge, exports, generation_log, idempotency, ledger_version, rendering, reports, routers,
+    search, views,
+)
+
+from .backends import user_cache_key
+from .company_import import import_companies, iter_rows
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceDetail, Company, CustomUser, GenerationLog, Invoice, InvoiceDetail, InvoiceItemTemplate,
+)
+from .paginators import EstimatedCountPaginator, analyze_tables
+from .render_cache import RenderCache
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+def make_company(code, **fields):
+    """テスト用の取引先会社を作成"""
+    defaults = {
+        'company_name': f'会社{code}', 'contact_person': '担当', 'address': '千代田1',
+        'postal_code': '1000001', 'prefecture': '東京都', 'phone': '0300000000',
+        'email': 'a@example.com',
+    }
+    defaults.update(fields)
+    return Company.objects.create(company_code=code, **defaults)
+
+
+def make_invoice(company, number, items=(('作業', 1, 100),), created_at=None, user=None):
+    """テスト用の請求書と明細を作成（created_at を指定すると上書き）"""
+    invoice = Invoice.objects.create(
+        invoice_number=number, company=company, customer_id=company.company_code, created_by=user,
+    )
+    for order, (name, quantity, price) in enumerate(items):
+        InvoiceDetail.objects.create(invoice=invoice, item_name=name, quantity=quantity, unit_price=price, order=order)
+    if created_at is not None:
+        Invoice.objects.filter(pk=invoice.pk).update(created_at=created_at)
+        invoice.refresh_from_db()
+    return invoice
+
+
+@override_settings(CACHES=LOCMEM_CACHES, GENERATION_LOG_IN_BACKGROUND=False)
+class CacheTestCase(TestCase):
+    """テストごとにプロセス内キャッシュと一時的な出力先を使い、空の状態から始める"""
+
+    def setUp(self):
+        cache.clear()
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = Path(output_dir.name)
+        settings_override = override_settings(
+            INVOICE_OUTPUT_DIR=self.output_dir, RENDER_CACHE_DIR=self.output_dir / 'cache',
+            ADMISSION_LOCK_DIR=self.output_dir / 'admission',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(USER_CACHE_TIMEOUT=60)
+class CachedUserTests(CacheTestCase):
+    """ログインユーザーキャッシュのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.director = CustomUser.objects.create_user('director', password='pw', role='director')
+        self.general = CustomUser.objects.create_user('general', password='pw', role='general')
+
+    def test_cached_user_skips_user_query(self):
+        self.client.force_login(self.general)
+        self.client.get(reverse('invoices:get_company_info'), {'company_code': 'X'})
+        # 2回目以降はユーザーテーブルを読まない
+        with self.assertNumQueries(1):
+            self.client.get(reverse('invoices:get_company_info'), {'company_code': 'X'})
+
+    def test_cache_holds_only_role_and_session_hash(self):
+        self.client.force_login(self.general)
+        self.client.get(reverse('invoices:get_company_info'), {'company_code': 'X'})
+        cached = cache.get(user_cache_key(self.general.pk))
+        self.assertEqual(set(cached), {'role', 'is_active', 'session_auth_hash'})
+        self.assertNotIn(self.general.password, cached.values())
+        # キャッシュから復元したユーザーでもセッションの検証に通り、他の項目は参照時に読み込む
+        response = self.client.get(reverse('invoices:create_invoice_view'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user.username, 'general')
+
+    def test_password_change_ends_cached_session(self):
+        self.client.force_login(self.general)
+        self.client.get(reverse('invoices:create_invoice_view'))
+        self.general.set_password('changed')
+        self.general.save()
+        self.assertEqual(self.client.get(reverse('invoices:create_invoice_view')).status_code, 302)
+
+    def test_role_change_invalidates_cache(self):
+        self.client.force_login(self.general)
+        response = self.client.get(reverse('invoices:admin_users'))
+        self.assertEqual(response.status_code, 302)
+
+        self.general.role = 'manager'
+        self.general.save()
+        response = self.client.get(reverse('invoices:admin_users'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_user_invalidates_cache(self):
+        general_client = Client()
+        general_client.force_login(self.general)
+        general_client.get(reverse('invoices:create_invoice_view'))
+
+        self.client.force_login(self.director)
+        self.client.post(reverse('invoices:delete_user', args=[self.general.pk]))
+
+        response = general_client.get(reverse('invoices:create_invoice_view'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ImportCompaniesTests(CacheTestCase):
+    """取引先会社一括取込のテスト"""
+
+    HEADER = ['会社コード', '会社名', '担当者名', '番地', '郵便番号', '都道府県', '電話番号', 'メールアドレス']
+
+    def test_allocates_codes_and_upserts(self):
+        make_company('0003', company_name='既存')
+        rows = [
+            self.HEADER,
+            ['', '新規A', '山田', '千代田1', '100-0001', '東京都', '03-1234-5678', 'a@example.com'],
+            ['0003', '既存(更新)', '佐藤', '千代田2', '1000002', '東京都', '0311112222', 'b@example.com'],
+            ['', '不正', '鈴木', '千代田3', '1000003', '東京都', '03', 'not-an-email'],
+        ]
+        result = import_companies(rows)
+
+        self.assertEqual(result.total, 3)
+        self.assertEqual(result.imported, 2)
+        self.assertEqual([row for row, _ in result.errors], [4])
+        created = Company.objects.get(company_code='0004')
+        self.assertEqual((created.postal_code, created.phone), ('1000001', '0312345678'))
+        self.assertEqual(Company.objects.get(company_code='0003').company_name, '既存(更新)')
+
+    def test_missing_required_column(self):
+        with self.assertRaises(ValueError):
+            import_companies([['会社名']])
+
+    def test_csv_encodings(self):
+        row = ['', '株式会社テスト', '山田', '千代田1', '1000001', '東京都', '0312345678', 'a@example.com']
+        content = '\r\n'.join(','.join(values) for values in (self.HEADER, row)) + '\r\n'
+        # Excel の「CSV（コンマ区切り）」は cp932、「CSV UTF-8」は BOM 付きで保存される
+        for encoding in ('cp932', 'utf-8-sig'):
+            with self.subTest(encoding=encoding):
+                rows = list(iter_rows(io.BytesIO(content.encode(encoding)), 'companies.csv'))
+                self.assertEqual(rows, [self.HEADER, row])
+        result = import_companies(iter_rows(io.BytesIO(content.encode('cp932')), 'companies.csv'))
+        self.assertEqual((result.imported, Company.objects.get().company_name), (1, '株式会社テスト'))
+
+
+class AdminChangelistQueryTests(CacheTestCase):
+    """Django管理画面の一覧のクエリ数が件数に依存しないことのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin_user = CustomUser.objects.create_superuser('root', password='pw', role='director')
+        self.client.force_login(self.admin_user)
+        self.invoice_count = 0
+
+    def add_invoices(self, count):
+        for _ in range(count):
+            self.invoice_count += 1
+            company = make_company(f'{self.invoice_count:04d}')
+            make_invoice(company, f'INV{self.invoice_count}', user=self.admin_user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_invoices(2)
+        self.client.get(url)  # ログインユーザーをキャッシュに載せる
+        few = self.count_queries(url)
+        self.add_invoices(8)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_invoice_changelist(self):
+        self.assert_constant_queries(reverse('admin:invoices_invoice_changelist'))
+
+    def test_invoicedetail_changelist(self):
+        url = reverse('admin:invoices_invoicedetail_changelist')
+        self.assert_constant_queries(url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertFalse([q for q in context.captured_queries if 'invoices_company' in q['sql']])
+
+    @mock.patch('invoices.paginators.ESTIMATE_THRESHOLD', 0)
+    def test_estimated_count_skips_count_query(self):
+        self.add_invoices(3)
+        analyze_tables(Invoice)
+        paginator = EstimatedCountPaginator(Invoice.objects.all(), 100)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 3)
+
+    @mock.patch('invoices.paginators.ESTIMATE_THRESHOLD', 0)
+    def test_estimate_after_deleting_rows(self):
+        self.add_invoices(10)
+        analyze_tables(Invoice)
+        Invoice.objects.filter(invoice_number__in=[f'INV{n}' for n in range(4, 11)]).delete()
+        # 統計情報が古いままでも、途中で終わったページから実際の件数に直す
+        paginator = EstimatedCountPaginator(Invoice.objects.order_by('id'), 2)
+        self.assertEqual(paginator.num_pages, 5)
+        self.assertEqual(len(paginator.page(2).object_list), 1)
+        self.assertEqual((paginator.count, paginator.num_pages), (3, 2))
+        paginator = EstimatedCountPaginator(Invoice.objects.order_by('id'), 2)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+        self.assertEqual(paginator.num_pages, 2)
+        # 保管・完全削除の後は統計情報を更新する
+        archive.archive_invoices(timezone.now() + timedelta(days=1))
+        self.assertEqual(EstimatedCountPaginator(Invoice.objects.all(), 2).count, 0)
+
+    @mock.patch('invoices.paginators.ESTIMATE_THRESHOLD', 0)
+    def test_estimate_after_adding_rows(self):
+        self.add_invoices(4)
+        analyze_tables(Invoice)
+        self.add_invoices(5)
+        # 統計情報より行が増えていれば、最後のページの先を確かめて件数を広げる
+        paginator = EstimatedCountPaginator(Invoice.objects.order_by('id'), 2)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertTrue(paginator.page(2).has_next())
+        self.assertEqual(paginator.num_pages, 5)
+        self.assertEqual(len(paginator.page(5).object_list), 1)
+        self.assertEqual(paginator.count, 9)
+
+    @mock.patch('invoices.paginators.ESTIMATE_THRESHOLD', 0)
+    def test_filtered_queryset_uses_exact_count(self):
+        self.add_invoices(3)
+        paginator = EstimatedCountPaginator(Invoice.objects.filter(invoice_number='INV1'), 100)
+        self.assertEqual(paginator.count, 1)
+
+
+class MonthlyLedgerExportTests(CacheTestCase):
+    """全取引先の月次取引履歴出力のテスト"""
+
+    def test_one_sheet_per_company_with_summary(self):
+        tz = timezone.get_current_timezone()
+        first, second = make_company('0001'), make_company('0002')
+        make_invoice(first, 'A1', items=[('作業', 2, 100), ('部品', 1, 50)], created_at=datetime(2026, 3, 1, 0, 30, tzinfo=tz))
+        make_invoice(second, 'B1', created_at=datetime(2026, 3, 31, 23, 0, tzinfo=tz))
+        make_invoice(second, 'B2', created_at=datetime(2026, 4, 1, 0, 0, tzinfo=tz))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'ledger.xlsx'
+            # 明細の取得1回＋保管済み明細の有無の確認1回
+            with self.assertNumQueries(2):
+                self.assertEqual(exports.write_monthly_ledger(path, 2026, 3), 2)
+            book = openpyxl.load_workbook(path)
+
+        self.assertEqual(len(book.worksheets), 3)
+        summary = list(book.worksheets[0].values)
+        self.assertEqual(summary[1], ('0001', '会社0001', 1, 2, 250))
+        self.assertEqual(summary[2], ('0002', '会社0002', 1, 1, 100))
+        self.assertEqual(summary[3][-1], 350)
+        rows = list(book.worksheets[1].values)
+        self.assertEqual(rows[1], ('A1', '2026-03-01 00:30', '作業', 2, 100, 200))
+
+    def test_renamed_company_keeps_billed_name(self):
+        tz = timezone.get_current_timezone()
+        company = make_company('0001')
+        make_invoice(company, 'A1', created_at=datetime(2026, 3, 2, tzinfo=tz))
+        company.company_name = '新社名'
+        company.save()
+        make_invoice(company, 'A2', created_at=datetime(2026, 3, 20, tzinfo=tz))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'ledger.xlsx'
+            self.assertEqual(exports.write_monthly_ledger(path, 2026, 3), 1)
+            book = openpyxl.load_workbook(path)
+
+        # 月の途中の社名変更でもシートは1つ（社名は請求時点のもの）
+        self.assertEqual(list(book.worksheets[0].values)[1], ('0001', '会社0001', 2, 2, 200))
+        ledger = exports.ledger_details(datetime(2026, 3, 1, tzinfo=tz), datetime(2026, 4, 1, tzinfo=tz))
+        self.assertNotIn('invoices_company', str(ledger.query))
+
+
+class HistoryExportFormatTests(CacheTestCase):
+    """取引履歴出力の形式切り替えのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(CustomUser.objects.create_user('general', password='pw'))
+        tz = timezone.get_current_timezone()
+        company = make_company('0001')
+        make_invoice(company, 'A1', items=[('作業', 2, 100), ('部品', 1, 50)], created_at=datetime(2026, 3, 2, 9, 0, tzinfo=tz))
+
+    def export(self, **extra):
+        data = {'company_code': '0001', 'year': 2026, 'month': 3}
+        data.update(extra.pop('data', {}))
+        response = self.client.post(reverse('invoices:export_monthly_history'), data, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_csv(self):
+        response = self.export(data={'format': 'csv'})
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(exports.HISTORY_HEADERS))
+        self.assertEqual(lines[1], 'A1,2026-03-02 09:00,作業,2,100.00,200.00')
+        self.assertEqual(len(lines), 3)
+
+    def test_jsonl_from_accept_header(self):
+        response = self.export(HTTP_ACCEPT='application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[1], {
+            'invoice_number': 'A1', 'created_at': '2026-03-02 09:00', 'item_name': '部品',
+            'quantity': 1, 'unit_price': '50.00', 'amount': '50.00',
+        })
+
+    def test_xlsx_is_default(self):
+        response = self.export()
+        book = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(book.active.values)[1], ('A1', '2026-03-02 09:00', '作業', 2, 100, 200))
+
+
+class HistoryReportTests(CacheTestCase):
+    """取引履歴の集計出力のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(CustomUser.objects.create_user('general', password='pw'))
+        tz = timezone.get_current_timezone()
+        self.company = make_company('0001')
+        # コミット済みの状態から始める（以降の変更でキャッシュが無効になることを確かめる）
+        with self.captureOnCommitCallbacks(execute=True):
+            make_invoice(self.company, 'A1', items=[('作業', 2, 100), ('部品', 1, 50)], created_at=datetime(2025, 1, 10, tzinfo=tz))
+            make_invoice(self.company, 'A2', items=[('作業', 1, 100)], created_at=datetime(2025, 3, 5, tzinfo=tz))
+            make_invoice(self.company, 'A3', items=[('部品', 4, 50)], created_at=datetime(2025, 3, 31, 23, 0, tzinfo=tz))
+            make_invoice(make_company('0002'), 'B1', created_at=datetime(2025, 3, 6, tzinfo=tz))
+            # 1月の請求書は保管テーブルへ移す（保管済みも合算される）
+            archive.archive_invoices(datetime(2025, 2, 1, tzinfo=tz))
+        self.start, self.end = exports.period_range(2025, 1, 12)
+
+    def export_item_report(self):
+        response = self.client.post(
+            reverse('invoices:export_monthly_history'),
+            {'company_code': '0001', 'year': 2025, 'month': 1, 'months': 12, 'mode': 'item'},
+        )
+        self.assertEqual(response.status_code, 200)
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        return {row[0]: row[3] for row in sheet.iter_rows(min_row=2, values_only=True)}
+
+    def test_cache_key_does_not_read_details(self):
+        self.assertEqual(self.export_item_report()['作業'], 3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.export_item_report()['作業'], 3)
+        # キャッシュのヒット時は集計クエリを実行しない
+        self.assertFalse([q for q in queries.captured_queries if 'GROUP BY' in q['sql']])
+
+        # 請求書の追加・明細の変更はコミット後にキャッシュを無効化する
+        with self.captureOnCommitCallbacks(execute=True):
+            make_invoice(self.company, 'A4', items=[('作業', 5, 100)], created_at=datetime(2025, 4, 1, tzinfo=timezone.get_current_timezone()))
+        self.assertEqual(self.export_item_report()['作業'], 8)
+        detail = InvoiceDetail.objects.get(invoice__invoice_number='A4')
+        detail.quantity = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            detail.save()
+        self.assertEqual(self.export_item_report()['作業'], 4)
+
+    def test_admin_export_page_offers_reports(self):
+        self.client.force_login(CustomUser.objects.create_user('manager', password='pw', role='manager'))
+        response = self.client.get(reverse('invoices:admin_export_history'))
+        self.assertContains(response, 'name="mode"')
+        self.assertContains(response, 'name="months"')
+
+    def test_aggregates_in_database(self):
+        # 作業用・保管用それぞれ1回の GROUP BY
+        with self.assertNumQueries(2):
+            rows = list(reports.iter_report('item', self.start, self.end, self.company))
+        self.assertEqual(rows, [['作業', 2, 2, 3, 300], ['部品', 2, 2, 5, 250]])
+        rows = list(reports.iter_report('month', self.start, self.end, self.company))
+        self.assertEqual(rows, [['2025-01', 1, 2, 3, 250], ['2025-03', 2, 2, 5, 300]])
+        rows = list(reports.iter_report('invoice', self.start, self.end, self.company))
+        self.assertEqual([row[0] for row in rows], ['A1', 'A2', 'A3'])
+        self.assertEqual(rows[2], ['A3', '2025-03-31 23:00', 1, 4, 200])
+
+    def test_summary_sheet_with_total(self):
+        response = self.client.post(reverse('invoices:export_monthly_history'), {
+            'company_code': '0001', 'year': 2025, 'month': 1, 'months': 12, 'mode': 'item',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('2025年1月〜2025年12月分_請求内容別.xlsx', unquote(response['Content-Disposition']))
+        book = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        rows = list(book.active.values)
+        self.assertEqual(rows[0], tuple(reports.REPORT_HEADERS['item']))
+        self.assertEqual(rows[-1], ('合計', None, 4, 8, 550))
+
+    def test_csv_report_and_invalid_mode(self):
+        response = self.client.post(reverse('invoices:export_monthly_history'), {
+            'company_code': '0001', 'year': 2025, 'month': 3, 'mode': 'month', 'format': 'csv',
+        })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], ['2025-03,2,2,5,300.00'])
+        response = self.client.post(reverse('invoices:export_monthly_history'), {
+            'company_code': '0001', 'year': 2025, 'month': 3, 'mode': 'unknown',
+        })
+        self.assertEqual(response.status_code, 302)
+
+
+class IdempotentInvoiceTests(CacheTestCase):
+    """請求書生成の二重送信抑止のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('general', password='pw')
+        self.client.force_login(self.user)
+        make_company('0001')
+
+    def post(self, key='k1', **fields):
+        data = {
+            'company_code': '0001', 'idempotency_key': key,
+            'item_name[]': ['作業'], 'item_quantity[]': ['2'], 'item_price[]': ['100'],
+        }
+        data.update(fields)
+        response = self.client.post(reverse('invoices:generate_invoice'), data)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_duplicate_submission_returns_same_file(self):
+        first = b''.join(self.post().streaming_content)
+        second = b''.join(self.post().streaming_content)
+        self.assertEqual(first, second)
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(InvoiceDetail.objects.count(), 1)
+        self.assertEqual(len(list(self.output_dir.glob('*.xlsx'))), 1)
+
+    def test_changed_form_creates_new_invoice(self):
+        self.post()
+        self.post(**{'item_quantity[]': ['3']})
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_concurrent_duplicate_loses_race_and_returns_winner(self):
+        # 同時送信で先行リクエストが先に登録した状況（初回の照会では未登録に見える）
+        self.post()
+        with mock.patch.object(idempotency, 'find_invoice', side_effect=[None, Invoice.objects.get()]):
+            response = self.post()
+        self.assertIn('0001', response['Content-Disposition'])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_expired_key_creates_new_invoice(self):
+        self.post()
+        Invoice.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.post()
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_header_key(self):
+        data = {'company_code': '0001', 'item_name[]': ['作業'], 'item_quantity[]': ['1'], 'item_price[]': ['1']}
+        for _ in range(2):
+            self.client.post(reverse('invoices:generate_invoice'), data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(Invoice.objects.count(), 1)
+
+
+class ConcurrentInvoiceSubmissionTests(TransactionTestCase):
+    """同じキーの同時送信で請求書が1件だけ作成されることのテスト"""
+
+    def test_parallel_duplicate_submissions(self):
+        user = CustomUser.objects.create_user('general', password='pw')
+        make_company('0001')
+        data = {
+            'company_code': '0001', 'idempotency_key': 'same',
+            'item_name[]': ['作業'], 'item_quantity[]': ['1'], 'item_price[]': ['100'],
+        }
+        barrier = threading.Barrier(2)
+
+        def submit():
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            try:
+                response = client.post(reverse('invoices:generate_invoice'), data)
+                return response.status_code, response.get('Content-Disposition', '')
+            finally:
+                connection.close()
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            INVOICE_OUTPUT_DIR=directory, CACHES=LOCMEM_CACHES, GENERATION_LOG_IN_BACKGROUND=False,
+        ):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                results = [future.result() for future in [pool.submit(submit) for _ in range(2)]]
+
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual([status for status, _ in results], [200, 200])
+        self.assertEqual(results[0][1], results[1][1])
+
+
+class RenderCacheTests(CacheTestCase):
+    """出力キャッシュのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('manager', password='pw', role='manager')
+        self.client.force_login(self.user)
+        self.company = make_company('0001')
+        self.invoice = make_invoice(self.company, 'A1', user=self.user)
+
+    def download(self):
+        response = self.client.get(reverse('invoices:download_invoice', args=[self.invoice.pk]))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def stats(self):
+        return self.client.get(reverse('invoices:render_cache_stats')).json()['stats']
+
+    def test_redownload_hits_cache(self):
+        first = self.download()
+        second = self.download()
+        self.assertEqual(first, second)
+        self.assertEqual((self.stats()['hits'], self.stats()['misses']), (1, 1))
+
+    def test_company_change_keeps_billed_details(self):
+        self.download()
+        self.company.address = '千代田2'
+        self.company.save()
+        # 作成済みの請求書は作成時点の請求先のまま再出力される
+        book = openpyxl.load_workbook(io.BytesIO(self.download()))
+        self.assertEqual(book.active['A10'].value, '千代田1')
+        self.assertEqual(self.stats()['misses'], 1)
+        # 新しく作成する請求書には変更後の会社情報が入る
+        self.assertEqual(make_invoice(self.company, 'A2').billed_address, '千代田2')
+
+    def test_detail_change_invalidates(self):
+        self.download()
+        detail = self.invoice.details.get()
+        detail.quantity = 5
+        detail.save()
+        book = openpyxl.load_workbook(io.BytesIO(self.download()))
+        self.assertEqual(book.active['H17'].value, 500)
+
+    def test_ledger_version_bumped_once_per_transaction(self):
+        company = make_company('0002')
+        version = ledger_version.get_version(company.pk)
+        # ロールバックした請求書の予約は残らない
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_invoice(company, 'B1')
+            raise RuntimeError
+        self.assertEqual(ledger_version.get_version(company.pk), version)
+        # 請求書と明細をまとめて登録しても1回だけ更新する
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            make_invoice(company, 'B2', items=[('作業', 1, 100), ('部品', 2, 50)])
+        self.assertEqual(len([c for c in callbacks if isinstance(c, ledger_version._PendingBump)]), 1)
+        self.assertEqual(ledger_version.get_version(company.pk), version + 1)
+
+    def test_lru_eviction(self):
+        render_cache = RenderCache(self.output_dir / 'lru', max_bytes=25)
+        source = self.output_dir / 'source.xlsx'
+        source.write_bytes(b'x' * 10)
+        for key in ['a', 'b']:
+            render_cache.put(key, source)
+        os.utime(render_cache.path('a'), (0, 0))
+        self.assertIsNotNone(render_cache.get('a'))  # a を利用して b より新しくする
+        render_cache.put('c', source)
+        self.assertEqual(sorted(path.stem for path, _ in render_cache.entries()), ['a', 'c'])
+
+
+class MultiPageInvoiceTests(CacheTestCase):
+    """1ページに収まらない請求書の出力のテスト"""
+
+    def test_forms_can_add_item_rows(self):
+        self.client.force_login(CustomUser.objects.create_user('manager', password='pw', role='manager'))
+        for name in ('invoices:create_invoice_view', 'invoices:admin_create_invoice'):
+            self.assertContains(self.client.get(reverse(name)), 'onclick="addItemRow()"')
+
+    def test_overflow_to_continuation_sheets(self):
+        items = [(f'項目{i}', 1, 10 * i) for i in range(1, 26)]
+        invoice = make_invoice(make_company('0001'), 'A1', items=items)
+        path = rendering.write_invoice_workbook(invoice, list(invoice.details.order_by('order')))
+        book = openpyxl.load_workbook(path)
+
+        self.assertEqual(len(book.worksheets), 3)
+        first, second, last = book.worksheets
+        self.assertEqual([first.cell(row=row, column=1).value for row in (17, 26)], ['項目1', '項目10'])
+        self.assertEqual((first['F31'].value, first['H31'].value), ('小計（次頁へ繰越）', 550))
+        self.assertEqual((second['A16'].value, second['H16'].value), ('前頁より繰越', 550))
+        self.assertEqual((second['A9'].value, second['F5'].value), ('会社0001', 'A1'))
+        self.assertEqual((last['A21'].value, last['A22'].value), ('項目25', None))
+        self.assertEqual((last['F31'].value, last['H31'].value), ('小計', 3250))
+        # 税率・税額・合計は最終ページのみ（続きのページには見本の値を残さない）
+        self.assertEqual([last[cell].value for cell in ('H32', 'H33', 'H34')], [0.1, 325, 3575])
+        self.assertEqual([first[cell].value for cell in ('F32', 'H32', 'F34', 'H34')], [None] * 4)
+
+    def test_single_page_clears_sample_lines(self):
+        invoice = make_invoice(make_company('0001'), 'A1')
+        book = openpyxl.load_workbook(rendering.write_invoice_workbook(invoice, list(invoice.details.all())))
+        sheet = book.active
+        self.assertEqual(len(book.worksheets), 1)
+        self.assertEqual([sheet['A17'].value, sheet['A18'].value, sheet['H16'].value], ['作業', None, None])
+        self.assertEqual(sheet['H31'].value, 100)
+        self.assertEqual([sheet[cell].value for cell in ('F34', 'H33', 'H34')], ['合計', 10, 110])
+
+
+class InvoiceSearchTests(TestCase):
+    """請求書の全文検索のテスト"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('manager', password='pw', role='manager')
+        self.client.force_login(self.user)
+        self.alpha = make_company('0001', company_name='アルファ商事')
+        self.beta = make_company('0002', company_name='ベータ工業')
+        self.first = make_invoice(self.alpha, 'INV-0001', items=(('サーバー保守作業', 1, 100),))
+        self.second = make_invoice(self.beta, 'INV-0002', items=(('ネットワーク設計', 1, 100),))
+
+    def search(self, q, page=1):
+        response = self.client.get(reverse('invoices:search_invoices'), {'q': q, 'page': page})
+        return response.json()
+
+    def test_index_is_available(self):
+        self.assertTrue(search.is_available())
+
+    def test_search_by_item_and_company(self):
+        numbers = [r['invoice_number'] for r in self.search('サーバー保守')['results']]
+        self.assertEqual(numbers, ['INV-0001'])
+        numbers = [r['invoice_number'] for r in self.search('ベータ工業')['results']]
+        self.assertEqual(numbers, ['INV-0002'])
+        # すべての語を含む請求書のみ
+        self.assertEqual(self.search('ベータ工業 サーバー')['results'], [])
+
+    def test_index_follows_writes(self):
+        detail = self.second.details.get()
+        detail.item_name = 'データ移行作業'
+        detail.save()
+        self.assertEqual([r['id'] for r in self.search('データ移行')['results']], [self.second.id])
+        self.assertEqual(self.search('ネットワーク')['results'], [])
+
+        self.alpha.company_name = 'ガンマ物産'
+        self.alpha.save()
+        self.assertEqual([r['id'] for r in self.search('ガンマ物産')['results']], [self.first.id])
+
+        self.first.delete()
+        self.assertEqual(self.search('ガンマ物産')['results'], [])
+
+    def test_ranking_prefers_invoice_number(self):
+        make_invoice(self.alpha, 'INV-0003', items=(('INV-0002 の追加作業', 1, 100),))
+        ids = [r['invoice_number'] for r in self.search('INV-0002')['results']]
+        self.assertEqual(ids, ['INV-0002', 'INV-0003'])
+
+    def test_pagination(self):
+        for number in range(3, 4 + search.PAGE_SIZE):
+            make_invoice(self.alpha, f'INV-{number:04d}', items=(('保守点検', 1, 100),))
+        first = self.search('保守点検')
+        second = self.search('保守点検', page=2)
+        self.assertEqual(len(first['results']), search.PAGE_SIZE)
+        self.assertTrue(first['has_next'])
+        self.assertEqual(len(second['results']), 1)
+        self.assertFalse(second['has_next'])
+
+    def test_short_terms_fall_back_to_contains(self):
+        # trigram 索引で検索できない2文字の語は部分一致で検索
+        numbers = [r['invoice_number'] for r in self.search('設計')['results']]
+        self.assertEqual(numbers, ['INV-0002'])
+
+    def test_general_user_sees_own_invoices(self):
+        general = CustomUser.objects.create_user('general', password='pw')
+        own = make_invoice(self.alpha, 'INV-0003', items=(('サーバー保守作業', 1, 100),), user=general)
+        self.client.force_login(general)
+        self.assertEqual([r['id'] for r in self.search('サーバー保守')['results']], [own.id])
+        self.assertEqual([r['id'] for r in self.search('保守')['results']], [own.id])
+
+    def test_unchanged_saves_do_not_reindex(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+        # 索引に関わる列が変わらない保存では作り直さない
+        self.alpha.save()
+        self.first.save()
+        self.first.details.get().save()
+        self.assertEqual(self.search('アルファ商事')['results'], [])
+
+    def test_details_are_indexed_once_per_invoice(self):
+        with mock.patch.object(search, 'refresh_invoices', wraps=search.refresh_invoices) as refresh:
+            with search.batched_refresh():
+                invoice = make_invoice(self.alpha, 'INV-0003', items=[(f'点検項目{n}', 1, 100) for n in range(5)])
+                refresh.assert_not_called()
+            refresh.assert_called_once_with([invoice.id], 'default')
+        self.assertEqual([r['id'] for r in self.search('点検項目4')['results']], [invoice.id])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+        self.assertEqual(self.search('サーバー保守')['results'], [])
+        self.assertEqual(search.rebuild(batch_size=1), 2)
+        self.assertEqual(len(self.search('サーバー保守')['results']), 1)
+
+
+class ArchiveInvoicesTests(CacheTestCase):
+    """古い請求書の保管のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('director', password='pw', role='director')
+        self.client.force_login(self.user)
+        tz = timezone.get_current_timezone()
+        self.company = make_company('0001')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old = make_invoice(
+                self.company, 'OLD1', items=[('作業', 2, 100), ('部品', 1, 50)], created_at=datetime(2023, 3, 2, 9, 0, tzinfo=tz),
+            )
+            self.new = make_invoice(self.company, 'NEW1', created_at=datetime(2023, 3, 20, 9, 0, tzinfo=tz))
+        self.cutoff = datetime(2023, 3, 10, tzinfo=tz)
+
+    def test_moves_old_invoices_with_details(self):
+        result = archive.archive_invoices(self.cutoff, batch_size=1)
+        self.assertEqual((result.invoices, result.details), (1, 2))
+        self.assertEqual(list(Invoice.objects.values_list('invoice_number', flat=True)), ['NEW1'])
+        self.assertEqual(InvoiceDetail.objects.count(), 1)
+        archived = ArchivedInvoice.objects.get()
+        self.assertEqual((archived.pk, archived.created_at), (self.old.pk, self.old.created_at))
+        self.assertEqual(list(archived.details.values_list('item_name', 'amount')), [('作業', 200), ('部品', 50)])
+
+    def test_bumps_ledger_version_once_per_batch(self):
+        company = make_company('0002')
+        version = ledger_version.get_version(company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_invoice(company, 'OLD2', created_at=self.old.created_at)
+            make_invoice(company, 'OLD3', created_at=self.old.created_at)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            archive.archive_invoices(self.cutoff)
+        bumped = sorted(c.company_id for c in callbacks if isinstance(c, ledger_version._PendingBump))
+        self.assertEqual(bumped, [self.company.pk, company.pk])
+        self.assertEqual(ledger_version.get_version(company.pk), version + 2)
+        # 一括削除が1行ずつにならないよう、請求書の削除は受け取らない
+        self.assertFalse(post_delete.has_listeners(Invoice))
+        self.assertFalse(post_delete.has_listeners(ArchivedInvoice))
+
+    def test_failed_batch_leaves_invoices_in_place(self):
+        with mock.patch.object(ArchivedInvoiceDetail.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                archive.archive_invoices(self.cutoff)
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertFalse(ArchivedInvoice.objects.exists())
+
+    def test_export_reads_archived_period(self):
+        archive.archive_invoices(self.cutoff)
+        response = self.client.post(
+            reverse('invoices:export_monthly_history'),
+            {'company_code': '0001', 'year': 2023, 'month': 3, 'format': 'csv'},
+        )
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([row.split(',')[0] for row in rows[1:]], ['OLD1', 'OLD1', 'NEW1'])
+
+    def test_download_archived_invoice(self):
+        archive.archive_invoices(self.cutoff)
+        self.company.address = '千代田2'
+        self.company.save()
+        response = self.client.get(reverse('invoices:download_invoice', args=[self.old.pk]))
+        self.assertEqual(response.status_code, 200)
+        book = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(book.active['A17'].value, '作業')
+        self.assertEqual(book.active['A10'].value, '千代田1')
+
+    def search_numbers(self, q):
+        response = self.client.get(reverse('invoices:search_invoices'), {'q': q})
+        return [r['invoice_number'] for r in response.json()['results']]
+
+    def test_search_covers_archived_invoices(self):
+        archive.archive_invoices(self.cutoff)
+        # 索引（3文字以上）と部分一致のどちらでも保管済みの請求書を検索できる
+        self.assertEqual(sorted(self.search_numbers('会社0001')), ['NEW1', 'OLD1'])
+        self.assertEqual(self.search_numbers('OLD1'), ['OLD1'])
+        self.assertEqual(self.search_numbers('部品'), ['OLD1'])
+        # 会社名の変更・再構築も保管済みの請求書に反映される
+        self.company.company_name = 'デルタ商会'
+        self.company.save()
+        self.assertEqual(sorted(self.search_numbers('デルタ商会')), ['NEW1', 'OLD1'])
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(sorted(self.search_numbers('デルタ商会')), ['NEW1', 'OLD1'])
+        # 保管済みの請求書を削除すると索引からも外れる
+        ArchivedInvoice.objects.all().delete()
+        self.assertEqual(self.search_numbers('デルタ商会'), ['NEW1'])
+
+    def test_backfill_billing_details(self):
+        migration = importlib.import_module('invoices.migrations.0008_invoice_billing_snapshot')
+        archive.archive_invoices(self.cutoff)
+        Invoice.objects.update(billed_company_code='', billed_address='')
+        ArchivedInvoice.objects.update(billed_company_code='', billed_address='')
+        migration.backfill_billing_details(apps, None)
+        for model in (Invoice, ArchivedInvoice):
+            self.assertEqual(
+                list(model.objects.values_list('billed_company_code', 'billed_address')), [('0001', '千代田1')],
+            )
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, REPLICA_DATABASE_ALIAS='replica', REPLICA_LAG_TOLERANCE=60,
+    GENERATION_LOG_IN_BACKGROUND=False,
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """レプリカへの読み取り振り分けのテスト（2つ目の SQLite ファイルを backup API で同期）"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # テスト実行中だけレプリカの接続を追加する
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': str(Path(cls.replica_dir.name) / 'replica.sqlite3'),
+        }
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_dir.cleanup()
+        cls.databases = {'default'}
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = Path(output_dir.name)
+        self.user = CustomUser.objects.create_user('general', password='pw')
+        self.client.force_login(self.user)
+        tz = timezone.get_current_timezone()
+        company = make_company('0001')
+        make_invoice(company, 'A1', created_at=datetime(2026, 3, 2, 9, 0, tzinfo=tz))
+        routers.refresh_replica()
+        # 同期後の書き込み（レプリカにはまだない）
+        make_invoice(company, 'A2', created_at=datetime(2026, 3, 3, 9, 0, tzinfo=tz))
+
+    def exported_numbers(self):
+        response = self.client.post(
+            reverse('invoices:export_monthly_history'),
+            {'company_code': '0001', 'year': 2026, 'month': 3, 'format': 'csv'},
+        )
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        return [row.split(',')[0] for row in rows[1:]]
+
+    def test_export_reads_replica(self):
+        self.assertEqual(self.exported_numbers(), ['A1'])
+        # 通常のクエリは default
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_cached_workbook_is_rendered_from_primary(self):
+        # キャッシュへ保存するファイルはレプリカの遅れに関係なく最新の内容で作る
+        with override_settings(INVOICE_OUTPUT_DIR=self.output_dir, RENDER_CACHE_DIR=self.output_dir / 'cache'):
+            response = self.client.post(
+                reverse('invoices:export_monthly_history'),
+                {'company_code': '0001', 'year': 2026, 'month': 3, 'format': 'xlsx'},
+            )
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual([row[0] for row in sheet.iter_rows(min_row=2, values_only=True)], ['A1', 'A2'])
+
+    def test_writer_is_pinned_to_primary(self):
+        routers.pin_primary(self.user)
+        self.assertEqual(self.exported_numbers(), ['A1', 'A2'])
+
+    def test_lagging_replica_is_skipped(self):
+        cache.set(routers.SYNCED_AT_CACHE_KEY, time.time() - 61, None)
+        self.assertEqual(self.exported_numbers(), ['A1', 'A2'])
+
+    def test_unknown_sync_time_is_stale(self):
+        cache.delete(routers.SYNCED_AT_CACHE_KEY)
+        self.assertIsNone(routers.choose_read_alias(self.user))
+        self.assertEqual(self.exported_numbers(), ['A1', 'A2'])
+
+    def test_refresh_catches_up(self):
+        routers.refresh_replica()
+        self.assertEqual(self.exported_numbers(), ['A1', 'A2'])
+
+    def test_search_reads_replica(self):
+        self.client.force_login(CustomUser.objects.create_user('manager', password='pw', role='manager'))
+        response = self.client.get(reverse('invoices:search_invoices'), {'q': '会社0001'})
+        self.assertEqual([r['invoice_number'] for r in response.json()['results']], ['A1'])
+
+
+class AdmissionControlTests(CacheTestCase):
+    """重い処理の流入制御のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(CustomUser.objects.create_user('general', password='pw'))
+        tz = timezone.get_current_timezone()
+        make_invoice(make_company('0001'), 'A1', created_at=datetime(2026, 3, 2, 9, 0, tzinfo=tz))
+
+    def export(self):
+        return self.client.post(
+            reverse('invoices:export_monthly_history'),
+            {'company_code': '0001', 'year': 2026, 'month': 3, 'format': 'csv'},
+        )
+
+    def limit(self, **config):
+        return override_settings(ADMISSION_CONTROL={'export_monthly_history': config})
+
+    def test_rate_limit(self):
+        with self.limit(rate=(1, 60)):
+            self.assertEqual(self.export().status_code, 200)
+            response = self.export()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(admission.stats()['export_monthly_history']['rate_limited'], 1)
+
+    def test_saturated_endpoint_rejects_fast(self):
+        with self.limit(concurrency=1, queue=0, retry_after=7):
+            busy = admission._acquire('export_monthly_history', 'run', 1)
+            self.addCleanup(busy.release)
+            response = self.export()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.json()['success'], False)
+
+    def test_queued_request_times_out(self):
+        with self.limit(concurrency=1, queue=1, wait=0.1):
+            busy = admission._acquire('export_monthly_history', 'run', 1)
+            response = self.export()
+            busy.release()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(self.export().status_code, 200)
+        counts = admission.stats()['export_monthly_history']
+        self.assertEqual((counts['timeout'], counts['admitted']), (1, 1))
+
+    def test_limits_fit_thread_budget(self):
+        config = {
+            'export_monthly_history': {'concurrency': 2, 'queue': 4},
+            'export_monthly_ledger': {'concurrency': 1, 'queue': 2},
+            'generate_invoice': {'concurrency': 4, 'queue': 8},
+            'import_companies': {'rate': (5, 60)},
+        }
+        with override_settings(ADMISSION_CONTROL=config, WEB_THREADS=10, ADMISSION_THREAD_SHARE=0.5):
+            limits = [admission.effective_limits(c) for c in config.values() if c.get('concurrency')]
+        # 10 スレッドのうち実行・待機に使うのは半分まで（各エンドポイントに少なくとも1つの実行枠）
+        self.assertEqual(limits, [(1, 0), (1, 0), (1, 1)])
+        self.assertLessEqual(sum(c + q for c, q in limits), 5)
+        with override_settings(ADMISSION_CONTROL=config, WEB_THREADS=64):
+            self.assertEqual(admission.effective_limits(config['generate_invoice']), (4, 8))
+
+    @mock.patch('invoices.admission.fcntl', None)
+    def test_missing_fcntl_logs_warning(self):
+        admission._warn_without_locks.cache_clear()
+        self.addCleanup(admission._warn_without_locks.cache_clear)
+        with self.limit(concurrency=1, queue=0), self.assertLogs('invoices.admission', 'WARNING'):
+            self.assertEqual(self.export().status_code, 200)
+
+    def test_slot_is_held_while_streaming(self):
+        with self.limit(concurrency=1, queue=0):
+            response = self.export()
+            self.assertIsNone(admission._acquire('export_monthly_history', 'run', 1))
+            b''.join(response.streaming_content)
+            slot = admission._acquire('export_monthly_history', 'run', 1)
+            self.assertIsNotNone(slot)
+            slot.release()
+
+
+class WarmUpTests(TestCase):
+    """ワーカー起動時のウォームアップのテスト"""
+
+    def test_warm_up_primes_each_stage(self):
+        from .warmup import warm_up
+
+        self.assertEqual(set(warm_up()), {'openpyxl', 'templates', 'database', 'cache'})
+
+
+@override_settings(COMPANY_PURGE_IN_BACKGROUND=False)
+class CompanyDeletionTests(CacheTestCase):
+    """取引先会社の無効化と完全削除のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.director = CustomUser.objects.create_user('director', password='pw', role='director')
+        self.client.force_login(self.director)
+        self.company = make_company('0001')
+        for number in range(3):
+            make_invoice(self.company, f'A{number}', items=[('作業', 1, 100), ('部品', 1, 50)])
+
+    def delete(self, **data):
+        return self.client.post(reverse('invoices:delete_company', args=[self.company.pk]), data).json()
+
+    def test_deactivate_hides_company_and_keeps_history(self):
+        self.client.get(reverse('invoices:admin_companies'))  # ログインユーザーをキャッシュ
+        with self.assertNumQueries(2):  # 会社の取得と更新のみ（請求書は読み込まない）
+            self.assertTrue(self.delete()['success'])
+        response = self.client.get(reverse('invoices:get_company_info'), {'company_code': '0001'})
+        self.assertFalse(response.json()['success'])
+        response = self.client.get(reverse('invoices:create_invoice_view'))
+        self.assertNotIn(self.company, response.context['companies'])
+        self.assertEqual(Invoice.objects.filter(company=self.company).count(), 3)
+
+        self.client.post(reverse('invoices:restore_company', args=[self.company.pk]))
+        self.assertTrue(Company.active.filter(pk=self.company.pk).exists())
+
+    def test_purge_requires_deactivation(self):
+        self.assertFalse(self.delete(purge='1')['success'])
+        self.assertTrue(Company.objects.filter(pk=self.company.pk).exists())
+
+    def test_purge_deletes_in_batches_with_progress(self):
+        self.delete()
+        reports = []
+        deleted = company_purge.purge_company(self.company.pk, batch_size=2, on_progress=lambda *a: reports.append(a))
+        self.assertEqual(deleted, 3)
+        self.assertEqual(reports, [(2, 3), (3, 3)])
+        self.assertFalse(Company.objects.filter(pk=self.company.pk).exists())
+        self.assertFalse(InvoiceDetail.objects.exists())
+
+    def test_purge_view_reports_progress(self):
+        self.delete()
+        data = self.delete(purge='1')
+        self.assertTrue(data['success'])
+        progress = self.client.get(data['status_url']).json()['progress']
+        self.assertEqual(progress, {'status': 'done', 'deleted': 3, 'total': 3})
+        self.assertFalse(Invoice.objects.exists())
+
+    @override_settings(COMPANY_PURGE_IN_BACKGROUND=True)
+    def test_repeated_purge_starts_one_thread(self):
+        self.delete()
+        with mock.patch.object(company_purge.threading, 'Thread') as thread:
+            first, second = self.delete(purge='1'), self.delete(purge='1')
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual((first['message'], second['message']), ('完全削除を開始しました', '完全削除は依頼済みです'))
+        self.assertEqual(second['status_url'], first['status_url'])
+
+
+class ReadApiTests(CacheTestCase):
+    """請求書・取引先会社の読み取り API のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('manager', password='pw', role='manager')
+        self.client.force_login(self.user)
+        tz = timezone.get_current_timezone()
+        self.first, self.second = make_company('0001'), make_company('0002')
+        for day in range(1, 6):
+            make_invoice(self.first, f'A{day}', items=[('作業', 2, 100), ('部品', 1, 50)], created_at=datetime(2023, 3, day, tzinfo=tz))
+            make_invoice(self.second, f'B{day}', created_at=datetime(2023, 3, day, 12, tzinfo=tz))
+        archive.archive_invoices(datetime(2023, 3, 3, tzinfo=tz))
+
+    def get(self, name='invoices:api_invoices', **params):
+        return self.client.get(reverse(name), params)
+
+    def test_general_user_forbidden(self):
+        self.client.force_login(CustomUser.objects.create_user('general', password='pw'))
+        for name in ('invoices:api_invoices', 'invoices:api_companies'):
+            response = self.get(name)
+            self.assertEqual(response.status_code, 403)
+            self.assertNotIn('results', response.json())
+
+    def test_cursor_walks_hot_and_archived_invoices(self):
+        numbers, cursor, query_counts = [], '', []
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.get(limit=3, cursor=cursor).json()
+            query_counts.append(len(queries))
+            numbers += [invoice['invoice_number'] for invoice in data['results']]
+            cursor = data['next_cursor']
+            if not data['has_next']:
+                break
+        self.assertEqual(numbers, [f'{prefix}{day}' for day in range(1, 6) for prefix in 'AB'])
+        # 何ページ目でも請求書（作業用・保管用）と明細（同）の最大4クエリ（オフセットで読み飛ばさない）
+        self.assertLessEqual(max(query_counts), 4)
+        # 最後のカーソルからは新しく作成された分だけを取得できる
+        make_invoice(self.first, 'A6')
+        data = self.get(cursor=cursor).json()
+        self.assertEqual([invoice['invoice_number'] for invoice in data['results']], ['A6'])
+
+    def test_filters_and_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get(company='0001', date_from='2023-03-02', date_to='2023-03-04', fields='invoice_number,total').json()
+        self.assertEqual(data['results'], [
+            {'invoice_number': 'A2', 'total': '250.00'},
+            {'invoice_number': 'A3', 'total': '250.00'},
+            {'invoice_number': 'A4', 'total': '250.00'},
+        ])
+        self.assertFalse(any('invoices_company' in query['sql'] and 'JOIN' in query['sql'] for query in queries))
+        data = self.get(fields='id,invoice_number', limit=1).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'invoice_number'})
+        detail = self.get(fields='details', limit=1).json()['results'][0]['details']
+        self.assertEqual([row['item_name'] for row in detail], ['作業', '部品'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(cursor='!!').status_code, 400)
+        self.assertEqual(self.get(fields='secret').status_code, 400)
+        self.assertEqual(self.get(date_from='2023/03/01').status_code, 400)
+        self.assertEqual(self.get(company='9999').status_code, 404)
+
+    def test_unchanged_page_returns_not_modified(self):
+        response = self.get(limit=2)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('invoices:api_invoices'), {'limit': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ArchivedInvoice.objects.filter(invoice_number='A1').update(customer_id='changed')
+        self.assertEqual(self.client.get(reverse('invoices:api_invoices'), {'limit': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_companies_include_inactive(self):
+        company_purge.deactivate(self.second)
+        data = self.get('invoices:api_companies', fields='company_code,is_active', limit=1).json()
+        self.assertEqual(data['results'], [{'company_code': '0001', 'is_active': True}])
+        data = self.get('invoices:api_companies', fields='company_code,is_active', cursor=data['next_cursor']).json()
+        self.assertEqual((data['results'], data['has_next']), ([{'company_code': '0002', 'is_active': False}], False))
+
+
+class ItemCatalogTests(CacheTestCase):
+    """請求書項目カタログのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(CustomUser.objects.create_user('general', password='pw'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = InvoiceItemTemplate.objects.create(name='作業', default_unit_price=Decimal('1500'))
+
+    def get(self, **extra):
+        return self.client.get(reverse('invoices:item_catalog'), **extra)
+
+    def test_document_and_not_modified_without_queries(self):
+        response = self.get()
+        self.assertEqual(response.json()['items'], [[self.item.pk, '作業', '', '1500.00']])
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_save_and_delete_change_etag(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItemTemplate.objects.create(name='部品', default_unit_price=Decimal('200'))
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item[1] for item in response.json()['items']], ['作業', '部品'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+        self.assertEqual([item[1] for item in self.get().json()['items']], ['部品'])
+
+    def test_versioned_url_is_cached_by_browser(self):
+        url = views.item_catalog_url()
+        self.assertIn(url, self.client.get(reverse('invoices:create_invoice_view')).content.decode())
+        response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+
+
+class GenerationLogTests(CacheTestCase):
+    """生成ログ（請求書生成・取引履歴出力の実行記録）のテスト"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user('manager', password='pw', role='manager')
+        self.client.force_login(self.user)
+        self.company = make_company('0001')
+
+    def add_log(self, duration_ms, days_ago=0, outcome='success'):
+        return GenerationLog.objects.create(
+            endpoint='generate_invoice', started_at=timezone.now() - timedelta(days=days_ago),
+            outcome=outcome, duration_ms=duration_ms,
+        )
+
+    def test_generate_invoice_records_phases(self):
+        response = self.client.post(reverse('invoices:generate_invoice'), {
+            'company_code': '0001',
+            'item_name[]': ['作業', '部品'], 'item_quantity[]': ['1', '2'], 'item_price[]': ['100', '50'],
+        })
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        log = GenerationLog.objects.get()
+        self.assertEqual((log.endpoint, log.outcome, log.user_id, log.rows), ('generate_invoice', 'success', self.user.pk, 2))
+        self.assertEqual(set(log.phases), {'db', 'render'})
+        self.assertGreater(log.bytes, 0)
+
+    def test_streamed_history_records_rows_and_bytes(self):
+        make_invoice(self.company, 'A1', items=[('作業', 2, 100), ('部品', 1, 50)])
+        now = timezone.localtime()
+        response = self.client.post(reverse('invoices:export_monthly_history'), {
+            'company_code': '0001', 'year': now.year, 'month': now.month, 'format': 'csv',
+        })
+        self.assertFalse(GenerationLog.objects.exists())
+        content = b''.join(response.streaming_content)
+        log = GenerationLog.objects.get()
+        self.assertEqual((log.endpoint, log.outcome, log.rows, log.bytes), ('export_monthly_history', 'success', 2, len(content)))
+        self.assertIn('stream', log.phases)
+
+    def test_background_flush(self):
+        with override_settings(GENERATION_LOG_IN_BACKGROUND=True), \
+                mock.patch.object(generation_log, '_ensure_flusher'):
+            generation_log.GenerationTimer('generate_invoice', self.user).finish('success')
+            self.assertFalse(GenerationLog.objects.exists())
+            self.assertEqual(generation_log.flush(), 1)
+        self.assertEqual(GenerationLog.objects.get().outcome, 'success')
+
+    def test_daily_stats_percentiles(self):
+        for duration in range(1, 101):
+            self.add_log(duration, outcome='failed' if duration == 100 else 'success')
+        self.add_log(5000, days_ago=30)
+        response = self.client.get(reverse('invoices:generation_stats'))
+        [stats] = response.json()['stats']
+        self.assertEqual((stats['count'], stats['failures']), (100, 1))
+        self.assertEqual((stats['p50_ms'], stats['p95_ms'], stats['p99_ms']), (50, 95, 99))
+
+    def test_daily_stats_counts_only_failures(self):
+        for outcome in ('success', 'cached', 'duplicate', 'failed', 'error'):
+            self.add_log(10, outcome=outcome)
+        [stats] = generation_log.daily_stats()
+        self.assertEqual((stats['count'], stats['failures']), (5, 2))
+
+    def test_prune_removes_expired_logs(self):
+        kept = self.add_log(10, days_ago=1)
+        for _ in range(3):
+            self.add_log(10, days_ago=100)
+        self.assertEqual(generation_log.prune(90, batch_size=2), 3)
+        self.assertEqual(list(GenerationLog.objects.values_list('id', flat=True)), [kept.pk])
 
-# Create your tests here.
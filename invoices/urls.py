@@ -13,13 +13,25 @@ urlpatterns = [
     path('admin/users/', views.admin_users, name='admin_users'),
     path('admin/create-invoice/', views.admin_create_invoice, name='admin_create_invoice'),
     path('admin/export-history/', views.admin_export_history, name='admin_export_history'),
+    path('admin/render-cache-stats/', views.render_cache_stats, name='render_cache_stats'),
+    path('admin/admission-stats/', views.admission_stats, name='admission_stats'),
+    path('admin/generation-stats/', views.generation_stats, name='generation_stats'),
     path('admin/add-company/', views.add_company, name='add_company'),
+    path('admin/import-companies/', views.import_companies, name='import_companies'),
     path('admin/add-invoice-item/', views.add_invoice_item_template, name='add_invoice_item_template'),
     path('admin/add-user/', views.add_user, name='add_user'),
     path('admin/delete-user/<int:user_id>/', views.delete_user, name='delete_user'),
     path('admin/delete-company/<int:company_id>/', views.delete_company, name='delete_company'),
+    path('admin/restore-company/<int:company_id>/', views.restore_company, name='restore_company'),
+    path('admin/company-purge-status/<int:company_id>/', views.company_purge_status, name='company_purge_status'),
     path('create-invoice/', views.create_invoice_view, name='create_invoice_view'),
     path('get-company-info/', views.get_company_info, name='get_company_info'),
+    path('item-catalog/', views.item_catalog, name='item_catalog'),
     path('generate-invoice/', views.generate_invoice, name='generate_invoice'),
+    path('invoices/search/', views.search_invoices, name='search_invoices'),
+    path('api/invoices/', views.api_invoices, name='api_invoices'),
+    path('api/companies/', views.api_companies, name='api_companies'),
+    path('invoices/<int:invoice_id>/download/', views.download_invoice, name='download_invoice'),
     path('export-monthly-history/', views.export_monthly_history, name='export_monthly_history'),
+    path('admin/export-monthly-ledger/', views.export_monthly_ledger, name='export_monthly_ledger'),
 ]
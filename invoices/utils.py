@@ -0,0 +1,37 @@
+import re
+
+from django.db.models.functions import Length
+
+from .models import Company
+
+
+def normalize_phone(phone):
+    """電話番号を半角数字のみに変換"""
+    return re.sub(r'[^0-9]', '', phone or '')
+
+
+def normalize_postal_code(postal_code):
+    """郵便番号からハイフンを削除"""
+    return (postal_code or '').replace('-', '').strip()
+
+
+def format_company_code(number):
+    """数値を会社コード（4桁以上の数字）に変換"""
+    return str(number).zfill(4)
+
+
+def next_company_code_number():
+    """次に採番する会社コードの数値を取得（1クエリ）"""
+    last_code = (
+        Company.objects
+        .filter(company_code__regex=r'^[0-9]{4,}$')
+        .order_by(Length('company_code').desc(), '-company_code')
+        .values_list('company_code', flat=True)
+        .first()
+    )
+    return int(last_code) + 1 if last_code else 1
+
+
+def next_company_code():
+    """次の会社コードを生成（4桁の数字、1から開始）"""
+    return format_company_code(next_company_code_number())
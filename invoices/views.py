@@ -1,23 +1,34 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, FileResponse, JsonResponse
+from django.http import Http404, HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from django.views.decorators.http import require_http_methods
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import condition, conditional_page, require_GET, require_http_methods
 from pathlib import Path
 from .models import CustomUser, Company, Invoice, InvoiceDetail, InvoiceItemTemplate
-import openpyxl
-from openpyxl.styles import Font, Alignment
+from . import admission, api, archive, catalog, company_import, company_purge, exports, generation_log, idempotency, ledger_version, rendering, reports, routers, search
+from .render_cache import get_render_cache, make_key
+from .utils import next_company_code, normalize_phone, normalize_postal_code
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 import warnings
 import json
 
+# openpyxl は出力処理の中で必要になったときに読み込む（起動時間の短縮）
 warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
 
 # BASE_DIRを取得
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# バージョン付きの請求書項目カタログをブラウザにキャッシュさせる秒数
+ITEM_CATALOG_MAX_AGE = 60 * 60 * 24 * 365
+
 
 def home_redirect(request):
     """ルートURL: ログイン状態に応じてリダイレクト"""
@@ -78,40 +89,29 @@ def admin_dashboard(request):
         messages.error(request, '管理画面へのアクセス権限がありません。')
         return redirect('invoices:create_invoice_view')
     
-    companies = Company.objects.all()
-    companies_count = companies.count()
-    invoice_items_count = InvoiceItemTemplate.objects.count()
-    users_count = CustomUser.objects.count()
-    invoices_count = Invoice.objects.count()
-    
     # 次の会社コードを生成（4桁の数字、1から開始）
-    next_code = '0001'
-    if companies.exists():
-        # 数字のみの会社コードを抽出して最大値を取得
-        numeric_codes = []
-        for company in companies:
-            try:
-                # 会社コードが4桁の数字かチェック
-                if company.company_code.isdigit() and len(company.company_code) == 4:
-                    numeric_codes.append(int(company.company_code))
-            except:
-                pass
-        
-        if numeric_codes:
-            max_code = max(numeric_codes)
-            next_code = str(max_code + 1).zfill(4)
+    # 登録に使う値なのでレプリカではなく default から読む
+    next_code = next_company_code()
     
-    context = {
-        'companies': companies,
-        'companies_count': companies_count,
-        'invoice_items_count': invoice_items_count,
-        'users_count': users_count,
-        'invoices_count': invoices_count,
-        'is_director': request.user.is_director(),
-        'is_admin': request.user.is_admin(),
-        'next_company_code': next_code,
-    }
-    return render(request, 'invoices/admin/dashboard.html', context)
+    # 件数・一覧の表示はレプリカから読む
+    with routers.replica_reads(request.user):
+        companies = Company.active.all()
+        companies_count = companies.count()
+        invoice_items_count = InvoiceItemTemplate.objects.count()
+        users_count = CustomUser.objects.count()
+        invoices_count = Invoice.objects.count()
+        
+        context = {
+            'companies': companies,
+            'companies_count': companies_count,
+            'invoice_items_count': invoice_items_count,
+            'users_count': users_count,
+            'invoices_count': invoices_count,
+            'is_director': request.user.is_director(),
+            'is_admin': request.user.is_admin(),
+            'next_company_code': next_code,
+        }
+        return render(request, 'invoices/admin/dashboard.html', context)
 
 
 @login_required
@@ -121,28 +121,17 @@ def admin_companies(request):
         messages.error(request, '管理画面へのアクセス権限がありません。')
         return redirect('invoices:create_invoice_view')
     
-    companies = Company.objects.all()
+    companies = Company.active.all()
+    inactive_companies = Company.objects.filter(is_active=False)
     
     # 次の会社コードを生成（4桁の数字、1から開始）
-    next_code = '0001'
-    if companies.exists():
-        # 数字のみの会社コードを抽出して最大値を取得
-        numeric_codes = []
-        for company in companies:
-            try:
-                # 会社コードが4桁の数字かチェック
-                if company.company_code.isdigit() and len(company.company_code) == 4:
-                    numeric_codes.append(int(company.company_code))
-            except:
-                pass
-        
-        if numeric_codes:
-            max_code = max(numeric_codes)
-            next_code = str(max_code + 1).zfill(4)
+    next_code = next_company_code()
     
     context = {
         'companies': companies,
+        'inactive_companies': inactive_companies,
         'is_admin': request.user.is_admin(),
+        'is_director': request.user.is_director(),
         'next_company_code': next_code,
     }
     return render(request, 'invoices/admin/companies.html', context)
@@ -187,11 +176,13 @@ def admin_create_invoice(request):
         messages.error(request, '管理画面へのアクセス権限がありません。')
         return redirect('invoices:create_invoice_view')
     
-    companies = Company.objects.all().order_by('company_code')
+    companies = Company.active.all().order_by('company_code')
     
     context = {
         'companies': companies,
         'is_admin': request.user.is_admin(),
+        'idempotency_key': idempotency.new_key(),
+        'item_catalog_url': item_catalog_url(),
     }
     return render(request, 'invoices/admin/create_invoice.html', context)
 
@@ -205,6 +196,7 @@ def admin_export_history(request):
     
     context = {
         'is_admin': request.user.is_admin(),
+        'months': range(1, 13),
     }
     return render(request, 'invoices/admin/export_history.html', context)
 
@@ -217,36 +209,17 @@ def add_company(request):
         return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
     
     try:
-        import re
         # 会社コードを自動生成（4桁の数字、1から開始）
-        companies = Company.objects.all()
-        next_code = '0001'
-        if companies.exists():
-            # 数字のみの会社コードを抽出して最大値を取得
-            numeric_codes = []
-            for company in companies:
-                try:
-                    # 会社コードが4桁の数字かチェック
-                    if company.company_code.isdigit() and len(company.company_code) == 4:
-                        numeric_codes.append(int(company.company_code))
-                except:
-                    pass
-            
-            if numeric_codes:
-                max_code = max(numeric_codes)
-                next_code = str(max_code + 1).zfill(4)
-        
-        company_code = next_code
+        company_code = next_company_code()
         
         company_name = request.POST.get('company_name', '')
         contact_person = request.POST.get('contact_person', '')
         address = request.POST.get('address', '')
-        postal_code = request.POST.get('postal_code', '').replace('-', '')  # ハイフンを削除
+        postal_code = normalize_postal_code(request.POST.get('postal_code', ''))  # ハイフンを削除
         prefecture = request.POST.get('prefecture', '')
         
         # 電話番号を半角数字のみに変換
-        phone = request.POST.get('phone', '')
-        phone = re.sub(r'[^0-9]', '', phone)  # 数字以外を削除
+        phone = normalize_phone(request.POST.get('phone', ''))
         
         email = request.POST.get('email', '')
         
@@ -269,6 +242,29 @@ def add_company(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@login_required
+@require_http_methods(["POST"])
+@admission.admission_control('import_companies')
+def import_companies(request):
+    """取引先会社一括取込（CSV/XLSX）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'ファイルを選択してください'})
+    
+    try:
+        result = company_import.import_companies(company_import.iter_rows(upload.file, upload.name))
+        return JsonResponse({
+            'success': True,
+            'message': f'{result.imported}件の取引先会社を取り込みました',
+            **result.as_dict(),
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
 @login_required
 @require_http_methods(["POST"])
 def add_invoice_item_template(request):
@@ -279,10 +275,15 @@ def add_invoice_item_template(request):
     try:
         name = request.POST.get('name', '')
         description = request.POST.get('description', '')
+        try:
+            default_unit_price = Decimal(request.POST.get('default_unit_price') or '0')
+        except InvalidOperation:
+            return JsonResponse({'success': False, 'error': '既定単価は数値で入力してください'})
         
         InvoiceItemTemplate.objects.create(
             name=name,
-            description=description
+            description=description,
+            default_unit_price=default_unit_price,
         )
         
         return JsonResponse({'success': True, 'message': '請求書項目を追加しました'})
@@ -336,24 +337,64 @@ def delete_user(request, user_id):
 @login_required
 @require_http_methods(["POST"])
 def delete_company(request, company_id):
-    """取引先会社削除（管理者以上）"""
+    """取引先会社削除（管理者以上）
+
+    通常は無効化のみ行い（請求書の履歴は残る）、purge を指定すると無効化済みの
+    会社を請求書・明細ごとバックグラウンドで完全に削除する（責任者のみ）。
+    """
     if not request.user.is_admin():
         return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
     
     try:
         company = get_object_or_404(Company, pk=company_id)
-        company.delete()
-        return JsonResponse({'success': True, 'message': '取引先会社を削除しました'})
+        if not request.POST.get('purge'):
+            company_purge.deactivate(company)
+            return JsonResponse({'success': True, 'message': '取引先会社を無効化しました'})
+        
+        if not request.user.is_director():
+            return JsonResponse({'success': False, 'error': '完全削除は責任者のみ実行できます'}, status=403)
+        if company.is_active:
+            return JsonResponse({'success': False, 'error': '完全削除する前に無効化してください'})
+        started = company_purge.request_purge(company)
+        return JsonResponse({
+            'success': True,
+            'message': '完全削除を開始しました' if started else '完全削除は依頼済みです',
+            'status_url': reverse('invoices:company_purge_status', args=[company_id]),
+        })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@login_required
+@require_http_methods(["POST"])
+def restore_company(request, company_id):
+    """無効化した取引先会社を有効に戻す（管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    company = get_object_or_404(Company, pk=company_id, purge_requested_at__isnull=True)
+    company_purge.restore(company)
+    return JsonResponse({'success': True, 'message': '取引先会社を有効にしました'})
+
+
+@login_required
+def company_purge_status(request, company_id):
+    """取引先会社の完全削除の進捗（管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    progress = company_purge.get_progress(company_id)
+    if progress is None:
+        return JsonResponse({'success': False, 'error': '完全削除の記録が見つかりません'}, status=404)
+    return JsonResponse({'success': True, 'progress': progress})
+
+
 @login_required
 def get_company_info(request):
     """会社コードから会社情報を取得（AJAX）"""
     company_code = request.GET.get('company_code', '').upper()
     try:
-        company = Company.objects.get(company_code=company_code)
+        company = Company.active.get(company_code=company_code)
         return JsonResponse({
             'success': True,
             'company': {
@@ -376,23 +417,208 @@ def get_company_info(request):
 @login_required
 def create_invoice_view(request):
     """請求書作成画面"""
-    companies = Company.objects.all()
+    companies = Company.active.all()
     context = {
         'companies': companies,
         'is_admin': request.user.is_admin(),
+        'idempotency_key': idempotency.new_key(),
+        'item_catalog_url': item_catalog_url(),
     }
     return render(request, 'invoices/create_invoice.html', context)
 
 
+def item_catalog_url():
+    """バージョン付きの請求書項目カタログの URL（項目が変わるまでブラウザのキャッシュを使う）"""
+    return f"{reverse('invoices:item_catalog')}?v={catalog.get_version()}"
+
+
+def _item_catalog_etag(request):
+    return catalog.etag()
+
+
+@login_required
+@require_GET
+@condition(etag_func=_item_catalog_etag)
+def item_catalog(request):
+    """請求書項目の一覧（JSON、請求書作成画面の自動入力用）
+
+    ETag は変更回数から求めるため、変わっていなければデータベースを読まずに
+    304 を返す。現在のバージョンを v に付けた URL はブラウザに長期間キャッシュさせる。
+    """
+    response = HttpResponse(catalog.get_document(), content_type='application/json; charset=utf-8')
+    if request.GET.get('v') == str(catalog.get_version()):
+        patch_cache_control(response, private=True, max_age=ITEM_CATALOG_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _invoice_file_response(invoice, details=None):
+    """請求書ファイルのダウンロードレスポンス（内容が変わっていなければキャッシュを返す）"""
+    if details is None:
+        details = list(invoice.details.all())
+    path = rendering.render_invoice(invoice, details)
+    file = open(path, 'rb')
+    return FileResponse(file, as_attachment=True, filename=rendering.invoice_filename(invoice))
+
+
+@login_required
+def download_invoice(request, invoice_id):
+    """作成済みの請求書を再ダウンロード（管理者以上、または作成者）"""
+    # 保管済みの古い請求書も同じ URL で再ダウンロードできる
+    invoice = archive.find_invoice(invoice_id)
+    if invoice is None:
+        raise Http404('請求書が見つかりません')
+    if not request.user.is_admin() and invoice.created_by_id != request.user.pk:
+        messages.error(request, 'この請求書をダウンロードする権限がありません。')
+        return redirect('invoices:create_invoice_view')
+    
+    try:
+        return _invoice_file_response(invoice)
+    except Exception as e:
+        messages.error(request, f'エラーが発生しました: {str(e)}')
+        return redirect('invoices:create_invoice_view')
+
+
+@login_required
+def admission_stats(request):
+    """流入制御の判定件数（管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    return JsonResponse({'success': True, 'stats': admission.stats()})
+
+
+@login_required
+@routers.use_replica
+def generation_stats(request):
+    """請求書生成・取引履歴出力の日ごとの件数・所要時間の百分位数（管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    try:
+        days = min(max(int(request.GET.get('days', 14)), 1), settings.GENERATION_LOG_RETENTION_DAYS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': '日数が正しくありません'}, status=400)
+    return JsonResponse({'success': True, 'stats': generation_log.daily_stats(days)})
+
+
+@login_required
+@routers.use_replica
+def search_invoices(request):
+    """請求書番号・会社名・会社コード・請求内容で請求書を検索（AJAX、関連度順。管理者以上以外は自分が作成した請求書のみ）"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    
+    invoices, has_next = search.search_invoices(
+        query, offset=(page - 1) * search.PAGE_SIZE, limit=search.PAGE_SIZE,
+        user=None if request.user.is_admin() else request.user,
+    )
+    return JsonResponse({
+        'success': True,
+        'page': page,
+        'has_next': has_next,
+        'results': [
+            {
+                'id': invoice.id,
+                'invoice_number': invoice.invoice_number,
+                'company_code': invoice.billed_company_code,
+                'company_name': invoice.billed_company_name,
+                'created_at': exports.format_created_at(invoice.created_at),
+                'download_url': reverse('invoices:download_invoice', args=[invoice.id]),
+            }
+            for invoice in invoices
+        ],
+    })
+
+
+def api_response(results, page):
+    """API の1ページ分のレスポンス（内容から ETag を付け、変化がなければ 304）"""
+    response = JsonResponse({'success': True, 'results': results, **page})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@require_GET
+@conditional_page
+@routers.use_replica
+def api_invoices(request):
+    """請求書と明細の一覧（JSON、作成日時順のカーソルページング、管理者以上）
+
+    company（会社コード）・date_from・date_to（YYYY-MM-DD）で絞り込み、
+    fields で出力項目を選べる。続きは next_cursor を cursor に渡して取得する。
+    """
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    company = None
+    company_code = request.GET.get('company', '').upper()
+    if company_code:
+        company = Company.objects.filter(company_code=company_code).first()
+        if company is None:
+            return JsonResponse({'success': False, 'error': '会社コードが見つかりません'}, status=404)
+    try:
+        results, page = api.invoice_page(request.GET, company)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return api_response(results, page)
+
+
+@login_required
+@require_GET
+@conditional_page
+@routers.use_replica
+def api_companies(request):
+    """取引先会社の一覧（JSON、作成日時順のカーソルページング、無効化した会社も含む、管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    try:
+        results, page = api.company_page(request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return api_response(results, page)
+
+
+@login_required
+def render_cache_stats(request):
+    """出力キャッシュのヒット率・使用量（管理者以上）"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'error': '権限がありません'}, status=403)
+    
+    return JsonResponse({'success': True, 'stats': get_render_cache().stats()})
+
+
 @login_required
 @require_http_methods(["POST"])
+@admission.admission_control('generate_invoice')
+@generation_log.logged('generate_invoice')
 def generate_invoice(request):
     """請求書生成"""
+    timer = request.generation_timer
     try:
+        # 二重送信（ダブルクリック・再送）の場合は作成済みの請求書を返す
+        idempotency_key = idempotency.request_key(request)
+        if idempotency_key:
+            invoice = idempotency.find_invoice(idempotency_key)
+            if invoice is not None:
+                timer.outcome = 'duplicate'
+                with timer.phase('render'):
+                    return _invoice_file_response(invoice)
+        
         company_code = request.POST.get('company_code', '').upper()
         
-        # 会社情報を取得
-        company = Company.objects.get(company_code=company_code)
+        # 会社情報を取得（無効化した会社には請求書を作成しない）
+        company = Company.active.get(company_code=company_code)
+        
+        # テンプレートファイルの確認（請求書を登録する前に行う）
+        if not rendering.template_path().exists():
+            messages.error(request, 'テンプレートファイルが見つかりません。')
+            return redirect('invoices:create_invoice_view')
         
         # 請求書番号を自動生成（会社コード_YYYY_MM_DD形式）
         now = datetime.now()
@@ -410,159 +636,200 @@ def generate_invoice(request):
         if post_invoice_number:
             invoice_number = post_invoice_number
         
-        # 請求書を作成
-        invoice = Invoice.objects.create(
-            invoice_number=invoice_number,
-            company=company,
-            customer_id=company_code,
-            created_by=request.user
-        )
-        
         # 請求明細を取得
         item_names = request.POST.getlist('item_name[]')
         item_quantities = request.POST.getlist('item_quantity[]')
         item_prices = request.POST.getlist('item_price[]')
-        item_amounts = request.POST.getlist('item_amount[]')
-        
-        details = []
-        for i, (name, qty, price, amount) in enumerate(zip(item_names, item_quantities, item_prices, item_amounts)):
-            if name and qty and price:
-                detail = InvoiceDetail.objects.create(
-                    invoice=invoice,
-                    item_name=name,
-                    quantity=int(qty),
-                    unit_price=float(price),
-                    amount=float(amount) if amount else int(qty) * float(price),
-                    order=i
+        
+        # 請求書と明細は1トランザクションで登録（同じキーの同時送信は一意制約で1件に絞る）
+        try:
+            with timer.phase('db'), transaction.atomic(), search.batched_refresh():
+                invoice = Invoice.objects.create(
+                    invoice_number=invoice_number,
+                    company=company,
+                    customer_id=company_code,
+                    created_by=request.user,
+                    idempotency_key=idempotency_key
                 )
-                details.append(detail)
+                
+                details = []
+                for i, (name, qty, price) in enumerate(zip(item_names, item_quantities, item_prices)):
+                    if name and qty and price:
+                        # 金額は InvoiceDetail.save() で個数×単価から計算
+                        detail = InvoiceDetail.objects.create(
+                            invoice=invoice,
+                            item_name=name,
+                            quantity=int(qty),
+                            unit_price=Decimal(price),
+                            amount=0,
+                            order=i
+                        )
+                        details.append(detail)
+        except IntegrityError:
+            invoice = idempotency.find_invoice(idempotency_key) if idempotency_key else None
+            if invoice is None:
+                raise
+            timer.outcome = 'duplicate'
+            return _invoice_file_response(invoice)
+        
+        # 作成した請求書が直後の取引履歴出力に含まれるよう、しばらくレプリカを使わない
+        routers.pin_primary(request.user)
+        
+        # ファイルを出力してダウンロード
+        timer.rows = len(details)
+        with timer.phase('render'):
+            response = _invoice_file_response(invoice, details)
+        messages.success(request, '請求書を作成しました。')
+        return response
         
-        # テンプレートファイルのパス
-        template_path = BASE_DIR / 'invoice_template.xlsx'
+    except Company.DoesNotExist:
+        messages.error(request, '会社コードが見つかりません。')
+        return redirect('invoices:create_invoice_view')
+    except Exception as e:
+        timer.outcome = 'error'
+        messages.error(request, f'エラーが発生しました: {str(e)}')
+        return redirect('invoices:create_invoice_view')
+
+
+@login_required
+@require_http_methods(["POST"])
+@admission.admission_control('export_monthly_history')
+@generation_log.logged('export_monthly_history')
+@routers.use_replica
+def export_monthly_history(request):
+    """月ごとの取引履歴一覧（明細、または請求内容別・請求書別・月別の集計）をエクセルに出力"""
+    timer = request.generation_timer
+    try:
+        company_code = request.POST.get('company_code', '').upper()
+        year = int(request.POST.get('year', datetime.now().year))
+        month = int(request.POST.get('month', datetime.now().month))
+        months = int(request.POST.get('months') or 1)
+        mode = request.POST.get('mode') or 'lines'
         
-        if not template_path.exists():
-            messages.error(request, 'テンプレートファイルが見つかりません。')
+        if mode != 'lines' and mode not in reports.REPORT_MODES:
+            messages.error(request, '集計の種類が正しくありません。')
+            return redirect('invoices:create_invoice_view')
+        if not 1 <= months <= exports.MAX_PERIOD_MONTHS:
+            messages.error(request, f'期間は1〜{exports.MAX_PERIOD_MONTHS}か月で指定してください。')
             return redirect('invoices:create_invoice_view')
         
-        # テンプレートを開く
-        book = openpyxl.load_workbook(template_path)
-        sheet = book.active
-        
-        # 会社情報を書き込む
-        sheet["A8"] = company.contact_person  # 請求先会社の担当者
-        sheet["A9"] = company.company_name  # 会社名
-        sheet["A10"] = company.address  # 会社の番地
-        sheet["A11"] = f"{company.postal_code} {company.prefecture}"  # 郵便番号/都道府県
-        sheet["A12"] = company.phone  # 電話番号
-        sheet["A13"] = company.email  # メールアドレス
-        sheet["A16"] = invoice_number  # 請求書番号
-        sheet["F5"] = invoice_number  # 請求書番号
-        sheet["F8"] = company_code  # 顧客ID
-        sheet["H5"] = datetime.now().strftime('%Y年%m月%d日')  # 請求書作成日時
-        
-        # 請求内訳を書き込む（A17/F17/G17/H17から開始、10セット分）
-        # A16は請求書番号が入るため、請求内訳はA17から開始
-        start_row = 17
-        for i, detail in enumerate(details[:10]):  # 最大10セット
-            row = start_row + i
-            sheet[f"A{row}"] = detail.item_name  # 請求内容
-            sheet[f"F{row}"] = detail.quantity  # 個数
-            sheet[f"G{row}"] = detail.unit_price  # 単価
-            sheet[f"H{row}"] = detail.amount  # 金額
-        
-        # ファイル名を生成
-        safe_company_name = company.company_name.replace('/', '_').replace('\\', '_')
-        filename = f'invoice_{safe_company_name}_{company_code}_{invoice_number}.xlsx'
-        save_dir = BASE_DIR / 'generated_invoices'
-        save_path = save_dir / filename
+        company = Company.objects.get(company_code=company_code)
         
-        # 保存ディレクトリが存在しない場合は作成
-        save_dir.mkdir(exist_ok=True)
+        # 該当期間の明細を請求書と合わせて1クエリで取得
+        start, end = exports.period_range(year, month, months)
+        with timer.phase('query'):
+            has_ledger = exports.has_ledger(start, end, company)
+        if not has_ledger:
+            messages.error(request, '該当する取引履歴が見つかりません。')
+            return redirect('invoices:create_invoice_view')
         
-        # 保存
-        book.save(str(save_path))
+        # ファイル名を生成
+        export_format = exports.negotiate_format(request)
+        safe_company_name = exports.safe_filename(company.company_name)
+        period = exports.period_label(year, month, months)
+        if mode == 'lines':
+            filename = f'invoice_{safe_company_name}_{company_code}_{period}.{export_format}'
+        else:
+            filename = f'invoice_{safe_company_name}_{company_code}_{period}_{reports.REPORT_MODES[mode]}.{export_format}'
+        
+        def iter_rows():
+            """出力する行（集計はデータベースの GROUP BY で行い、集計結果の行だけを読み込む）"""
+            if mode == 'lines':
+                return timer.count(exports.iter_ledger(start, end, company))
+            return timer.count(reports.iter_report(mode, start, end, company))
+        
+        # CSV/JSON Lines はファイルに保存せずそのままストリーミング
+        if export_format in exports.TEXT_WRITERS:
+            if mode == 'lines':
+                content = exports.TEXT_WRITERS[export_format](iter_rows())
+            else:
+                content = reports.TEXT_WRITERS[export_format](mode, iter_rows())
+            response = StreamingHttpResponse(content, content_type=exports.EXPORT_FORMATS[export_format])
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            return response
+        
+        # 会社の請求書・明細が前回の出力から変わっていなければキャッシュを返す
+        # （キーは変更回数のバージョンで決まるため、明細を読み直さない）
+        render_cache = get_render_cache()
+        with timer.phase('cache'):
+            cache_key = make_key(
+                f'history:{mode}', ledger_version.get_version(company.pk),
+                {'company': company.pk, 'period': [year, month, months]},
+            )
+            save_path = render_cache.get(cache_key)
+        if save_path is None:
+            save_dir = Path(settings.INVOICE_OUTPUT_DIR)
+            save_path = save_dir / filename
+            
+            # 保存ディレクトリが存在しない場合は作成
+            save_dir.mkdir(exist_ok=True)
+            
+            # 保存（キャッシュのバージョンはプライマリのコミットで上がるため、
+            # 遅れているレプリカの内容を新しいバージョンで保存しないようプライマリから読む）
+            with timer.phase('render'), routers.primary_reads():
+                if mode == 'lines':
+                    exports.write_history_workbook(save_path, iter_rows(), period)
+                else:
+                    reports.write_report_workbook(save_path, mode, iter_rows(), period)
+            render_cache.put(cache_key, save_path)
+        else:
+            timer.outcome = 'cached'
         
         # ファイルをダウンロード
         file = open(save_path, 'rb')
         response = FileResponse(file, as_attachment=True, filename=filename)
-        messages.success(request, '請求書を作成しました。')
+        messages.success(request, '取引履歴を出力しました。')
         return response
         
     except Company.DoesNotExist:
         messages.error(request, '会社コードが見つかりません。')
         return redirect('invoices:create_invoice_view')
     except Exception as e:
+        timer.outcome = 'error'
         messages.error(request, f'エラーが発生しました: {str(e)}')
         return redirect('invoices:create_invoice_view')
 
 
 @login_required
 @require_http_methods(["POST"])
-def export_monthly_history(request):
-    """月ごとの取引履歴一覧をエクセルに出力"""
+@admission.admission_control('export_monthly_ledger')
+@routers.use_replica
+def export_monthly_ledger(request):
+    """全取引先の月ごとの取引履歴を1つのエクセルに出力（管理者以上）"""
+    if not request.user.is_admin():
+        messages.error(request, '管理画面へのアクセス権限がありません。')
+        return redirect('invoices:create_invoice_view')
+    
     try:
-        company_code = request.POST.get('company_code', '').upper()
         year = int(request.POST.get('year', datetime.now().year))
         month = int(request.POST.get('month', datetime.now().month))
         
-        company = Company.objects.get(company_code=company_code)
-        
-        # 該当月の請求書を取得
-        invoices = Invoice.objects.filter(
-            company=company,
-            created_at__year=year,
-            created_at__month=month
-        ).order_by('created_at')
-        
-        if not invoices.exists():
+        start, end = exports.month_range(year, month)
+        if not exports.has_ledger(start, end):
             messages.error(request, '該当する取引履歴が見つかりません。')
-            return redirect('invoices:create_invoice_view')
-        
-        # 新しいワークブックを作成
-        book = openpyxl.Workbook()
-        sheet = book.active
-        sheet.title = f"{year}年{month}月分"
-        
-        # ヘッダー行
-        headers = ['請求書番号', '作成日時', '請求内容', '個数', '単価', '金額']
-        for col, header in enumerate(headers, start=1):
-            cell = sheet.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-        
-        # データ行
-        row = 2
-        for invoice in invoices:
-            for detail in invoice.details.all():
-                sheet.cell(row=row, column=1, value=invoice.invoice_number)
-                sheet.cell(row=row, column=2, value=invoice.created_at.strftime('%Y-%m-%d %H:%M'))
-                sheet.cell(row=row, column=3, value=detail.item_name)
-                sheet.cell(row=row, column=4, value=detail.quantity)
-                sheet.cell(row=row, column=5, value=detail.unit_price)
-                sheet.cell(row=row, column=6, value=detail.amount)
-                row += 1
+            return redirect('invoices:admin_export_history')
         
-        # ファイル名を生成
-        safe_company_name = company.company_name.replace('/', '_').replace('\\', '_')
-        filename = f'invoice_{safe_company_name}_{company_code}_{year}年{month}月分.xlsx'
-        save_dir = BASE_DIR / 'generated_invoices'
+        filename = f'invoice_全取引先_{year}年{month}月分.xlsx'
+        save_dir = Path(settings.INVOICE_OUTPUT_DIR)
         save_path = save_dir / filename
-        
-        # 保存ディレクトリが存在しない場合は作成
         save_dir.mkdir(exist_ok=True)
         
-        # 保存
-        book.save(str(save_path))
+        render_cache = get_render_cache()
+        cache_key = make_key('ledger', ledger_version.get_version(), {'period': [year, month]})
+        cached_path = render_cache.get(cache_key)
+        if cached_path is None:
+            # 遅れているレプリカの内容を新しいバージョンで保存しないようプライマリから読む
+            with routers.primary_reads():
+                exports.write_monthly_ledger(save_path, year, month)
+            render_cache.put(cache_key, save_path)
+        else:
+            save_path = cached_path
         
-        # ファイルをダウンロード
         file = open(save_path, 'rb')
         response = FileResponse(file, as_attachment=True, filename=filename)
         messages.success(request, '取引履歴を出力しました。')
         return response
         
-    except Company.DoesNotExist:
-        messages.error(request, '会社コードが見つかりません。')
-        return redirect('invoices:create_invoice_view')
     except Exception as e:
         messages.error(request, f'エラーが発生しました: {str(e)}')
-        return redirect('invoices:create_invoice_view')
+        return redirect('invoices:admin_export_history')
@@ -0,0 +1,51 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import get_template
+
+# 起動直後のリクエストで使われるテンプレート
+WARMUP_TEMPLATES = [
+    'invoices/login.html',
+    'invoices/create_invoice.html',
+    'invoices/admin/dashboard.html',
+    'invoices/admin/create_invoice.html',
+    'invoices/admin/export_history.html',
+]
+
+
+def warm_up():
+    """ワーカーがリクエストを受ける前に重い初期化を済ませ、処理ごとの秒数を返す
+
+    - openpyxl の読み込みと請求書テンプレートのレイアウトのコンパイル（初回の請求書出力の分）
+    - テンプレートの読み込み（本番ではキャッシュローダーに保持される）
+    - データベース・キャッシュへの疎通確認（起動時に接続できない設定を検出する）
+
+    データベースの接続はスレッドごとのため、gthread のリクエスト処理スレッドは
+    ここで開いた接続を使わず、それぞれ最初のリクエストで接続する。
+    """
+    from . import rendering
+
+    timings = {}
+
+    started = time.perf_counter()
+    import openpyxl  # noqa: F401
+    from openpyxl.styles import Alignment, Font  # noqa: F401
+    if rendering.template_path().exists():
+        rendering.compiled_layout()
+    timings['openpyxl'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for name in WARMUP_TEMPLATES:
+        get_template(name)
+    timings['templates'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    timings['database'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cache.get('invoices:warmup')
+    timings['cache'] = time.perf_counter() - started
+    return timings